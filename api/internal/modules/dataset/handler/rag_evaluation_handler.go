@@ -5,6 +5,7 @@ import (
 	"fmt"
 	"strconv"
 	"strings"
+	"time"
 
 	"github.com/gin-gonic/gin"
 	datasetservice "github.com/zgiai/zgi/api/internal/modules/dataset/service"
@@ -52,6 +53,9 @@ type RAGEvaluationItemResponse struct {
 	RetrieverResources []datasetservice.KnowledgeRetrieverResource `json:"retriever_resources"`
 	Status             string                                      `json:"status"`
 	Error              string                                      `json:"error,omitempty"`
+	RetrievalMs        int64                                       `json:"retrieval_ms"`
+	GenerationMs       int64                                       `json:"generation_ms"`
+	Usage              *adapter.Usage                              `json:"usage,omitempty"`
 }
 
 func NewRAGEvaluationHandler(
@@ -201,6 +205,7 @@ func (h *RAGEvaluationHandler) evaluateOne(
 		Status:            datasetservice.KnowledgeRetrieveStatusSuccess,
 	}
 
+	retrievalStarted := time.Now()
 	retrievalResp, err := h.knowledgeRetrieval.Retrieve(ctx, datasetservice.KnowledgeRetrieveRequest{
 		Scope:           scope,
 		Query:           userInput,
@@ -209,6 +214,7 @@ func (h *RAGEvaluationHandler) evaluateOne(
 		RetrievalMode:   retrievalMode,
 		RetrievalConfig: ragEvaluationRetrievalConfig(scoreThreshold),
 	})
+	item.RetrievalMs = time.Since(retrievalStarted).Milliseconds()
 	if err != nil {
 		item.Status = "error"
 		item.Error = err.Error()
@@ -227,7 +233,10 @@ func (h *RAGEvaluationHandler) evaluateOne(
 		return item
 	}
 
-	answer, err := h.generateAnswer(ctx, scope.OrganizationID, model, datasetName, userInput, retrievalResp.Context)
+	generationStarted := time.Now()
+	answer, usage, err := h.generateAnswer(ctx, scope.OrganizationID, model, datasetName, userInput, retrievalResp.Context)
+	item.GenerationMs = time.Since(generationStarted).Milliseconds()
+	item.Usage = usage
 	if err != nil {
 		item.Status = "error"
 		item.Error = err.Error()
@@ -262,7 +271,7 @@ func (h *RAGEvaluationHandler) resolveModel(ctx context.Context, organizationID
 	return resolved.Model, nil
 }
 
-func (h *RAGEvaluationHandler) generateAnswer(ctx context.Context, organizationID string, model string, datasetName string, question string, contextText string) (string, error) {
+func (h *RAGEvaluationHandler) generateAnswer(ctx context.Context, organizationID string, model string, datasetName string, question string, contextText string) (string, *adapter.Usage, error) {
 	temperature := 0.0
 	maxTokens := defaultRAGEvaluationMaxToken
 	req := &adapter.ChatRequest{
@@ -283,16 +292,16 @@ func (h *RAGEvaluationHandler) generateAnswer(ctx context.Context, organizationI
 
 	resp, err := h.llmClient.Chat(ctx, organizationID, req)
 	if err != nil {
-		return "", fmt.Errorf("failed to generate answer: %w", err)
+		return "", nil, fmt.Errorf("failed to generate answer: %w", err)
 	}
 	if resp == nil || len(resp.Choices) == 0 {
-		return "", fmt.Errorf("LLM returned no choices")
+		return "", nil, fmt.Errorf("LLM returned no choices")
 	}
 	answer := strings.TrimSpace(messageContentToString(resp.Choices[0].Message.Content))
 	if answer == "" {
-		return "", fmt.Errorf("LLM returned empty answer")
+		return "", resp.Usage, fmt.Errorf("LLM returned empty answer")
 	}
-	return answer, nil
+	return answer, resp.Usage, nil
 }
 
 func normalizeRAGUserInputs(inputs []string) []string {
@@ -11,17 +11,13 @@ import statistics
 from pathlib import Path
 from typing import Any
 
+import offline_metrics
 import run_ragas_eval as shared
 
 
-METRICS = [
-    "faithfulness",
-    "answer_relevancy",
-    "context_precision",
-    "context_recall",
-    "answer_correctness",
-]
+METRICS = shared.RAGAS_METRICS
 COMPOSITE_METRIC = "composite_score"
+LATENCY_STAGES = ["retrieval", "generation", "other"]
 
 
 def main() -> int:
@@ -32,19 +28,30 @@ def main() -> int:
 
     dify_dataset_default, dify_result_default, _ = shared.output_paths_for_input(input_path, "dify")
     zgi_dataset_default, zgi_result_default, _ = shared.output_paths_for_input(input_path, "zgi")
+    candidate_metrics = METRICS
+    if args.offline:
+        candidate_metrics = offline_metrics.OFFLINE_METRICS
+        dify_result_default = offline_metrics.offline_output_paths(input_path, "dify")[0]
+        zgi_result_default = offline_metrics.offline_output_paths(input_path, "zgi")[0]
     dify_result_path = resolve_path(args.dify_results, dify_result_default)
     zgi_result_path = resolve_path(args.zgi_results, zgi_result_default)
 
     dify_rows = load_result_rows(dify_result_path, "dify")
     zgi_rows = load_result_rows(zgi_result_path, "zgi")
-    comparison_rows = build_comparison_rows(dify_rows, zgi_rows, args.tie_tolerance)
+    metrics = compared_metrics(dify_rows, zgi_rows, candidate_metrics)
+    if not metrics:
+        raise SystemExit("Dify and ZGI results do not share any metric")
+    skipped_metrics = [metric for metric in candidate_metrics if metric not in metrics]
+    if skipped_metrics:
+        print(f"comparing {', '.join(metrics)}; not scored on both platforms: {', '.join(skipped_metrics)}")
+    comparison_rows = build_comparison_rows(dify_rows, zgi_rows, args.tie_tolerance, metrics)
     paired_rows = [row for row in comparison_rows if row["pair_status"] == "paired"]
     if not paired_rows:
         raise SystemExit("Dify and ZGI results do not contain any comparable sample IDs")
 
     metric_summaries = {
         metric: summarize_metric(paired_rows, metric, args.tie_tolerance, args.bootstrap_samples)
-        for metric in [*METRICS, COMPOSITE_METRIC]
+        for metric in [*metrics, COMPOSITE_METRIC]
     }
 
     dify_dataset_path = resolve_optional_path(args.dify_dataset, dify_dataset_default)
@@ -55,7 +62,7 @@ def main() -> int:
     }
 
     shared.RESULT_DIR.mkdir(parents=True, exist_ok=True)
-    output_prefix = shared.RESULT_DIR / input_path.with_suffix("").name
+    output_prefix = shared.RESULT_DIR / (input_path.with_suffix("").name + (".offline" if args.offline else ""))
     csv_path = output_prefix.with_name(output_prefix.name + ".comparison.csv")
     json_path = output_prefix.with_name(output_prefix.name + ".comparison.json")
     markdown_path = output_prefix.with_name(output_prefix.name + ".comparison.md")
@@ -69,6 +76,7 @@ def main() -> int:
             "zgi_result_rows": len(zgi_rows),
             "paired_rows": len(paired_rows),
             "tie_tolerance": args.tie_tolerance,
+            "compared_metrics": metrics,
             "metrics": metric_summaries,
             "datasets": dataset_summaries,
         },
@@ -82,6 +90,8 @@ def main() -> int:
             metric_summaries=metric_summaries,
             dataset_summaries=dataset_summaries,
             tie_tolerance=args.tie_tolerance,
+            metrics=metrics,
+            candidate_metrics=candidate_metrics,
         ),
         encoding="utf-8",
     )
@@ -100,6 +110,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--zgi-dataset", default="", help="Optional ZGI dataset JSON path for operational statistics.")
     parser.add_argument("--tie-tolerance", type=float, default=0.01, help="Absolute score difference counted as a tie. Default: %(default)s")
     parser.add_argument("--bootstrap-samples", type=int, default=2000, help="Paired bootstrap samples for the mean-delta CI. Default: %(default)s")
+    parser.add_argument("--offline", action="store_true", help="Compare the judge-free results written by offline_metrics.py instead of the Ragas results.")
     args = parser.parse_args()
     if args.tie_tolerance < 0:
         raise SystemExit("--tie-tolerance must be >= 0")
@@ -150,11 +161,27 @@ def parse_sample_id(value: Any, fallback: int, platform: str) -> int:
     return sample_id
 
 
+def compared_metrics(
+    dify_rows: dict[int, dict[str, Any]],
+    zgi_rows: dict[int, dict[str, Any]],
+    candidate_metrics: list[str] | None = None,
+) -> list[str]:
+    candidate_metrics = candidate_metrics or METRICS
+
+    def scored(rows: dict[int, dict[str, Any]]) -> set[str]:
+        return {metric for row in rows.values() for metric in candidate_metrics if metric in row}
+
+    both = scored(dify_rows) & scored(zgi_rows)
+    return [metric for metric in candidate_metrics if metric in both]
+
+
 def build_comparison_rows(
     dify_rows: dict[int, dict[str, Any]],
     zgi_rows: dict[int, dict[str, Any]],
     tie_tolerance: float,
+    metrics: list[str] | None = None,
 ) -> list[dict[str, Any]]:
+    metrics = metrics or METRICS
     rows: list[dict[str, Any]] = []
     for sample_id in sorted(set(dify_rows) | set(zgi_rows)):
         dify = dify_rows.get(sample_id)
@@ -183,22 +210,22 @@ def build_comparison_rows(
             "dify_response": dify.get("response", "") if dify else "",
             "zgi_response": zgi.get("response", "") if zgi else "",
         }
-        dify_scores = metric_values(dify)
-        zgi_scores = metric_values(zgi)
-        for metric in METRICS:
+        dify_scores = metric_values(dify, metrics)
+        zgi_scores = metric_values(zgi, metrics)
+        for metric in metrics:
             add_score_columns(row, metric, dify_scores.get(metric), zgi_scores.get(metric), tie_tolerance)
-        dify_composite = composite_score(dify_scores)
-        zgi_composite = composite_score(zgi_scores)
+        dify_composite = composite_score(dify_scores, metrics)
+        zgi_composite = composite_score(zgi_scores, metrics)
         add_score_columns(row, COMPOSITE_METRIC, dify_composite, zgi_composite, tie_tolerance)
         rows.append(row)
     return rows
 
 
-def metric_values(row: dict[str, Any] | None) -> dict[str, float]:
+def metric_values(row: dict[str, Any] | None, metrics: list[str] | None = None) -> dict[str, float]:
     if not row:
         return {}
     values: dict[str, float] = {}
-    for metric in METRICS:
+    for metric in metrics or METRICS:
         value = number_or_none(row.get(metric))
         if value is not None:
             values[metric] = value
@@ -279,6 +306,7 @@ def summarize_dataset(path: Path | None) -> dict[str, Any]:
         return {"available": False}
     rows = shared.load_existing_dataset(path)
     latencies = [value for row in rows if (value := number_or_none(row.get("latency_seconds"))) is not None]
+    ttfts = [value for row in rows if (value := number_or_none(row.get("ttft_seconds"))) is not None]
     context_counts = [len(row.get("retrieved_contexts") or []) for row in rows]
     successful = [row for row in rows if row.get("response") and not row.get("error")]
     return {
@@ -292,9 +320,53 @@ def summarize_dataset(path: Path | None) -> dict[str, Any]:
         "mean_latency_seconds": statistics.fmean(latencies) if latencies else None,
         "p50_latency_seconds": percentile(latencies, 0.50),
         "p95_latency_seconds": percentile(latencies, 0.95),
+        "p50_ttft_seconds": percentile(ttfts, 0.50),
+        "p95_ttft_seconds": percentile(ttfts, 0.95),
+        "stages": summarize_latency_stages(successful),
+        "mean_total_tokens": mean_or_none(
+            [value for row in successful if (value := number_or_none((row.get("usage") or {}).get("total_tokens"))) is not None]
+        ),
     }
 
 
+def summarize_latency_stages(rows: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    values: dict[str, list[float]] = {stage: [] for stage in LATENCY_STAGES}
+    for row in rows:
+        for stage, seconds in stage_seconds(row).items():
+            values[stage].append(seconds)
+    return {
+        stage: {
+            "count": len(stage_values),
+            "mean_seconds": mean_or_none(stage_values),
+            "p50_seconds": percentile(stage_values, 0.50),
+            "p95_seconds": percentile(stage_values, 0.95),
+        }
+        for stage, stage_values in values.items()
+    }
+
+
+def stage_seconds(row: dict[str, Any]) -> dict[str, float]:
+    stages: dict[str, float] = {}
+    retrieval_ms = number_or_none(row.get("retrieval_ms"))
+    if retrieval_ms is not None:
+        stages["retrieval"] = retrieval_ms / 1000
+    generation_ms = number_or_none(row.get("generation_ms"))
+    usage = row.get("usage") if isinstance(row.get("usage"), dict) else {}
+    if generation_ms is not None:
+        stages["generation"] = generation_ms / 1000
+    elif (llm_latency := number_or_none(usage.get("latency"))) is not None:
+        # Dify reports the LLM call latency in seconds inside usage.
+        stages["generation"] = llm_latency
+    total = number_or_none(row.get("latency_seconds"))
+    if total is not None and stages:
+        stages["other"] = max(0.0, total - sum(stages.values()))
+    return stages
+
+
+def mean_or_none(values: list[float]) -> float | None:
+    return statistics.fmean(values) if values else None
+
+
 def percentile(values: list[float], quantile: float) -> float | None:
     if not values:
         return None
@@ -316,7 +388,11 @@ def render_markdown(
     metric_summaries: dict[str, dict[str, Any]],
     dataset_summaries: dict[str, dict[str, Any]],
     tie_tolerance: float,
+    metrics: list[str] | None = None,
+    candidate_metrics: list[str] | None = None,
 ) -> str:
+    metrics = metrics or METRICS
+    candidate_metrics = candidate_metrics or METRICS
     paired = [row for row in comparison_rows if row["pair_status"] == "paired"]
     missing_dify = sum(1 for row in comparison_rows if row["pair_status"] == "missing_dify")
     missing_zgi = sum(1 for row in comparison_rows if row["pair_status"] == "missing_zgi")
@@ -328,6 +404,11 @@ def render_markdown(
         f"- ZGI 结果：`{zgi_result_path}`",
         f"- 成功配对：{len(paired)}；缺少 Dify：{missing_dify}；缺少 ZGI：{missing_zgi}",
         f"- 差值方向：Dify - ZGI；绝对差值不超过 {tie_tolerance:.3f} 计为平局。",
+    ]
+    skipped_metrics = [metric for metric in candidate_metrics if metric not in metrics]
+    if skipped_metrics:
+        lines.append(f"- 未在两个平台都评测、不参与对比和综合分的指标：{', '.join(skipped_metrics)}")
+    lines += [
         "",
         "## 总体结论",
         "",
@@ -344,9 +425,13 @@ def render_markdown(
         "context_precision": "上下文精确率",
         "context_recall": "上下文召回率",
         "answer_correctness": "答案正确性",
-        COMPOSITE_METRIC: "综合分（五项平均）",
+        "token_f1": "词元 F1",
+        "rouge_l": "ROUGE-L",
+        "context_reference_coverage": "参考答案上下文覆盖率",
+        "context_hit_at_k": "上下文命中率@k",
+        COMPOSITE_METRIC: "综合分（五项平均）" if metrics == METRICS else f"综合分（{len(metrics)} 项平均）",
     }
-    for metric in [*METRICS, COMPOSITE_METRIC]:
+    for metric in [*metrics, COMPOSITE_METRIC]:
         summary = metric_summaries[metric]
         if not summary.get("paired"):
             lines.append(f"| {labels[metric]} | N/A | N/A | N/A | N/A | 0/0/0 | 0 |")
@@ -370,11 +455,20 @@ def render_markdown(
             if summary.get("mean_latency_seconds") is not None
             else "未记录逐题延迟"
         )
+        if summary.get("p50_ttft_seconds") is not None:
+            latency += (
+                f"，首 token P50/P95={format_optional(summary['p50_ttft_seconds'])}/"
+                f"{format_optional(summary['p95_ttft_seconds'])} 秒"
+            )
+        if summary.get("mean_total_tokens") is not None:
+            latency += f"，平均 {summary['mean_total_tokens']:.0f} tokens/题"
         lines.append(
             f"- {name}：{summary['successful']}/{summary['rows']} 成功，错误 {summary['errors']}，"
             f"空召回 {summary['empty_contexts']}，平均召回 {summary['mean_contexts']:.2f} 条，{latency}。"
         )
 
+    lines.extend(render_stage_rows(dataset_summaries))
+
     scored = [row for row in paired if row[f"{COMPOSITE_METRIC}_delta"] != ""]
     dify_top = sorted(
         [row for row in scored if float(row[f"{COMPOSITE_METRIC}_delta"]) > tie_tolerance],
@@ -393,6 +487,32 @@ def render_markdown(
     return "\n".join(lines)
 
 
+def render_stage_rows(dataset_summaries: dict[str, dict[str, Any]]) -> list[str]:
+    stage_labels = {"retrieval": "检索", "generation": "生成", "other": "其他（网络、排队等）"}
+    rows = []
+    for platform in ("dify", "zgi"):
+        stages = dataset_summaries[platform].get("stages") or {}
+        name = platform.upper() if platform == "zgi" else "Dify"
+        for stage in LATENCY_STAGES:
+            summary = stages.get(stage) or {}
+            if not summary.get("count"):
+                continue
+            rows.append(
+                f"| {name} | {stage_labels[stage]} | {format_optional(summary['mean_seconds'])} | "
+                f"{format_optional(summary['p50_seconds'])} | {format_optional(summary['p95_seconds'])} | {summary['count']} |"
+            )
+    if not rows:
+        return []
+    return [
+        "",
+        "## 分阶段耗时（秒）",
+        "",
+        "| 平台 | 阶段 | 平均 | P50 | P95 | 样本数 |",
+        "|---|---|---:|---:|---:|---:|",
+        *rows,
+    ]
+
+
 def render_top_rows(rows: list[dict[str, Any]]) -> list[str]:
     if not rows:
         return ["没有超过平局阈值的题目。"]
@@ -413,10 +533,11 @@ def number_or_none(value: Any) -> float | None:
     return number if math.isfinite(number) else None
 
 
-def composite_score(values: dict[str, float]) -> float | None:
-    if any(metric not in values for metric in METRICS):
+def composite_score(values: dict[str, float], metrics: list[str] | None = None) -> float | None:
+    metrics = metrics or METRICS
+    if any(metric not in values for metric in metrics):
         return None
-    return statistics.fmean(values[metric] for metric in METRICS)
+    return statistics.fmean(values[metric] for metric in metrics)
 
 
 def overall_conclusion(summary: dict[str, Any]) -> str:
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Per-metric context packing for Ragas judging: drop duplicate contexts and fit the rest into a token budget."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+
+DEFAULT_DUPLICATE_THRESHOLD = 0.9
+SHINGLE_SIZE = 5
+# CJK characters cost about one token each in the judge tokenizers; other text about one token per four characters.
+WIDE_CHARACTER = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class PackingConfig:
+    budgets: dict[str, int] = field(default_factory=dict)
+    default_budget: int = 0
+    duplicate_threshold: float = DEFAULT_DUPLICATE_THRESHOLD
+
+    def budget_for(self, metric_name: str) -> int:
+        return self.budgets.get(metric_name, self.default_budget)
+
+    def label(self, metric_names: list[str]) -> str:
+        # Stored on result rows, so resumed scoring rescores rows packed under different settings.
+        budgets = ",".join(f"{name}={self.budget_for(name)}" for name in metric_names)
+        return f"dedup={self.duplicate_threshold:g};{budgets}"
+
+    def metric_label(self, metric_name: str) -> str:
+        # Part of the metric's score cache key, so changing one budget rescores only that metric.
+        return f"dedup={self.duplicate_threshold:g};budget={self.budget_for(metric_name)}"
+
+
+@dataclass
+class PackedContexts:
+    original_tokens: int
+    duplicates_removed: int
+    by_metric: dict[str, list[str]]
+
+    def columns(self) -> dict[str, Any]:
+        columns: dict[str, Any] = {"context_tokens": self.original_tokens, "context_duplicates_removed": self.duplicates_removed}
+        for name, contexts in self.by_metric.items():
+            columns[f"{name}_contexts_sent"] = len(contexts)
+            columns[f"{name}_context_tokens"] = sum(estimate_tokens(context) for context in contexts)
+        return columns
+
+
+def parse_context_budgets(value: str, context_metrics: list[str]) -> PackingConfig:
+    """Parse ``N`` for every context metric, ``metric=N`` entries, or both, separated by commas."""
+    config = PackingConfig()
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, amount = entry.rpartition("=")
+        name = name.strip()
+        if name and name not in context_metrics:
+            raise ValueError(f"context token budgets apply only to {', '.join(context_metrics)}, got: {name}")
+        try:
+            budget = int(amount)
+        except ValueError as exc:
+            raise ValueError(f"context token budget must be an integer, got: {amount.strip()}") from exc
+        if budget < 0:
+            raise ValueError(f"context token budget must be >= 0, got: {budget}")
+        if name:
+            config.budgets[name] = budget
+        else:
+            config.default_budget = budget
+    return config
+
+
+def estimate_tokens(text: str) -> int:
+    wide = len(WIDE_CHARACTER.findall(text))
+    return wide + -(-(len(text) - wide) // 4)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    spent = 0.0
+    for position, character in enumerate(text):
+        spent += 1.0 if WIDE_CHARACTER.match(character) else 0.25
+        if spent > budget:
+            return text[:position]
+    return text
+
+
+def pack_contexts(contexts: list[str], metric_names: list[str], config: PackingConfig) -> PackedContexts:
+    unique = deduplicate_contexts(contexts, config.duplicate_threshold)
+    by_metric = {name: fit_to_budget(unique, config.budget_for(name)) for name in metric_names}
+    return PackedContexts(sum(estimate_tokens(context) for context in contexts), len(contexts) - len(unique), by_metric)
+
+
+def deduplicate_contexts(contexts: list[str], threshold: float) -> list[str]:
+    """Keep contexts in retrieval order, dropping any whose shingles are mostly contained in an earlier kept one."""
+    kept: list[str] = []
+    kept_shingles: list[set[str]] = []
+    for context in contexts:
+        shingles = text_shingles(context)
+        if any(len(shingles & earlier) >= threshold * len(shingles) for earlier in kept_shingles):
+            continue
+        kept.append(context)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def text_shingles(text: str) -> set[str]:
+    normalized = WHITESPACE.sub(" ", text).strip().lower()
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[start : start + SHINGLE_SIZE] for start in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def fit_to_budget(contexts: list[str], budget: int) -> list[str]:
+    """The highest-ranked contexts that fit ``budget``; the first one is truncated rather than dropped."""
+    if budget <= 0:
+        return list(contexts)
+    packed: list[str] = []
+    remaining = budget
+    for context in contexts:
+        tokens = estimate_tokens(context)
+        if tokens > remaining:
+            # Ranking matters to context_precision, so packing stops here instead of skipping ahead to shorter contexts.
+            if not packed:
+                packed.append(truncate_to_tokens(context, remaining))
+            break
+        packed.append(context)
+        remaining -= tokens
+    return packed
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Persistent float32 embedding store backed by a numpy memmap, with an in-process LRU in front."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; a single writer is assumed there.
+    fcntl = None
+
+
+DEFAULT_LRU_SIZE = 4096
+
+
+class EmbeddingStore:
+    """Append-only store for one embedding model.
+
+    ``vectors.f32`` holds one float32 row per text and line N of ``index.txt`` holds the SHA-256 of the
+    text in row N. Writers append vectors before their index lines under an exclusive file lock, so
+    readers in any process only ever see index entries whose vectors are complete and need no lock.
+    """
+
+    def __init__(self, directory: Path, model: str, lru_size: int = DEFAULT_LRU_SIZE) -> None:
+        model_key = hashlib.sha256(model.encode("utf-8")).hexdigest()[:16]
+        self.directory = directory / model_key
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.vectors_path = self.directory / "vectors.f32"
+        self.index_path = self.directory / "index.txt"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / "write.lock"
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, list[float]] = OrderedDict()
+        self._rows: dict[str, int] = {}
+        self._row_count = 0
+        self._index_offset = 0
+        self._dimension = 0
+        self._matrix: Any = None
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        with self._lock:
+            results: list[list[float] | None] = []
+            refreshed = False
+            for text in texts:
+                key = text_key(text)
+                vector = self._lru_get(key)
+                if vector is None:
+                    if key not in self._rows and not refreshed:
+                        self._refresh()
+                        refreshed = True
+                    row = self._rows.get(key)
+                    if row is not None:
+                        vector = self._matrix[row].tolist()
+                        self._lru_put(key, vector)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                results.append(vector)
+            return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        import numpy as np
+
+        if not texts:
+            return
+        with self._lock, self._write_lock():
+            self._refresh()
+            pending: dict[str, list[float]] = {}
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                self._lru_put(key, list(vector))
+                if key not in self._rows:
+                    pending[key] = vector
+            if not pending:
+                return
+            array = np.asarray(list(pending.values()), dtype=np.float32)
+            if not self._dimension:
+                self._dimension = int(array.shape[1])
+                self.meta_path.write_text(json.dumps({"model": self.model, "dimension": self._dimension}), encoding="utf-8")
+            if array.shape[1] != self._dimension:
+                raise SystemExit(
+                    f"embedding dimension changed for {self.model}: store has {self._dimension}, got {array.shape[1]}; "
+                    f"delete {self.directory} to rebuild it"
+                )
+            with self.vectors_path.open("ab") as handle:
+                # Drop vectors a crashed writer appended without their index lines.
+                handle.truncate(self._row_count * self._dimension * 4)
+                handle.write(array.tobytes())
+                handle.flush()
+            with self.index_path.open("a", encoding="ascii") as handle:
+                handle.write("".join(f"{key}\n" for key in pending))
+                handle.flush()
+            self._refresh()
+
+    def _refresh(self) -> None:
+        import numpy as np
+
+        if not self._dimension and self.meta_path.exists():
+            self._dimension = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dimension"])
+        try:
+            with self.index_path.open("rb") as handle:
+                handle.seek(self._index_offset)
+                data = handle.read()
+        except FileNotFoundError:
+            return
+        # A trailing line without a newline is still being written; pick it up on the next refresh.
+        complete = data[: data.rfind(b"\n") + 1]
+        if not complete:
+            return
+        for line in complete.decode("ascii").splitlines():
+            self._rows.setdefault(line, self._row_count)
+            self._row_count += 1
+        self._index_offset += len(complete)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._row_count, self._dimension))
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with self.lock_path.open("a") as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _lru_get(self, key: str) -> list[float] | None:
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+        return vector
+
+    def _lru_put(self, key: str, vector: list[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
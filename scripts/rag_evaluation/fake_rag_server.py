@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""Local stand-in for the ZGI, Dify and OpenAI-compatible APIs, with injected latency, errors and 429 bursts."""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 18080
+DEFAULT_EMBEDDING_DIMENSION = 64
+FAKE_ACCESS_TOKEN = "fake-access-token"
+# Share of a streamed answer's latency spent before the first chunk; the rest is spread across the chunks.
+FIRST_CHUNK_SHARE = 0.3
+ROUTES = {
+    "/login": "login",
+    "/rag-evaluation/batch": "zgi",
+    "/chat-messages": "dify",
+    "/chat/completions": "llm",
+    "/embeddings": "embedding",
+}
+
+
+class LatencyDistribution:
+    """Parsed from ``fixed:S``, ``uniform:LOW,HIGH``, ``exp:MEAN`` or ``lognormal:MEDIAN,SIGMA`` (seconds)."""
+
+    def __init__(self, spec: str) -> None:
+        kind, _, raw = spec.strip().partition(":")
+        try:
+            params = [float(value) for value in raw.split(",") if value.strip()]
+        except ValueError as exc:
+            raise ValueError(f"latency parameters must be numbers: {spec}") from exc
+        expected = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind] or any(value < 0 for value in params):
+            raise ValueError(f"latency must look like fixed:S, uniform:LOW,HIGH, exp:MEAN or lognormal:MEDIAN,SIGMA, got: {spec}")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "exp":
+            return rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+@dataclass
+class FakeServerConfig:
+    backend_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed:0.05"))
+    dify_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed:0.2"))
+    llm_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed:0.2"))
+    embedding_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed:0.02"))
+    error_rate: float = 0.0
+    throttle_every: int = 0
+    throttle_burst: int = 0
+    retry_after: float = 1.0
+    embedding_dimension: int = DEFAULT_EMBEDDING_DIMENSION
+    stream_chunks: int = 8
+    seed: int = 0
+
+
+class FakeRAGServer:
+    """Serves every fake API from one port; path prefixes such as /console/api or /v1 are ignored."""
+
+    def __init__(self, config: FakeServerConfig, host: str = DEFAULT_HOST, port: int = 0) -> None:
+        self.config = config
+        self.counts: dict[str, dict[str, int]] = {}
+        self._sequence: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-rag-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeRAGServer":
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {route: dict(statuses) for route, statuses in self.counts.items()}
+
+    def admit(self, route: str) -> tuple[int, random.Random]:
+        """Number this request within its route and decide whether it is throttled, failed or served."""
+        with self._lock:
+            index = self._sequence.get(route, 0)
+            self._sequence[route] = index + 1
+        # Seeding from (seed, route, index) keeps every run identical regardless of thread scheduling.
+        rng = random.Random(f"{self.config.seed}:{route}:{index}")
+        config = self.config
+        if route != "login" and config.throttle_every > 0 and index % (config.throttle_every + config.throttle_burst) >= config.throttle_every:
+            status = 429
+        elif route != "login" and rng.random() < config.error_rate:
+            status = 503
+        else:
+            status = 200
+        with self._lock:
+            statuses = self.counts.setdefault(route, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return status, rng
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/").endswith("/stats"):
+                    self.send_json(200, server.stats())
+                else:
+                    self.send_json(404, {"message": f"unknown path: {self.path}"})
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                route = route_for_path(self.path)
+                if route is None:
+                    self.send_json(404, {"message": f"unknown path: {self.path}"})
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except json.JSONDecodeError:
+                    self.send_json(400, {"message": "request body is not JSON"})
+                    return
+                status, rng = server.admit(route)
+                if status == 429:
+                    self.send_json(429, {"message": "rate limited"}, {"Retry-After": f"{server.config.retry_after:g}"})
+                    return
+                if status != 200:
+                    self.send_json(status, {"message": "injected failure"})
+                    return
+                if route == "dify" and payload.get("response_mode") == "streaming":
+                    self.send_events(dify_events(payload, server.config.dify_latency.sample(rng), server.config.stream_chunks))
+                elif route == "llm" and payload.get("stream"):
+                    self.send_events(chat_completion_chunks(payload, server.config.llm_latency.sample(rng), server.config.stream_chunks))
+                else:
+                    self.send_json(200, respond(route, payload, server.config, rng))
+
+            def send_json(self, status: int, data: Any, headers: dict[str, str] | None = None) -> None:
+                encoded = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def send_events(self, events: Iterator[tuple[float, Any]]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for delay, event in events:
+                    if delay > 0:
+                        time.sleep(delay)
+                    data = event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+def route_for_path(path: str) -> str | None:
+    path = path.split("?", 1)[0].rstrip("/")
+    for suffix, route in ROUTES.items():
+        if path.endswith(suffix):
+            return route
+    return None
+
+
+def respond(route: str, payload: dict[str, Any], config: FakeServerConfig, rng: random.Random) -> dict[str, Any]:
+    if route == "login":
+        return {"result": "success", "data": {"access_token": FAKE_ACCESS_TOKEN}}
+    if route == "zgi":
+        # The real backend answers a batch one question at a time, so its latency adds up per question.
+        questions = [str(question) for question in payload.get("user_inputs") or []]
+        latencies = [config.backend_latency.sample(rng) for _ in questions]
+        time.sleep(sum(latencies))
+        top_k = int(payload.get("top_k") or 3)
+        items = [zgi_item(question, latency, top_k) for question, latency in zip(questions, latencies)]
+        return {"result": "success", "data": {"data": items}}
+    if route == "dify":
+        latency = config.dify_latency.sample(rng)
+        time.sleep(latency)
+        return dify_answer(payload, latency)
+    if route == "llm":
+        time.sleep(config.llm_latency.sample(rng))
+        return chat_completion(payload)
+    time.sleep(config.embedding_latency.sample(rng))
+    return embeddings_response(payload, config.embedding_dimension)
+
+
+def fake_answer(question: str) -> str:
+    return f"According to the knowledge base, the answer to '{question}' is in section {stable_number(question, 100)}."
+
+
+def fake_contexts(question: str, count: int) -> list[str]:
+    return [f"Passage {stable_number(question, 1000) + index} about: {question}" for index in range(max(0, count))]
+
+
+def zgi_item(question: str, latency: float, top_k: int) -> dict[str, Any]:
+    contexts = fake_contexts(question, min(top_k, 3))
+    answer = fake_answer(question)
+    return {
+        "user_input": question,
+        "response": answer,
+        "retrieved_contexts": contexts,
+        "retriever_resources": [{"content": context, "score": round(0.9 - 0.1 * index, 2)} for index, context in enumerate(contexts)],
+        "status": "success",
+        "error": "",
+        "retrieval_ms": round(latency * 300, 3),
+        "generation_ms": round(latency * 700, 3),
+        "usage": usage_for(question, answer),
+    }
+
+
+def dify_answer(payload: dict[str, Any], latency: float) -> dict[str, Any]:
+    question = str(payload.get("query") or "")
+    answer = fake_answer(question)
+    return {
+        "event": "message",
+        "message_id": f"message-{stable_number(question, 10**8)}",
+        "conversation_id": f"conversation-{stable_number(question, 10**8)}",
+        "answer": answer,
+        "metadata": dify_metadata(question, answer, latency),
+    }
+
+
+def dify_metadata(question: str, answer: str, latency: float) -> dict[str, Any]:
+    resources = [{"content": context, "score": 0.8} for context in fake_contexts(question, 2)]
+    return {"retriever_resources": resources, "usage": {**usage_for(question, answer), "latency": latency}}
+
+
+def dify_events(payload: dict[str, Any], latency: float, chunks: int) -> Iterator[tuple[float, dict[str, Any]]]:
+    data = dify_answer(payload, latency)
+    ids = {"message_id": data["message_id"], "conversation_id": data["conversation_id"]}
+    for delay, text in split_stream(data["answer"], latency, chunks):
+        yield delay, {"event": "message", "answer": text, **ids}
+    yield 0.0, {"event": "message_end", "metadata": data["metadata"], **ids}
+
+
+def chat_completion(payload: dict[str, Any]) -> dict[str, Any]:
+    prompt = prompt_text(payload)
+    message: dict[str, Any] = {"role": "assistant", "content": fake_answer(prompt[-200:])}
+    finish_reason = "stop"
+    tools = payload.get("tools") or []
+    schema = response_schema(payload)
+    if tools:
+        # Structured-output clients (instructor in TOOLS mode) read the arguments of the forced tool call.
+        function = tools[0].get("function", {})
+        arguments = json.dumps(example_from_schema(function.get("parameters") or {}, prompt), ensure_ascii=False)
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": f"call_{stable_number(prompt, 10**8)}", "type": "function", "function": {"name": function.get("name", ""), "arguments": arguments}}],
+        }
+        finish_reason = "tool_calls"
+    elif schema is not None:
+        message["content"] = json.dumps(example_from_schema(schema, prompt), ensure_ascii=False)
+    return {
+        "id": f"chatcmpl-{stable_number(prompt, 10**8)}",
+        "object": "chat.completion",
+        "created": 0,
+        "model": str(payload.get("model") or "fake-judge"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": usage_for(prompt, json.dumps(message, ensure_ascii=False)),
+    }
+
+
+def chat_completion_chunks(payload: dict[str, Any], latency: float, chunks: int) -> Iterator[tuple[float, Any]]:
+    prompt = prompt_text(payload)
+    answer = fake_answer(prompt[-200:])
+    base = {"id": f"chatcmpl-{stable_number(prompt, 10**8)}", "object": "chat.completion.chunk", "created": 0, "model": str(payload.get("model") or "fake-judge")}
+    for delay, text in split_stream(answer, latency, chunks):
+        yield delay, {**base, "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+    yield 0.0, {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if (payload.get("stream_options") or {}).get("include_usage"):
+        yield 0.0, {**base, "choices": [], "usage": usage_for(prompt, answer)}
+    yield 0.0, "[DONE]"
+
+
+def embeddings_response(payload: dict[str, Any], dimension: int) -> dict[str, Any]:
+    texts = payload.get("input")
+    texts = [texts] if isinstance(texts, str) else [str(text) for text in texts or []]
+    tokens = sum(estimate_tokens(text) for text in texts)
+    return {
+        "object": "list",
+        "model": str(payload.get("model") or "fake-embedding"),
+        "data": [{"object": "embedding", "index": index, "embedding": fake_embedding(text, dimension)} for index, text in enumerate(texts)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def fake_embedding(text: str, dimension: int) -> list[float]:
+    # A unit vector derived from the text hash: identical texts match exactly, different texts are nearly orthogonal.
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimension)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def example_from_schema(schema: dict[str, Any], seed_text: str, definitions: dict[str, Any] | None = None) -> Any:
+    definitions = definitions if definitions is not None else {**schema.get("definitions", {}), **schema.get("$defs", {})}
+    if "$ref" in schema:
+        return example_from_schema(definitions.get(schema["$ref"].rsplit("/", 1)[-1], {}), seed_text, definitions)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if schema.get(key):
+            return example_from_schema(schema[key][0], seed_text, definitions)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((item for item in kind if item != "null"), "null")
+    if kind == "object" or "properties" in schema:
+        return {name: example_from_schema(value, seed_text, definitions) for name, value in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [example_from_schema(schema.get("items") or {}, seed_text, definitions)]
+    if kind == "integer":
+        return stable_number(seed_text, 2)
+    if kind == "number":
+        return stable_number(seed_text, 2) * 1.0
+    if kind == "boolean":
+        return bool(stable_number(seed_text, 2))
+    if kind == "null":
+        return None
+    return fake_answer(seed_text[-80:])
+
+
+def response_schema(payload: dict[str, Any]) -> dict[str, Any] | None:
+    response_format = payload.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return (response_format.get("json_schema") or {}).get("schema") or {}
+    if response_format.get("type") == "json_object":
+        return {}
+    return None
+
+
+def prompt_text(payload: dict[str, Any]) -> str:
+    parts: list[str] = []
+    for message in payload.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list):
+            parts.extend(str(part.get("text") or "") for part in content if isinstance(part, dict))
+        elif content:
+            parts.append(str(content))
+    return "\n".join(parts)
+
+
+def split_stream(text: str, latency: float, chunks: int) -> list[tuple[float, str]]:
+    words = text.split(" ")
+    chunks = max(1, min(chunks, len(words)))
+    size = math.ceil(len(words) / chunks)
+    pieces = [" ".join(words[start : start + size]) + (" " if start + size < len(words) else "") for start in range(0, len(words), size)]
+    gap = latency * (1 - FIRST_CHUNK_SHARE) / len(pieces)
+    return [(latency * FIRST_CHUNK_SHARE if index == 0 else gap, piece) for index, piece in enumerate(pieces)]
+
+
+def usage_for(prompt: str, completion: str) -> dict[str, int]:
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(completion)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def stable_number(text: str, modulo: int) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") % modulo
+
+
+def main() -> int:
+    args = parse_args()
+    server = FakeRAGServer(build_config(args), host=args.host, port=args.port)
+    print(
+        f"fake RAG server listening on {server.url}\n"
+        f"  ZGI_BASE_URL={server.url}/console/api (any email/password logs in)\n"
+        f"  DIFY_BASE_URL={server.url}/v1 (any API key)\n"
+        f"  RAGAS_BASE_URL={server.url}/v1 (any API key, any model)\n"
+        f"  request counts: GET {server.url}/stats",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats(), indent=2), flush=True)
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve deterministic fake ZGI, Dify and OpenAI-compatible APIs for offline benchmarks.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Default: %(default)s")
+    parser.add_argument("--backend-latency", default="fixed:0.05", help="Per-question latency of /rag-evaluation/batch. Default: %(default)s")
+    parser.add_argument("--dify-latency", default="fixed:0.2", help="Latency of /chat-messages. Default: %(default)s")
+    parser.add_argument("--llm-latency", default="fixed:0.2", help="Latency of /chat/completions. Default: %(default)s")
+    parser.add_argument("--embedding-latency", default="fixed:0.02", help="Latency of /embeddings. Default: %(default)s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503. Default: %(default)s")
+    parser.add_argument("--throttle-every", type=int, default=0, help="After this many requests per API, answer a burst of HTTP 429s. 0 disables throttling.")
+    parser.add_argument("--throttle-burst", type=int, default=5, help="Length of each HTTP 429 burst. Default: %(default)s")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with HTTP 429. Default: %(default)s")
+    parser.add_argument("--embedding-dimension", type=int, default=DEFAULT_EMBEDDING_DIMENSION, help="Default: %(default)s")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="Chunks per streamed answer. Default: %(default)s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sampled latencies and injected errors. Default: %(default)s")
+    args = parser.parse_args()
+    if not 0 <= args.error_rate <= 1:
+        raise SystemExit("--error-rate must be between 0 and 1")
+    if args.throttle_every < 0 or args.throttle_burst < 0 or args.retry_after < 0:
+        raise SystemExit("--throttle-every, --throttle-burst and --retry-after must be >= 0")
+    if args.embedding_dimension < 1 or args.stream_chunks < 1:
+        raise SystemExit("--embedding-dimension and --stream-chunks must be >= 1")
+    return args
+
+
+def build_config(args: argparse.Namespace) -> FakeServerConfig:
+    try:
+        latencies = {
+            name: LatencyDistribution(getattr(args, name))
+            for name in ["backend_latency", "dify_latency", "llm_latency", "embedding_latency"]
+        }
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    return FakeServerConfig(
+        **latencies,
+        error_rate=args.error_rate,
+        throttle_every=args.throttle_every,
+        throttle_burst=args.throttle_burst,
+        retry_after=args.retry_after,
+        embedding_dimension=args.embedding_dimension,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
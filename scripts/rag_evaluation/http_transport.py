@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Shared keep-alive HTTP transport for the RAG evaluation scripts."""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import gzip
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_MAX_IDLE_PER_HOST = 16
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+RETRYABLE_REUSE_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+MAX_BACKOFF_SECONDS = 30.0
+THROTTLE_RECOVERY_SECONDS = 10.0
+T = TypeVar("T")
+
+
+class HTTPStatusError(RuntimeError):
+    def __init__(self, status: int, body: str, headers: dict[str, str] | None = None) -> None:
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class HTTPTransport:
+    def __init__(self, max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST, compress_requests: bool = False) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.compress_requests = compress_requests
+        self._idle: dict[tuple[str, str, int, str], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def post_json(
+        self,
+        url: str,
+        payload: Any,
+        headers: dict[str, str] | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> Any:
+        _, _, body = self.request("POST", url, json_body(payload), json_headers(headers), timeout)
+        return json.loads(body.decode("utf-8"))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> tuple[int, dict[str, str], bytes]:
+        headers = {"Accept-Encoding": "gzip", **(headers or {})}
+        with self._exchange(method, url, body, headers, timeout) as (response, release):
+            try:
+                data = response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                # A body cut short by a timeout or reset fails the same way as a failed connect.
+                raise urllib.error.URLError(exc) from exc
+            release()
+            response_headers = {key.lower(): value for key, value in response.getheaders()}
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        if response.status >= 400:
+            raise HTTPStatusError(response.status, data.decode("utf-8", errors="replace"), response_headers)
+        return response.status, response_headers, data
+
+    @contextmanager
+    def stream(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> Iterator[http.client.HTTPResponse]:
+        headers = {"Accept-Encoding": "identity", **(headers or {})}
+        with self._exchange(method, url, body, headers, timeout) as (response, release):
+            if response.status >= 400:
+                detail = response.read().decode("utf-8", errors="replace")
+                release()
+                raise HTTPStatusError(response.status, detail, {key.lower(): value for key, value in response.getheaders()})
+            try:
+                yield response
+            except (OSError, http.client.HTTPException) as exc:
+                # Callers read the stream inside this block; mid-stream failures surface as URLError too.
+                raise urllib.error.URLError(exc) from exc
+            if response.isclosed() or response.length == 0:
+                release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    @contextmanager
+    def _exchange(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None,
+        headers: dict[str, str],
+        timeout: float,
+    ) -> Iterator[tuple[http.client.HTTPResponse, Any]]:
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in {"http", "https"} or not parsed.hostname:
+            raise urllib.error.URLError(f"unsupported URL: {url}")
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        proxy = proxy_for_url(url)
+        key = (parsed.scheme, parsed.hostname, port, proxy)
+        target = urllib.parse.urlunsplit(("", "", parsed.path or "/", parsed.query, ""))
+        if proxy and parsed.scheme == "http":
+            target = url
+        headers = {"Connection": "keep-alive", **headers}
+        if body is not None and self.compress_requests:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        response: http.client.HTTPResponse | None = None
+        conn: http.client.HTTPConnection | None = None
+        for attempt in range(2):
+            conn, reused = self._checkout(key, timeout)
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                break
+            except RETRYABLE_REUSE_ERRORS as exc:
+                conn.close()
+                # The server may close an idle keep-alive connection just before reuse; retry once on a fresh one.
+                if reused and attempt == 0:
+                    continue
+                raise urllib.error.URLError(exc) from exc
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                raise urllib.error.URLError(exc) from exc
+        assert response is not None and conn is not None
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            # Closing the fully read response only drops its file object; the socket stays open for reuse.
+            response.close()
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+
+        try:
+            yield response, release
+        finally:
+            if not released:
+                # A partially consumed response cannot be reused.
+                released = True
+                conn.close()
+
+    def _checkout(self, key: tuple[str, str, int, str], timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        return new_connection(key, timeout), False
+
+    def _checkin(self, key: tuple[str, str, int, str], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class RateLimiter:
+    """Token bucket plus an AIMD cap on in-flight requests, shared by threads and event loops."""
+
+    def __init__(self, requests_per_second: float = 0.0, max_concurrency: int = 0, min_concurrency: int = 1) -> None:
+        self.requests_per_second = requests_per_second
+        self.burst = max(1.0, requests_per_second)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency) if max_concurrency > 0 else min_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.throttled = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_throttle = 0.0
+        self._successes_since_change = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        while not self._try_enter():
+            time.sleep(0.01)
+
+    async def acquire_async(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while not self._try_enter():
+            await asyncio.sleep(0.01)
+
+    def release(self, status: int | None = None, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if status == 429:
+                self.throttled += 1
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                # Halve at most once per burst of 429s so a single overload does not collapse the limit to the floor.
+                if self.max_concurrency > 0 and now - self._last_throttle > 1.0:
+                    self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self._last_throttle = now
+                self._successes_since_change = 0
+                return
+            if self.max_concurrency <= 0 or self.concurrency >= self.max_concurrency:
+                return
+            if now - self._last_throttle < THROTTLE_RECOVERY_SECONDS:
+                return
+            self._successes_since_change += 1
+            if self._successes_since_change >= self.concurrency:
+                self.concurrency += 1
+                self._successes_since_change = 0
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._blocked_until - now)
+            if self.requests_per_second <= 0:
+                return delay
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.requests_per_second)
+            self._refilled_at = now
+            # Reserve the token now, even if the bucket goes negative, so waiting callers are served in order.
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay = max(delay, -self._tokens / self.requests_per_second)
+            return delay
+
+    def _try_enter(self) -> bool:
+        with self._lock:
+            if self.max_concurrency > 0 and self.in_flight >= self.concurrency:
+                return False
+            self.in_flight += 1
+            return True
+
+
+def call_with_retries(
+    send: Callable[[], T],
+    max_retries: int,
+    limiter: RateLimiter | None = None,
+    label: str = "request",
+    retry_on: Callable[[BaseException], bool] | None = None,
+) -> T:
+    retry_on = retry_on or is_transient_error
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        status: int | None = None
+        retry_after: float | None = None
+        try:
+            result = send()
+            status = 200
+            return result
+        except (HTTPStatusError, urllib.error.URLError) as exc:
+            if isinstance(exc, HTTPStatusError):
+                status = exc.status
+                retry_after = retry_after_seconds(exc.headers)
+            if not retry_on(exc) or attempt >= max_retries:
+                raise
+        finally:
+            if limiter is not None:
+                limiter.release(status, retry_after)
+        delay = backoff_delay(attempt, retry_after)
+        print(f"{label} failed transiently; retrying in {delay:.1f}s ({attempt + 1}/{max_retries})", flush=True)
+        time.sleep(delay)
+    raise RuntimeError("unreachable retry state")
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    if isinstance(exc, HTTPStatusError):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, urllib.error.URLError)
+
+
+def retry_after_seconds(headers: Any) -> float | None:
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    if retry_after is not None:
+        return retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.1))
+    return random.uniform(0.5, 1.0) * min(2**attempt, MAX_BACKOFF_SECONDS)
+
+
+def new_connection(key: tuple[str, str, int, str], timeout: float) -> http.client.HTTPConnection:
+    scheme, host, port, proxy = key
+    connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    if not proxy:
+        return connection_class(host, port, timeout=timeout)
+    parsed_proxy = urllib.parse.urlsplit(proxy)
+    proxy_port = parsed_proxy.port or (443 if parsed_proxy.scheme == "https" else 80)
+    if scheme == "http":
+        return http.client.HTTPConnection(parsed_proxy.hostname, proxy_port, timeout=timeout)
+    conn = http.client.HTTPSConnection(parsed_proxy.hostname, proxy_port, timeout=timeout)
+    conn.set_tunnel(host, port)
+    return conn
+
+
+def proxy_for_url(url: str) -> str:
+    if is_local_url(url):
+        return ""
+    parsed = urllib.parse.urlsplit(url)
+    proxy = urllib.request.getproxies().get(parsed.scheme, "")
+    if not proxy or urllib.request.proxy_bypass(parsed.hostname or ""):
+        return ""
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def is_local_url(url: str) -> bool:
+    hostname = urllib.parse.urlparse(url).hostname or ""
+    return hostname in LOCAL_HOSTS
+
+
+def json_body(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def json_headers(headers: dict[str, str] | None = None, token: str = "") -> dict[str, str]:
+    merged = {"Content-Type": "application/json", **(headers or {})}
+    if token:
+        merged["Authorization"] = f"Bearer {token}"
+    return merged
+
+
+def env_flag(key: str) -> bool:
+    return (os.getenv(key) or "").strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+TRANSPORT = HTTPTransport(compress_requests=env_flag("RAG_EVAL_GZIP_REQUESTS"))
+
+
+def post_json(url: str, payload: Any, token: str = "", timeout: float = DEFAULT_TIMEOUT) -> Any:
+    return TRANSPORT.post_json(url, payload, headers=json_headers(token=token), timeout=timeout)
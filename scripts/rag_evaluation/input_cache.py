@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""JSONL cache of parsed QA pairs, keyed by the input file's path, size, mtime and content hash."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+
+CACHE_SCHEMA_VERSION = 1
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def file_fingerprint(path: Path, content_hash: str = "") -> dict[str, Any]:
+    """Stat fields plus ``content_hash``; an empty hash is filled in by ``store`` once the parse is done."""
+    stat = path.stat()
+    return {
+        "schema": CACHE_SCHEMA_VERSION,
+        "path": str(path.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": content_hash,
+    }
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_header(cache_path: Path) -> dict[str, Any] | None:
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    return header if isinstance(header, dict) and header.get("schema") == CACHE_SCHEMA_VERSION else None
+
+
+def matches_by_stat(header: dict[str, Any] | None, input_path: Path) -> bool:
+    if not header:
+        return False
+    stat = input_path.stat()
+    return header.get("path") == str(input_path.resolve()) and header.get("size") == stat.st_size and header.get("mtime_ns") == stat.st_mtime_ns
+
+
+def cache_status(cache_path: Path, input_path: Path) -> str:
+    """A short label for input listings; only compares stat fields, so it never reads the input file."""
+    header = read_header(cache_path)
+    if not matches_by_stat(header, input_path):
+        return ""
+    return "cached" if header["complete"] else f"cached: first {header['items']} pairs"
+
+
+def load(cache_path: Path, input_path: Path, limit: int) -> tuple[list[tuple[str, str]] | None, dict[str, Any]]:
+    """Cached pairs, or None on a miss, plus the input's fingerprint for storing a fresh parse."""
+    header = read_header(cache_path)
+    if matches_by_stat(header, input_path):
+        fingerprint = {key: header[key] for key in ("schema", "path", "size", "mtime_ns", "sha256")}
+    else:
+        fingerprint = file_fingerprint(input_path)
+        if not header or any(header.get(key) != fingerprint[key] for key in ("path", "size")):
+            return None, fingerprint
+        # Only a touched file of the same size is hashed up front; its hash decides whether the cache still applies.
+        fingerprint["sha256"] = file_sha256(input_path)
+        if header.get("sha256") != fingerprint["sha256"]:
+            return None, fingerprint
+        # Recording the new mtime lets the next run and the input listing skip the hash.
+        refresh_header(cache_path, {**header, **fingerprint})
+    if not header["complete"] and (limit <= 0 or limit > header["items"]):
+        return None, fingerprint
+    with cache_path.open("r", encoding="utf-8") as f:
+        lines = islice(f, 1, 1 + limit if limit > 0 else None)
+        return [tuple(json.loads(line)) for line in lines], fingerprint
+
+
+def refresh_header(cache_path: Path, header: dict[str, Any]) -> None:
+    with cache_path.open("r", encoding="utf-8") as f:
+        f.readline()
+        body = f.read()
+    write_atomically(cache_path, json.dumps(header, ensure_ascii=False) + "\n" + body)
+
+
+def store(cache_path: Path, fingerprint: dict[str, Any], pairs: list[tuple[str, str]], complete: bool) -> None:
+    if not fingerprint.get("sha256"):
+        input_path = Path(fingerprint["path"])
+        content_hash = file_sha256(input_path)
+        # A file rewritten while it was parsed may not match the pairs, so it is not cached.
+        if file_fingerprint(input_path, content_hash) != {**fingerprint, "sha256": content_hash}:
+            return
+        fingerprint = {**fingerprint, "sha256": content_hash}
+    lines = [json.dumps({**fingerprint, "items": len(pairs), "complete": complete}, ensure_ascii=False)]
+    lines.extend(json.dumps(pair, ensure_ascii=False) for pair in pairs)
+    write_atomically(cache_path, "\n".join(lines) + "\n")
+
+
+def write_atomically(cache_path: Path, text: str) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    temporary.write_text(text, encoding="utf-8")
+    # Concurrent Dify and ZGI runs may both write; the rename keeps readers from seeing a half-written file.
+    os.replace(temporary, cache_path)
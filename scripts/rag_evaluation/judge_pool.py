@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Weighted pool of OpenAI-compatible judge endpoints serving the same models, with cool-down for failing ones."""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import http_transport
+
+
+DEFAULT_COOLDOWN_SECONDS = 30.0
+FAILURES_BEFORE_COOLDOWN = 3
+ERROR_RATE_DECAY = 0.2
+# A recovering endpoint keeps a small share of traffic so its error rate can come back down.
+MIN_HEALTH = 0.05
+
+
+@dataclass
+class JudgeEndpoint:
+    base_url: str
+    api_key: str
+    weight: float = 1.0
+    calls: int = 0
+    errors: int = 0
+    cooldowns: int = 0
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    limiter: http_transport.RateLimiter | None = field(default=None, repr=False)
+
+    @property
+    def label(self) -> str:
+        return f"{self.base_url} (key ...{self.api_key[-4:]})"
+
+
+class EndpointPool:
+    """Picks an endpoint per request by weight scaled by recent health; skips endpoints that are cooling down."""
+
+    def __init__(
+        self,
+        endpoints: list[JudgeEndpoint],
+        requests_per_second: float = 0.0,
+        max_concurrency: int = 0,
+        cooldown_seconds: float = DEFAULT_COOLDOWN_SECONDS,
+        rng: random.Random | None = None,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("at least one judge endpoint is required")
+        self.endpoints = endpoints
+        self.cooldown_seconds = cooldown_seconds
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        for endpoint in endpoints:
+            # Each key has its own provider quota, so 429s and Retry-After on one endpoint never pause the others.
+            endpoint.limiter = http_transport.RateLimiter(requests_per_second, max_concurrency=max_concurrency)
+
+    @property
+    def throttled(self) -> int:
+        return sum(endpoint.limiter.throttled for endpoint in self.endpoints)
+
+    def choose(self) -> JudgeEndpoint:
+        now = time.monotonic()
+        with self._lock:
+            available = [endpoint for endpoint in self.endpoints if endpoint.cooldown_until <= now]
+            if not available:
+                # Every endpoint is cooling down; the one that recovers first is the best remaining bet.
+                return min(self.endpoints, key=lambda endpoint: endpoint.cooldown_until)
+            weights = [endpoint.weight * max(MIN_HEALTH, 1.0 - endpoint.error_rate) for endpoint in available]
+            return self._rng.choices(available, weights=weights)[0]
+
+    def record(self, endpoint: JudgeEndpoint, ok: bool) -> None:
+        with self._lock:
+            endpoint.calls += 1
+            endpoint.error_rate += ERROR_RATE_DECAY * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= FAILURES_BEFORE_COOLDOWN and len(self.endpoints) > 1:
+                endpoint.cooldown_until = time.monotonic() + self.cooldown_seconds
+                endpoint.consecutive_failures = 0
+                endpoint.cooldowns += 1
+                print(f"judge endpoint {endpoint.label} is failing; cooling down for {self.cooldown_seconds:.0f}s", flush=True)
+
+    def stats(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "base_url": endpoint.base_url,
+                    "key_suffix": endpoint.api_key[-4:],
+                    "weight": endpoint.weight,
+                    "calls": endpoint.calls,
+                    "errors": endpoint.errors,
+                    "cooldowns": endpoint.cooldowns,
+                    "throttled": endpoint.limiter.throttled,
+                }
+                for endpoint in self.endpoints
+            ]
+
+
+def parse_endpoints(value: str, default_base_url: str = "") -> list[JudgeEndpoint]:
+    """Parse ``base_url|api_key[|weight]`` entries separated by commas; an empty base_url means the default."""
+    endpoints: list[JudgeEndpoint] = []
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        parts = [part.strip() for part in entry.split("|")]
+        if len(parts) not in {2, 3} or not parts[1]:
+            raise ValueError(f"judge endpoint must look like base_url|api_key[|weight], got: {entry.strip()}")
+        try:
+            weight = float(parts[2]) if len(parts) == 3 else 1.0
+        except ValueError as exc:
+            raise ValueError(f"judge endpoint weight must be a number, got: {parts[2]}") from exc
+        if weight <= 0:
+            raise ValueError(f"judge endpoint weight must be > 0, got: {parts[2]}")
+        endpoints.append(JudgeEndpoint((parts[0] or default_base_url).rstrip("/"), parts[1], weight))
+    return endpoints
+
+
+def is_endpoint_failure(status: int | None) -> bool:
+    return status is None or status == 429 or status >= 500
+
+
+def pooled_httpx_transport(pool: EndpointPool, client_base_url: str, is_async: bool, limits: Any = None) -> Any:
+    """An httpx transport that sends each request to an endpoint picked from ``pool``.
+
+    The OpenAI client is built for ``client_base_url``; that prefix is swapped for the chosen endpoint's base URL
+    and the bearer token for its key, so one client and one ``llm_factory`` LLM serve every endpoint.
+    """
+    import httpx
+
+    prefix = client_base_url.rstrip("/")
+    # httpx ignores HTTP(S)_PROXY once a custom transport is given, so each endpoint gets the proxy the environment names for it.
+    proxies = {endpoint.base_url: http_transport.proxy_for_url(endpoint.base_url) for endpoint in pool.endpoints}
+    options = {"limits": limits} if limits is not None else {}
+
+    def inner_transports(transport_class: Any) -> dict[str, Any]:
+        return {proxy: transport_class(proxy=httpx.Proxy(proxy) if proxy else None, **options) for proxy in set(proxies.values())}
+
+    def route(request: Any, endpoint: JudgeEndpoint) -> Any:
+        url = str(request.url)
+        if url.startswith(prefix):
+            url = endpoint.base_url + url[len(prefix) :]
+        headers = [(key, value) for key, value in request.headers.raw if key.lower() not in {b"host", b"authorization"}]
+        headers.append((b"Authorization", f"Bearer {endpoint.api_key}".encode("ascii")))
+        return httpx.Request(request.method, url, headers=headers, stream=request.stream, extensions=request.extensions)
+
+    def observe(response: Any) -> tuple[int, float | None]:
+        return response.status_code, http_transport.retry_after_seconds(response.headers)
+
+    if is_async:
+
+        class AsyncPooledTransport(httpx.AsyncBaseTransport):
+            def __init__(self) -> None:
+                self.inner = inner_transports(httpx.AsyncHTTPTransport)
+
+            async def handle_async_request(self, request: Any) -> Any:
+                endpoint = pool.choose()
+                await endpoint.limiter.acquire_async()
+                status, retry_after = None, None
+                try:
+                    response = await self.inner[proxies[endpoint.base_url]].handle_async_request(route(request, endpoint))
+                    status, retry_after = observe(response)
+                    return response
+                finally:
+                    endpoint.limiter.release(status, retry_after)
+                    pool.record(endpoint, not is_endpoint_failure(status))
+
+            async def aclose(self) -> None:
+                for inner in self.inner.values():
+                    await inner.aclose()
+
+        return AsyncPooledTransport()
+
+    class PooledTransport(httpx.BaseTransport):
+        def __init__(self) -> None:
+            self.inner = inner_transports(httpx.HTTPTransport)
+
+        def handle_request(self, request: Any) -> Any:
+            endpoint = pool.choose()
+            endpoint.limiter.acquire()
+            status, retry_after = None, None
+            try:
+                response = self.inner[proxies[endpoint.base_url]].handle_request(route(request, endpoint))
+                status, retry_after = observe(response)
+                return response
+            finally:
+                endpoint.limiter.release(status, retry_after)
+                pool.record(endpoint, not is_endpoint_failure(status))
+
+        def close(self) -> None:
+            for inner in self.inner.values():
+                inner.close()
+
+    return PooledTransport()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Token, call and latency accounting for Ragas judge calls, attributed to the metric and sample being scored."""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from typing import Any, Iterator
+
+
+USAGE_COLUMNS = [
+    "judge_llm_calls",
+    "judge_prompt_tokens",
+    "judge_completion_tokens",
+    "judge_embedding_tokens",
+    "judge_seconds",
+]
+SLOWEST_ROWS = 10
+
+# Set while one (metric, sample) job is scored; asyncio tasks spawned by Ragas inherit it.
+CURRENT_JOB: ContextVar[tuple[str, Any] | None] = ContextVar("judge_job", default=None)
+
+
+@dataclass
+class UsageTotals:
+    jobs: int = 0
+    job_seconds: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_seconds: float = 0.0
+    embedding_calls: int = 0
+    embedding_tokens: float = 0.0
+    embedding_seconds: float = 0.0
+
+    def add(self, other: UsageTotals) -> None:
+        for field in fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+    def to_dict(self) -> dict[str, Any]:
+        values = {field.name: getattr(self, field.name) for field in fields(self)}
+        values["embedding_tokens"] = round(self.embedding_tokens)
+        return values
+
+
+class JudgeUsage:
+    """Thread-safe totals per (metric, sample_id); calls made outside a job are kept under ``None``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: dict[tuple[str | None, Any], UsageTotals] = {}
+        self._by_sample: dict[Any, list[UsageTotals]] = {}
+
+    @contextmanager
+    def job(self, metric: str, sample_id: Any) -> Iterator[None]:
+        token = CURRENT_JOB.set((metric, sample_id))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            CURRENT_JOB.reset(token)
+            with self._lock:
+                totals = self._entry((metric, sample_id))
+                totals.jobs += 1
+                totals.job_seconds += elapsed
+
+    def record_llm(self, response: Any, seconds: float) -> None:
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            totals = self._entry(CURRENT_JOB.get())
+            totals.llm_calls += 1
+            totals.prompt_tokens += getattr(usage, "prompt_tokens", None) or 0
+            totals.completion_tokens += getattr(usage, "completion_tokens", None) or 0
+            totals.llm_seconds += seconds
+
+    def record_embedding(self, job: tuple[str, Any] | None, tokens: float, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            totals = self._entry(job)
+            totals.embedding_calls += calls
+            totals.embedding_tokens += tokens
+            totals.embedding_seconds += seconds
+
+    def llm_calls(self) -> int:
+        with self._lock:
+            return sum(totals.llm_calls for totals in self._totals.values())
+
+    def row_columns(self, sample_id: Any) -> dict[str, Any]:
+        row = UsageTotals()
+        with self._lock:
+            for totals in self._by_sample.get(sample_id, []):
+                row.add(totals)
+        return {
+            "judge_llm_calls": row.llm_calls,
+            "judge_prompt_tokens": row.prompt_tokens,
+            "judge_completion_tokens": row.completion_tokens,
+            "judge_embedding_tokens": round(row.embedding_tokens),
+            "judge_seconds": round(row.llm_seconds + row.embedding_seconds, 3),
+        }
+
+    def summary(self, wall_seconds: float) -> dict[str, Any]:
+        with self._lock:
+            entries = {key: totals for key, totals in self._totals.items()}
+        overall = UsageTotals()
+        by_metric: dict[str, UsageTotals] = {}
+        by_row: dict[Any, UsageTotals] = {}
+        for (metric, sample_id), totals in entries.items():
+            overall.add(totals)
+            if metric is None:
+                continue
+            by_metric.setdefault(metric, UsageTotals()).add(totals)
+            by_row.setdefault(sample_id, UsageTotals()).add(totals)
+
+        rows = len(by_row)
+        tokens = overall.prompt_tokens + overall.completion_tokens + overall.embedding_tokens
+        metrics = {
+            metric: {
+                **totals.to_dict(),
+                "mean_job_seconds": totals.job_seconds / totals.jobs if totals.jobs else None,
+                "llm_calls_per_row": totals.llm_calls / totals.jobs if totals.jobs else None,
+            }
+            for metric, totals in by_metric.items()
+        }
+        slowest_rows = sorted(by_row.items(), key=lambda item: item[1].llm_seconds + item[1].embedding_seconds, reverse=True)
+        return {
+            "rows_scored": rows,
+            "wall_seconds": wall_seconds,
+            "totals": overall.to_dict(),
+            "tokens_per_second": tokens / wall_seconds if wall_seconds > 0 else None,
+            "completion_tokens_per_llm_second": (
+                overall.completion_tokens / overall.llm_seconds if overall.llm_seconds > 0 else None
+            ),
+            "calls_per_row": (overall.llm_calls + overall.embedding_calls) / rows if rows else None,
+            "slowest_metrics": sorted(metrics, key=lambda metric: by_metric[metric].job_seconds, reverse=True),
+            "metrics": metrics,
+            "slowest_rows": [
+                {"sample_id": sample_id, **totals.to_dict()} for sample_id, totals in slowest_rows[:SLOWEST_ROWS]
+            ],
+        }
+
+    def _entry(self, job: tuple[str, Any] | None) -> UsageTotals:
+        key = job or (None, None)
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = UsageTotals()
+            self._by_sample.setdefault(key[1], []).append(totals)
+        return totals
+
+
+def response_tokens(response: Any) -> int:
+    # Embedding responses report prompt_tokens; some OpenAI-compatible providers only send total_tokens.
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "prompt_tokens", None) or getattr(usage, "total_tokens", None) or 0
+
+
+def instrument_chat_client(client: Any, usage: JudgeUsage) -> Any:
+    # Wrap the bound create method before llm_factory captures it, so every judge completion is timed.
+    completions = client.chat.completions
+    create = completions.create
+
+    async def timed_create(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = await create(*args, **kwargs)
+        usage.record_llm(response, time.perf_counter() - started)
+        return response
+
+    completions.create = timed_create
+    return client
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""Load-test the ZGI RAG evaluation API or the Dify chat API with realistic QA queries."""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import itertools
+import math
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+import run_dify_eval
+import run_ragas_eval as shared
+
+
+DEFAULT_DURATION_SECONDS = 60.0
+DEFAULT_WARMUP_SECONDS = 5.0
+DEFAULT_MAX_IN_FLIGHT = 256
+REPORT_QUANTILES = {"p50": 0.50, "p90": 0.90, "p99": 0.99, "p99.9": 0.999}
+
+
+@dataclass
+class LoadSample:
+    scheduled: float
+    started: float
+    finished: float
+    ok: bool
+    stages: dict[str, float] = field(default_factory=dict)
+    error: str = ""
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with bounded relative error, in the style of HdrHistogram."""
+
+    def __init__(self, relative_precision: float = 0.01) -> None:
+        self.log_base = math.log1p(relative_precision)
+        self.counts: dict[int, int] = {}
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(1.0, seconds * 1_000_000)
+        bucket = int(math.log(micros) / self.log_base)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, quantile: float) -> float | None:
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(quantile * self.total))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Report the bucket midpoint, clamped to the exact extremes that were observed.
+                value = math.exp((bucket + 0.5) * self.log_base) / 1_000_000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, Any]:
+        if not self.total:
+            return {"count": 0}
+        return {
+            "count": self.total,
+            "mean_seconds": self.sum / self.total,
+            "min_seconds": self.min,
+            "max_seconds": self.max,
+            **{f"{name}_seconds": self.percentile(quantile) for name, quantile in REPORT_QUANTILES.items()},
+        }
+
+
+def main() -> int:
+    shared.ENV_VALUES = shared.load_env_file(shared.ENV_FILE)
+    args = parse_args()
+    input_path = shared.choose_input_path(args.input)
+    if not input_path.exists():
+        raise SystemExit(f"input file does not exist: {input_path}")
+    qa_items = shared.read_qa_items(input_path, args.limit, shared.qa_cache_path(input_path))
+    if not qa_items:
+        raise SystemExit("no QA rows found in input file")
+    questions = [item.question for item in qa_items]
+
+    send = build_zgi_sender(args) if args.target == "zgi" else build_dify_sender(args)
+    print(
+        f"load test started: target={args.target}, mode={args.mode}, "
+        + (f"qps={args.qps}" if args.mode == "open" else f"users={args.users}")
+        + f", duration={args.duration}s, warmup={args.warmup}s, queries={len(questions)}",
+        flush=True,
+    )
+    if args.mode == "open":
+        samples = run_open_loop(send, questions, args.qps, args.duration, args.max_in_flight)
+    else:
+        samples = run_closed_loop(send, questions, args.users, args.duration)
+    report = build_load_report(samples, args.warmup)
+    report.update(
+        {
+            "target": args.target,
+            "mode": args.mode,
+            "offered_qps": args.qps if args.mode == "open" else None,
+            "users": args.users if args.mode == "closed" else None,
+            "duration_seconds": args.duration,
+            "warmup_seconds": args.warmup,
+            "input": str(input_path),
+        }
+    )
+
+    report_path = Path(args.output).expanduser().resolve() if args.output else load_report_path(input_path, args.target, args.mode)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    shared.write_json(report_path, report)
+    print_load_report(report)
+    print(f"saved load test report: {report_path}")
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the ZGI RAG evaluation API or the Dify chat API.")
+    parser.add_argument("--target", required=True, choices=["zgi", "dify"], help="Endpoint under test.")
+    parser.add_argument("--input", default="", help="QA input file whose questions are replayed. If omitted, choose from scripts/rag_evaluation/input.")
+    parser.add_argument("--limit", type=int, default=0, help="Number of QA rows to replay. 0 means all rows.")
+    parser.add_argument("--mode", default="closed", choices=["open", "closed"], help="open: fixed arrival rate; closed: fixed number of users.")
+    parser.add_argument("--qps", type=float, default=1.0, help="Target arrival rate for --mode open. Default: %(default)s")
+    parser.add_argument("--users", type=int, default=1, help="Concurrent users for --mode closed. Default: %(default)s")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="Test duration in seconds, including warm-up. Default: %(default)s")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP_SECONDS, help="Seconds at the start whose samples are excluded. Default: %(default)s")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="Open-loop cap on outstanding requests. Default: %(default)s")
+    parser.add_argument("--output", default="", help="Override the report JSON path.")
+    parser.add_argument("--base-url", default="", help="Endpoint base URL. Defaults to ZGI_BASE_URL or DIFY_BASE_URL.")
+    parser.add_argument("--api-key", default=shared.env_value("DIFY_API_KEY"), help=argparse.SUPPRESS)
+    parser.add_argument("--response-mode", default=shared.env_value("DIFY_RESPONSE_MODE", "blocking"), choices=["blocking", "streaming"])
+    parser.add_argument("--user-prefix", default=shared.env_value("DIFY_USER_PREFIX", "rag-eval"))
+    parser.add_argument("--knowledge-base-name", default=shared.env_value("ZGI_KNOWLEDGE_BASE_NAME"))
+    parser.add_argument("--email", default=shared.env_value("ZGI_EMAIL"))
+    parser.add_argument("--password", default=shared.env_value("ZGI_PASSWORD"))
+    parser.add_argument("--top-k", type=int, default=shared.int_env_value("ZGI_RAG_EVAL_TOP_K", shared.DEFAULT_RAG_EVAL_TOP_K))
+    parser.add_argument("--score-threshold", type=float, default=shared.float_env_value("ZGI_RAG_EVAL_SCORE_THRESHOLD", shared.DEFAULT_RAG_EVAL_SCORE_THRESHOLD))
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=["hybrid", "vector", "graph"])
+    parser.add_argument("--model", default="")
+    args = parser.parse_args()
+    if args.qps <= 0:
+        raise SystemExit("--qps must be > 0")
+    if args.users < 1:
+        raise SystemExit("--users must be >= 1")
+    if args.duration <= 0 or args.warmup < 0 or args.warmup >= args.duration:
+        raise SystemExit("--duration must be > 0 and --warmup must be in [0, duration)")
+    if args.max_in_flight < 1:
+        raise SystemExit("--max-in-flight must be >= 1")
+    return args
+
+
+def build_zgi_sender(args: argparse.Namespace) -> Callable[[str], dict[str, float]]:
+    base_url = (args.base_url or shared.env_value("ZGI_BASE_URL", shared.DEFAULT_BASE_URL)).rstrip("/")
+    if not args.knowledge_base_name:
+        raise SystemExit("knowledge base name is required. Set ZGI_KNOWLEDGE_BASE_NAME or pass --knowledge-base-name.")
+    email = args.email or input("ZGI email: ").strip()
+    token = shared.get_cached_token(base_url, email)
+    if not token:
+        token = shared.interactive_login(base_url, email, args.password)
+        shared.write_cached_token(base_url, email, token)
+    def send(question: str) -> dict[str, float]:
+        items = shared.call_rag_evaluation_batch(
+            base_url,
+            token,
+            args.knowledge_base_name,
+            [question],
+            args.top_k,
+            args.score_threshold,
+            args.retrieval_mode,
+            args.model,
+            # Load tests must observe errors rather than hide them behind retries.
+            max_retries=0,
+        )
+        item = items[0] if items and isinstance(items[0], dict) else {}
+        if item.get("status") == "error":
+            raise RuntimeError(str(item.get("error") or "backend item error"))
+        return server_stages(item)
+
+    return send
+
+
+def build_dify_sender(args: argparse.Namespace) -> Callable[[str], dict[str, float]]:
+    base_url = (args.base_url or shared.env_value("DIFY_BASE_URL", run_dify_eval.DEFAULT_DIFY_BASE_URL)).rstrip("/")
+    api_key = args.api_key.strip()
+    if not api_key:
+        raise SystemExit(f"Dify app API key is required. Set DIFY_API_KEY in {shared.ENV_FILE}.")
+    endpoint = f"{base_url}/chat-messages"
+    user_ids = itertools.count(1)
+    run_id = int(time.time())
+
+    def send(question: str) -> dict[str, float]:
+        payload = {
+            "inputs": {},
+            "query": question,
+            "response_mode": args.response_mode,
+            "conversation_id": "",
+            "user": f"{args.user_prefix}-load-{run_id}-{next(user_ids)}",
+            "auto_generate_name": False,
+        }
+        data = run_dify_eval.post_with_retries(endpoint, payload, api_key, max_retries=0)
+        if not str(data.get("answer") or "").strip():
+            raise RuntimeError("Dify response does not contain a non-empty answer")
+        stages: dict[str, float] = {}
+        timing = data.get("stream_timing") if isinstance(data.get("stream_timing"), dict) else {}
+        if timing.get("ttft_seconds") is not None:
+            stages["ttft"] = float(timing["ttft_seconds"])
+        metadata = data.get("metadata") if isinstance(data.get("metadata"), dict) else {}
+        usage = metadata.get("usage") if isinstance(metadata.get("usage"), dict) else {}
+        if usage.get("latency") is not None:
+            stages["generation"] = float(usage["latency"])
+        return stages
+
+    return send
+
+
+def server_stages(item: dict[str, Any]) -> dict[str, float]:
+    stages: dict[str, float] = {}
+    for key, stage in (("retrieval_ms", "retrieval"), ("generation_ms", "generation")):
+        value = item.get(key)
+        if isinstance(value, (int, float)):
+            stages[stage] = value / 1000
+    return stages
+
+
+def run_open_loop(
+    send: Callable[[str], dict[str, float]],
+    questions: list[str],
+    qps: float,
+    duration: float,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> list[LoadSample]:
+    samples: list[LoadSample] = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    origin = time.perf_counter()
+
+    def run_one(question: str, scheduled: float) -> None:
+        try:
+            sample = timed_call(send, question, scheduled, origin)
+            with lock:
+                samples.append(sample)
+        finally:
+            slots.release()
+
+    try:
+        for index in itertools.count():
+            scheduled = index / qps
+            if scheduled >= duration:
+                break
+            delay = origin + scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slots.acquire()
+            executor.submit(run_one, questions[index % len(questions)], scheduled)
+    finally:
+        executor.shutdown(wait=True)
+    return samples
+
+
+def run_closed_loop(
+    send: Callable[[str], dict[str, float]],
+    questions: list[str],
+    users: int,
+    duration: float,
+) -> list[LoadSample]:
+    samples: list[LoadSample] = []
+    lock = threading.Lock()
+    counter = itertools.count()
+    origin = time.perf_counter()
+
+    def user_loop() -> None:
+        while True:
+            scheduled = time.perf_counter() - origin
+            if scheduled >= duration:
+                return
+            sample = timed_call(send, questions[next(counter) % len(questions)], scheduled, origin)
+            with lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=user_loop, daemon=True) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def timed_call(send: Callable[[str], dict[str, float]], question: str, scheduled: float, origin: float) -> LoadSample:
+    started = time.perf_counter() - origin
+    try:
+        stages = send(question)
+        ok, error = True, ""
+    except shared.HTTPStatusError as exc:
+        stages, ok, error = {}, False, f"HTTP {exc.status}"
+    except urllib.error.URLError as exc:
+        stages, ok, error = {}, False, f"connection error: {exc.reason}"
+    except (OSError, http.client.HTTPException) as exc:
+        stages, ok, error = {}, False, f"connection error: {type(exc).__name__}"
+    except (RuntimeError, ValueError, KeyError, SystemExit) as exc:
+        stages, ok, error = {}, False, str(exc)
+    except Exception as exc:
+        # An unexpected response shape still counts as a failed request rather than a lost sample.
+        stages, ok, error = {}, False, f"{type(exc).__name__}: {exc}"
+    return LoadSample(scheduled=scheduled, started=started, finished=time.perf_counter() - origin, ok=ok, stages=stages, error=error)
+
+
+def build_load_report(samples: list[LoadSample], warmup: float) -> dict[str, Any]:
+    measured = [sample for sample in samples if sample.scheduled >= warmup]
+    successes = [sample for sample in measured if sample.ok]
+    histograms: dict[str, LatencyHistogram] = {"total": LatencyHistogram(), "queue": LatencyHistogram()}
+    for sample in successes:
+        # Latency counts from the scheduled send time so a stalled client cannot hide server slowness.
+        histograms["total"].record(sample.finished - sample.scheduled)
+        histograms["queue"].record(max(0.0, sample.started - sample.scheduled))
+        for stage, seconds in sample.stages.items():
+            histograms.setdefault(stage, LatencyHistogram()).record(seconds)
+    window = 0.0
+    if measured:
+        window = max(sample.finished for sample in measured) - min(sample.scheduled for sample in measured)
+    errors: dict[str, int] = {}
+    for sample in measured:
+        if not sample.ok:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    return {
+        "requests": len(measured),
+        "warmup_requests": len(samples) - len(measured),
+        "successes": len(successes),
+        "errors": len(measured) - len(successes),
+        "error_rate": (len(measured) - len(successes)) / len(measured) if measured else None,
+        "throughput_rps": len(successes) / window if window > 0 else None,
+        "error_counts": dict(sorted(errors.items(), key=lambda item: item[1], reverse=True)[:10]),
+        "stages": {stage: histogram.summary() for stage, histogram in histograms.items()},
+    }
+
+
+def print_load_report(report: dict[str, Any]) -> None:
+    throughput = report["throughput_rps"]
+    error_rate = report["error_rate"]
+    print(
+        f"requests={report['requests']} (warm-up excluded: {report['warmup_requests']}), "
+        f"errors={report['errors']}, error_rate={'N/A' if error_rate is None else f'{error_rate:.2%}'}, "
+        f"throughput={'N/A' if throughput is None else f'{throughput:.2f}'} req/s"
+    )
+    for stage, summary in report["stages"].items():
+        if not summary.get("count"):
+            continue
+        quantiles = ", ".join(f"{name}={summary[f'{name}_seconds']:.3f}s" for name in REPORT_QUANTILES)
+        print(f"  {stage}: n={summary['count']}, mean={summary['mean_seconds']:.3f}s, {quantiles}, max={summary['max_seconds']:.3f}s")
+
+
+def load_report_path(input_path: Path, target: str, mode: str) -> Path:
+    shared.RESULT_DIR.mkdir(parents=True, exist_ok=True)
+    prefix = shared.RESULT_DIR / input_path.with_suffix("").name
+    return prefix.with_name(f"{prefix.name}.{target}.loadtest.{mode}.json")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Deterministic, judge-free metrics for collected RAG datasets: a cheap pre-screen before paying for Ragas."""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from pathlib import Path
+from typing import Any
+
+import run_ragas_eval as shared
+
+
+OFFLINE_METRICS = ["token_f1", "rouge_l", "context_reference_coverage", "context_hit_at_k"]
+PLATFORMS = ["dify", "zgi"]
+DEFAULT_HIT_K = 5
+DEFAULT_HIT_THRESHOLD = 0.5
+# Rows are scored for ROUGE-L in chunks so one padded DP matrix stays around 32 MB.
+LCS_CHUNK_CELLS = 4_000_000
+# Chinese is scored per character, as in the usual Chinese ROUGE and F1; Latin words and numbers stay whole.
+TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|[0-9a-z]+")
+
+
+def main() -> int:
+    args = parse_args()
+    input_path = shared.choose_input_path(args.input)
+    scored_platforms = 0
+    for platform in args.platform:
+        dataset_path, _, _ = shared.output_paths_for_input(input_path, platform)
+        if not dataset_path.exists():
+            print(f"skipping {platform}: no collected dataset at {dataset_path}")
+            continue
+        started = time.perf_counter()
+        result_rows, summary = score_dataset(shared.load_existing_dataset(dataset_path), args.k, args.hit_threshold)
+        summary["seconds"] = time.perf_counter() - started
+        result_json_path, result_csv_path, summary_path = offline_output_paths(input_path, platform)
+        shared.write_ragas_outputs(result_rows, result_json_path, result_csv_path)
+        shared.write_json(summary_path, {"dataset": str(dataset_path), **summary})
+        print_summary(platform, summary)
+        print(f"saved offline result JSON: {result_json_path}")
+        print(f"saved offline summary: {summary_path}")
+        scored_platforms += 1
+    if not scored_platforms:
+        raise SystemExit(f"no collected datasets found for {input_path.name}; run the Dify or ZGI stage first")
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Score collected Dify/ZGI datasets with deterministic metrics, without a judge LLM.")
+    parser.add_argument("--input", default="", help="QA input file whose collected datasets are scored.")
+    parser.add_argument("--platform", nargs="+", choices=PLATFORMS, default=PLATFORMS, help="Platforms to score. Default: both")
+    parser.add_argument("--k", type=int, default=DEFAULT_HIT_K, help="Top retrieved contexts checked for reference coverage. Default: %(default)s")
+    parser.add_argument("--hit-threshold", type=float, default=DEFAULT_HIT_THRESHOLD, help="Share of reference tokens one context must contain to count as a hit. Default: %(default)s")
+    args = parser.parse_args()
+    if args.k < 1:
+        raise SystemExit("--k must be >= 1")
+    if not 0 < args.hit_threshold <= 1:
+        raise SystemExit("--hit-threshold must be in (0, 1]")
+    return args
+
+
+def offline_output_paths(input_path: Path, platform: str) -> tuple[Path, Path, Path]:
+    _, result_json_path, _ = shared.output_paths_for_input(input_path, platform)
+    prefix = result_json_path.name.replace(".ragas.results.json", ".offline")
+    return (
+        result_json_path.with_name(prefix + ".results.json"),
+        result_json_path.with_name(prefix + ".results.csv"),
+        result_json_path.with_name(prefix + ".summary.json"),
+    )
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def score_dataset(
+    dataset_rows: list[dict[str, Any]],
+    k: int = DEFAULT_HIT_K,
+    hit_threshold: float = DEFAULT_HIT_THRESHOLD,
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """Score eligible rows and return result rows in the ``write_ragas_outputs`` schema plus a dataset summary."""
+    import numpy as np
+
+    rows = [row for row in dataset_rows if shared.is_ragas_eligible(row)]
+    vocabulary: dict[str, int] = {}
+    # The same chunk is retrieved for many questions, so each distinct text is tokenized once.
+    encoded: dict[str, Any] = {}
+    distinct_tokens: dict[str, Any] = {}
+
+    def encode(text: Any) -> Any:
+        text = str(text or "")
+        if text not in encoded:
+            tokens = [vocabulary.setdefault(token, len(vocabulary)) for token in tokenize(text)]
+            encoded[text] = np.array(tokens, dtype=np.int64)
+        return encoded[text]
+
+    def distinct(text: Any) -> Any:
+        # Coverage only asks which tokens a context contains, so contexts are kept as sorted token sets.
+        key = str(text or "")
+        if key not in distinct_tokens:
+            distinct_tokens[key] = np.unique(encode(key))
+        return distinct_tokens[key]
+
+    responses = [encode(row["response"]) for row in rows]
+    references = [encode(row["reference"]) for row in rows]
+    contexts = [[distinct(context) for context in (row.get("retrieved_contexts") or [])[:k]] for row in rows]
+    response_lengths = np.array([len(tokens) for tokens in responses], dtype=np.int64)
+    reference_lengths = np.array([len(tokens) for tokens in references], dtype=np.int64)
+    context_counts = np.array([len(row.get("retrieved_contexts") or []) for row in rows], dtype=np.int64)
+    size = max(1, len(vocabulary))
+
+    scores = {
+        "token_f1": token_f1(responses, references, size),
+        "rouge_l": rouge_l(responses, references),
+        **reference_coverage(references, contexts, size, hit_threshold),
+    }
+    result_rows: list[dict[str, Any]] = []
+    for position, row in enumerate(rows):
+        result_row = {
+            "user_input": row["user_input"],
+            "response": row["response"],
+            "retrieved_contexts": row.get("retrieved_contexts") or [],
+            "reference": row["reference"],
+            **{name: float(values[position]) for name, values in scores.items()},
+            "response_tokens": int(response_lengths[position]),
+            "reference_tokens": int(reference_lengths[position]),
+            "context_count": int(context_counts[position]),
+        }
+        shared.label_result_row(result_row, row, row.get("sample_id", position + 1))
+        result_rows.append(result_row)
+    return result_rows, summarize(len(dataset_rows), scores, response_lengths, reference_lengths, context_counts, k, hit_threshold)
+
+
+def ragged_keys(token_lists: list[Any], size: int) -> Any:
+    """One int64 key per token: ``row * size + token``, so per-row set operations become whole-array ones."""
+    import numpy as np
+
+    lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+    flat = np.concatenate(token_lists) if token_lists else np.zeros(0, dtype=np.int64)
+    return np.repeat(np.arange(len(token_lists), dtype=np.int64), lengths) * size + flat
+
+
+def sorted_counts(keys: Any) -> tuple[Any, Any]:
+    """Distinct keys and their counts; a plain sort is much faster than ``np.unique`` on tens of millions of int64 keys."""
+    import numpy as np
+
+    keys = np.sort(keys)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, dtype=np.int64)
+    return keys[starts], np.diff(np.append(starts, len(keys)))
+
+
+def token_f1(responses: list[Any], references: list[Any], size: int) -> Any:
+    import numpy as np
+
+    response_keys, response_counts = sorted_counts(ragged_keys(responses, size))
+    reference_keys, reference_counts = sorted_counts(ragged_keys(references, size))
+    common, response_index, reference_index = np.intersect1d(response_keys, reference_keys, assume_unique=True, return_indices=True)
+    overlap = np.bincount(
+        common // size, weights=np.minimum(response_counts[response_index], reference_counts[reference_index]), minlength=len(responses)
+    )
+    return f_measure(overlap, responses, references)
+
+
+def rouge_l(responses: list[Any], references: list[Any]) -> Any:
+    """ROUGE-L F1 from an LCS dynamic program run over a chunk of rows at once, one response position per step."""
+    import numpy as np
+
+    lcs = np.zeros(len(responses))
+    # Rows of similar length share a chunk, so little of each padded matrix is wasted.
+    order = sorted(range(len(responses)), key=lambda index: (len(responses[index]), len(references[index])))
+    start = 0
+    while start < len(order):
+        stop, widest = start + 1, max(1, len(references[order[start]]))
+        while stop < len(order):
+            candidate = max(widest, len(references[order[stop]]))
+            if (stop - start + 1) * candidate > LCS_CHUNK_CELLS:
+                break
+            widest = candidate
+            stop += 1
+        chunk = order[start:stop]
+        lcs[chunk] = chunk_lcs([responses[index] for index in chunk], [references[index] for index in chunk], widest)
+        start = stop
+    return f_measure(lcs, responses, references)
+
+
+def chunk_lcs(responses: list[Any], references: list[Any], width: int) -> Any:
+    import numpy as np
+
+    rows = len(responses)
+    height = max((len(tokens) for tokens in responses), default=0)
+    # Different padding values never match, so padded cells leave the LCS unchanged.
+    left = np.full((rows, height), -1, dtype=np.int64)
+    right = np.full((rows, width), -2, dtype=np.int64)
+    for row, (response, reference) in enumerate(zip(responses, references)):
+        left[row, : len(response)] = response
+        right[row, : len(reference)] = reference
+    table = np.zeros((rows, width + 1), dtype=np.int32)
+    for position in range(height):
+        match = left[:, position : position + 1] == right
+        # A matching cell extends the diagonal; the running max carries the best LCS so far to the right.
+        step = np.maximum(table[:, 1:], (table[:, :-1] + 1) * match)
+        table[:, 1:] = np.maximum.accumulate(step, axis=1)
+    return table[:, -1]
+
+
+def reference_coverage(references: list[Any], contexts: list[list[Any]], size: int, hit_threshold: float) -> dict[str, Any]:
+    import numpy as np
+
+    reference_keys, _ = sorted_counts(ragged_keys(references, size))
+    distinct = np.bincount(reference_keys // size, minlength=len(references)).astype(float)
+    flat_contexts = [tokens for row_contexts in contexts for tokens in row_contexts]
+    context_rows = np.repeat(np.arange(len(contexts)), [len(row_contexts) for row_contexts in contexts])
+    # Each context is already a token set, so these keys are distinct without another sort.
+    context_keys = ragged_keys(flat_contexts, size)
+    # Keys are re-based from context index to row index so they can be looked up among the reference keys.
+    context_index = context_keys // size
+    row_keys = context_rows[context_index] * size + context_keys % size
+    found = np.isin(row_keys, reference_keys)
+    per_context = np.bincount(context_index, weights=found, minlength=len(flat_contexts))
+    best = np.zeros(len(references))
+    np.maximum.at(best, context_rows, per_context)
+    union, _ = sorted_counts(row_keys[found])
+    covered = np.bincount(union // size, minlength=len(references))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.where(distinct > 0, covered / distinct, np.nan)
+        hit = np.where(distinct > 0, (best / distinct >= hit_threshold).astype(float), np.nan)
+    return {"context_reference_coverage": coverage, "context_hit_at_k": hit}
+
+
+def f_measure(overlap: Any, responses: list[Any], references: list[Any]) -> Any:
+    import numpy as np
+
+    response_lengths = np.fromiter(map(len, responses), dtype=float, count=len(responses))
+    reference_lengths = np.fromiter(map(len, references), dtype=float, count=len(references))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(response_lengths > 0, overlap / response_lengths, 0.0)
+        recall = overlap / reference_lengths
+        score = np.where(overlap > 0, 2 * precision * recall / (precision + recall), 0.0)
+    # A reference with no scorable tokens gives no score rather than a zero.
+    return np.where(reference_lengths > 0, score, np.nan)
+
+
+def summarize(
+    dataset_size: int,
+    scores: dict[str, Any],
+    response_lengths: Any,
+    reference_lengths: Any,
+    context_counts: Any,
+    k: int,
+    hit_threshold: float,
+) -> dict[str, Any]:
+    import numpy as np
+
+    def stat(values: Any, function: Any) -> float | None:
+        values = values[np.isfinite(values)]
+        return float(function(values)) if len(values) else None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        length_ratio = np.where(reference_lengths > 0, response_lengths / reference_lengths, np.nan)
+    return {
+        "rows": dataset_size,
+        "scored_rows": len(response_lengths),
+        "k": k,
+        "hit_threshold": hit_threshold,
+        "metrics": {name: stat(values, np.mean) for name, values in scores.items()},
+        "empty_context_rows": int((context_counts == 0).sum()),
+        "empty_context_rate": stat((context_counts == 0).astype(float), np.mean),
+        "mean_contexts": stat(context_counts.astype(float), np.mean),
+        "response_tokens": {
+            "mean": stat(response_lengths.astype(float), np.mean),
+            "p50": stat(response_lengths.astype(float), np.median),
+            "p95": stat(response_lengths.astype(float), lambda values: np.percentile(values, 95)),
+        },
+        "mean_reference_tokens": stat(reference_lengths.astype(float), np.mean),
+        "mean_response_to_reference_length": stat(length_ratio, np.mean),
+    }
+
+
+def print_summary(platform: str, summary: dict[str, Any]) -> None:
+    metrics = ", ".join(f"{name}={'N/A' if value is None else f'{value:.3f}'}" for name, value in summary["metrics"].items())
+    print(f"{platform}: {summary['scored_rows']}/{summary['rows']} rows scored in {summary['seconds']:.2f}s: {metrics}")
+    print(
+        f"{platform}: empty contexts {summary['empty_context_rows']}, "
+        f"mean response tokens {summary['response_tokens']['mean'] or 0:.1f}, "
+        f"mean response/reference length {summary['mean_response_to_reference_length'] or 0:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
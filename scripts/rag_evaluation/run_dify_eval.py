@@ -4,16 +4,20 @@
 from __future__ import annotations
 
 import argparse
+import queue
 import time
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
+import http_transport
 import run_ragas_eval as shared
 
 
 DEFAULT_DIFY_BASE_URL = "http://127.0.0.1:18000/v1"
 DEFAULT_MAX_RETRIES = 2
+DEFAULT_CONCURRENCY = 1
 
 
 def main() -> int:
@@ -28,7 +32,7 @@ def main() -> int:
     if dataset_path.exists():
         if args.reuse_dataset:
             reuse = True
-        elif args.recollect:
+        elif args.recollect or args.resume:
             reuse = False
         else:
             answer = input(
@@ -47,7 +51,7 @@ def main() -> int:
         if api_key.startswith("dataset-"):
             raise SystemExit("DIFY_API_KEY must be the published app API key, not a dataset API key.")
 
-        qa_items = shared.read_qa_items(input_path, args.limit)
+        qa_items = shared.read_qa_items(input_path, args.limit, None if args.no_input_cache else shared.qa_cache_path(input_path))
         if not qa_items:
             raise SystemExit("no QA rows found in input file")
 
@@ -58,25 +62,57 @@ def main() -> int:
         shared.write_env_file(shared.ENV_FILE, shared.ENV_VALUES)
 
         partial_path = dataset_path.with_name(dataset_path.name.replace(".dataset.json", ".dataset.partial.json"))
-        dataset_rows = collect_dify_rows(
-            qa_items=qa_items,
-            endpoint=f"{base_url}/chat-messages",
-            api_key=api_key,
-            user_prefix=args.user_prefix,
-            response_mode=args.response_mode,
-            max_retries=args.max_retries,
-            partial_path=partial_path,
-        )
-        shared.write_json(dataset_path, dataset_rows)
-        partial_path.unlink(missing_ok=True)
-        print(f"saved Dify Ragas dataset: {dataset_path}")
+
+        def collect_dataset(emit: Callable[[dict[str, Any]], None] | None = None) -> list[dict[str, Any]]:
+            rows = collect_dify_rows(
+                qa_items=qa_items,
+                endpoint=f"{base_url}/chat-messages",
+                api_key=api_key,
+                user_prefix=args.user_prefix,
+                response_mode=args.response_mode,
+                max_retries=args.max_retries,
+                partial_path=partial_path,
+                concurrency=args.concurrency,
+                resume=args.resume,
+                requests_per_second=args.rps,
+                on_row=emit,
+            )
+            shared.write_json(dataset_path, rows)
+            partial_path.unlink(missing_ok=True)
+            print(f"saved Dify Ragas dataset: {dataset_path}")
+            return rows
 
     ragas_model_config = shared.build_ragas_model_config(args)
     shared.remember_ragas_model_config(ragas_model_config)
     shared.ENV_VALUES["RAGAS_BATCH_SIZE"] = str(args.ragas_batch_size)
     shared.write_env_file(shared.ENV_FILE, shared.ENV_VALUES)
-    results = shared.run_ragas(dataset_rows, ragas_model_config, args.ragas_batch_size, args.ragas_limit)
+    pipeline: shared.CollectionPipeline | None = None
+    if dataset_rows is None and args.pipeline:
+        print("pipeline mode: scoring rows with Ragas while Dify collection is still running", flush=True)
+        pipeline = shared.CollectionPipeline(collect_dataset).start()
+    elif dataset_rows is None:
+        dataset_rows = collect_dataset()
+    try:
+        results = shared.run_ragas(
+            pipeline.rows() if pipeline else dataset_rows,
+            ragas_model_config,
+            args.ragas_batch_size,
+            args.ragas_limit,
+            score_cache_path=None if args.no_score_cache else shared.SCORE_CACHE_PATH,
+            embedding_store_dir=None if args.no_embedding_cache else shared.EMBEDDING_STORE_DIR,
+            partial_results_path=shared.scoring_checkpoint_path(result_json_path),
+            resume_scoring=args.resume_scoring,
+            metric_names=args.metrics,
+            judge_usage_path=shared.judge_usage_path(result_json_path),
+            sampling=shared.sampling_config_from_args(args),
+            sampling_report_path=shared.sampling_report_path(result_json_path),
+            context_packing=args.context_token_budget,
+        )
+    finally:
+        if pipeline:
+            pipeline.close()
     shared.write_ragas_outputs(results, result_json_path, result_csv_path)
+    shared.scoring_checkpoint_path(result_json_path).unlink(missing_ok=True)
     print(f"saved Dify Ragas result JSON: {result_json_path}")
     print(f"saved Dify Ragas result CSV: {result_csv_path}")
     return 0
@@ -89,8 +125,10 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--base-url", default=shared.env_value("DIFY_BASE_URL", DEFAULT_DIFY_BASE_URL))
     parser.add_argument("--api-key", default=shared.env_value("DIFY_API_KEY"), help=argparse.SUPPRESS)
     parser.add_argument("--user-prefix", default=shared.env_value("DIFY_USER_PREFIX", "rag-eval"))
-    parser.add_argument("--response-mode", default=shared.env_value("DIFY_RESPONSE_MODE", "blocking"), choices=["blocking"])
+    parser.add_argument("--response-mode", default=shared.env_value("DIFY_RESPONSE_MODE", "blocking"), choices=["blocking", "streaming"])
     parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent Dify requests. Default: %(default)s")
+    parser.add_argument("--rps", type=float, default=shared.float_env_value("DIFY_REQUESTS_PER_SECOND", 0.0), help="Dify requests per second. 0 means unlimited.")
     parser.add_argument("--ragas-batch-size", type=int, default=shared.int_env_value("RAGAS_BATCH_SIZE", shared.DEFAULT_RAGAS_BATCH_SIZE))
     parser.add_argument("--ragas-limit", type=int, default=0)
     parser.add_argument("--ragas-provider", default=shared.env_value("RAGAS_PROVIDER", "auto"), choices=["auto", "aliyun", "openai"])
@@ -99,13 +137,30 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--ragas-llm-model", default=shared.ragas_env_value("RAGAS_LLM_MODEL", "ALIYUN_LLM_MODEL", "DASHSCOPE_LLM_MODEL"))
     parser.add_argument("--ragas-embedding-model", default=shared.ragas_env_value("RAGAS_EMBEDDING_MODEL", "ALIYUN_EMBEDDING_MODEL", "DASHSCOPE_EMBEDDING_MODEL"))
     parser.add_argument("--ragas-enable-thinking", default=shared.ragas_env_value("RAGAS_ENABLE_THINKING", "ALIYUN_ENABLE_THINKING", "DASHSCOPE_ENABLE_THINKING"))
+    parser.add_argument("--ragas-extra-endpoints", default=shared.env_value("RAGAS_EXTRA_ENDPOINTS"), help="More endpoints for the same judge models, as comma-separated base_url|api_key[|weight] entries.")
     parser.add_argument("--ragas-max-workers", type=int, default=shared.int_env_value("RAGAS_MAX_WORKERS", shared.DEFAULT_RAGAS_MAX_WORKERS))
+    parser.add_argument("--ragas-rps", type=float, default=shared.float_env_value("RAGAS_REQUESTS_PER_SECOND", 0.0), help="Judge LLM and embedding requests per second per endpoint. 0 means unlimited.")
+    parser.add_argument("--ragas-embedding-batch-size", type=int, default=shared.int_env_value("RAGAS_EMBEDDING_BATCH_SIZE", shared.DEFAULT_RAGAS_EMBEDDING_BATCH_SIZE), help="Maximum texts per embeddings request. Default: %(default)s")
+    parser.add_argument("--no-score-cache", action="store_true", help="Score every row with the judge even if an identical row was scored before.")
+    parser.add_argument("--no-input-cache", action="store_true", help="Parse the QA input file even if its parsed pairs are cached in middle/.")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Call the embeddings API for every text instead of reusing stored vectors.")
+    parser.add_argument("--metrics", type=shared.parse_metric_names, default=shared.RAGAS_METRICS, help=f"Comma-separated Ragas metrics to score. Default: {','.join(shared.RAGAS_METRICS)}")
+    parser.add_argument("--context-token-budget", type=shared.parse_context_token_budget, default=None, help="Deduplicate retrieved contexts and pack them into a token budget before judging: N for every context metric, metric=N entries, or both.")
+    parser.add_argument("--resume-scoring", action="store_true", help="Keep Ragas rows already written to the partial results file and score only the missing sample_ids.")
+    parser.add_argument("--pipeline", action="store_true", help="Score each collected row with Ragas while Dify collection is still running.")
+    shared.add_sampling_args(parser)
     dataset_group = parser.add_mutually_exclusive_group()
     dataset_group.add_argument("--reuse-dataset", action="store_true")
     dataset_group.add_argument("--recollect", action="store_true")
+    dataset_group.add_argument("--resume", action="store_true", help="Resume from the partial dataset, skipping questions that already succeeded.")
     args = parser.parse_args()
     if args.max_retries < 0:
         raise SystemExit("--max-retries must be >= 0")
+    if args.concurrency < 1:
+        raise SystemExit("--concurrency must be >= 1")
+    if args.rps < 0 or args.ragas_rps < 0:
+        raise SystemExit("--rps and --ragas-rps must be >= 0")
+    shared.validate_sampling_args(args)
     return args
 
 
@@ -117,60 +172,149 @@ def collect_dify_rows(
     response_mode: str,
     max_retries: int,
     partial_path: Path,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    resume: bool = False,
+    requests_per_second: float = 0.0,
+    on_row: Callable[[dict[str, Any]], None] | None = None,
 ) -> list[dict[str, Any]]:
     total = len(qa_items)
     run_id = int(time.time())
-    rows: list[dict[str, Any]] = []
-    print(f"collecting Dify RAG data: {total} questions, response_mode={response_mode}", flush=True)
-    for sample_id, qa in enumerate(qa_items, start=1):
-        print(f"Dify question {sample_id}/{total} started", flush=True)
-        payload = {
-            "inputs": {},
-            "query": qa.question,
-            "response_mode": response_mode,
-            "conversation_id": "",
-            "user": f"{user_prefix}-{run_id}-{sample_id}",
-            "auto_generate_name": False,
-        }
-        started = time.perf_counter()
+    rows_by_id: dict[int, dict[str, Any]] = {}
+    if resume and partial_path.exists():
+        rows_by_id = shared.select_resumable_rows(shared.load_existing_dataset(partial_path), qa_items, partial_path)
+    print(
+        f"collecting Dify RAG data: {total} questions, response_mode={response_mode}, concurrency={concurrency}",
+        flush=True,
+    )
+    if resume:
+        print(f"resuming Dify collection: {len(rows_by_id)}/{total} questions already succeeded in {partial_path}", flush=True)
+    if on_row:
+        for sample_id in sorted(rows_by_id):
+            on_row(rows_by_id[sample_id])
+
+    limiter = http_transport.RateLimiter(requests_per_second, max_concurrency=concurrency)
+
+    # Each worker owns one Dify user id, so concurrent conversations never share a user.
+    users: queue.SimpleQueue[str] = queue.SimpleQueue()
+    for worker in range(1, concurrency + 1):
+        users.put(f"{user_prefix}-{run_id}-w{worker}")
+
+    def collect_one(sample_id: int, qa: shared.QAItem) -> dict[str, Any]:
+        user = users.get()
         try:
-            data = post_with_retries(endpoint, payload, api_key, max_retries)
-            elapsed = time.perf_counter() - started
-            row = build_dify_row(sample_id, qa, data, elapsed)
-        except shared.HTTPStatusError as exc:
-            if exc.status in {401, 403}:
-                raise SystemExit(f"Dify authentication failed with HTTP {exc.status}; check DIFY_API_KEY.") from exc
-            elapsed = time.perf_counter() - started
-            row = error_row(sample_id, qa, elapsed, f"HTTP {exc.status}: {exc.body}")
-        except urllib.error.URLError as exc:
-            elapsed = time.perf_counter() - started
-            row = error_row(sample_id, qa, elapsed, f"connection error: {exc.reason}")
-        rows.append(row)
-        shared.write_json(partial_path, rows)
-        print(
-            f"Dify question {sample_id}/{total} finished: status={row['status']}, "
-            f"contexts={len(row['retrieved_contexts'])}, latency={row['latency_seconds']:.3f}s",
-            flush=True,
-        )
+            print(f"Dify question {sample_id}/{total} started", flush=True)
+            return collect_dify_row(sample_id, qa, endpoint, api_key, user, response_mode, max_retries, limiter)
+        finally:
+            users.put(user)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = [
+            executor.submit(collect_one, sample_id, qa)
+            for sample_id, qa in enumerate(qa_items, start=1)
+            if sample_id not in rows_by_id
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            rows_by_id[row["sample_id"]] = row
+            shared.write_json_atomically(partial_path, [rows_by_id[sample_id] for sample_id in sorted(rows_by_id)])
+            print(
+                f"Dify question {row['sample_id']}/{total} finished: status={row['status']}, "
+                f"contexts={len(row['retrieved_contexts'])}, latency={row['latency_seconds']:.3f}s",
+                flush=True,
+            )
+            if on_row:
+                on_row(row)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    if limiter.throttled:
+        print(f"Dify returned HTTP 429 {limiter.throttled} times; final concurrency limit={limiter.concurrency}", flush=True)
+    rows = [rows_by_id[sample_id] for sample_id in sorted(rows_by_id)]
     print(f"Dify RAG data collection finished: {len(rows)}/{total}", flush=True)
     return rows
 
 
-def post_with_retries(url: str, payload: dict[str, Any], api_key: str, max_retries: int) -> dict[str, Any]:
-    for attempt in range(max_retries + 1):
-        try:
-            return shared.post_json(url, payload, token=api_key)
-        except shared.HTTPStatusError as exc:
-            retryable = exc.status == 429 or exc.status >= 500
-            if not retryable or attempt >= max_retries:
-                raise
-        except urllib.error.URLError:
-            if attempt >= max_retries:
-                raise
-        delay = min(2**attempt, 5)
-        print(f"Dify request failed transiently; retrying in {delay}s ({attempt + 1}/{max_retries})", flush=True)
-        time.sleep(delay)
-    raise RuntimeError("unreachable retry state")
+def collect_dify_row(
+    sample_id: int,
+    qa: shared.QAItem,
+    endpoint: str,
+    api_key: str,
+    user: str,
+    response_mode: str,
+    max_retries: int,
+    limiter: http_transport.RateLimiter | None = None,
+) -> dict[str, Any]:
+    payload = {
+        "inputs": {},
+        "query": qa.question,
+        "response_mode": response_mode,
+        "conversation_id": "",
+        "user": user,
+        "auto_generate_name": False,
+    }
+    started = time.perf_counter()
+    try:
+        data = post_with_retries(endpoint, payload, api_key, max_retries, limiter)
+        elapsed = time.perf_counter() - started
+        return build_dify_row(sample_id, qa, data, elapsed)
+    except shared.HTTPStatusError as exc:
+        if exc.status in {401, 403}:
+            raise SystemExit(f"Dify authentication failed with HTTP {exc.status}; check DIFY_API_KEY.") from exc
+        elapsed = time.perf_counter() - started
+        return error_row(sample_id, qa, elapsed, f"HTTP {exc.status}: {exc.body}")
+    except urllib.error.URLError as exc:
+        elapsed = time.perf_counter() - started
+        return error_row(sample_id, qa, elapsed, f"connection error: {exc.reason}")
+
+
+def post_with_retries(
+    url: str,
+    payload: dict[str, Any],
+    api_key: str,
+    max_retries: int,
+    limiter: http_transport.RateLimiter | None = None,
+) -> dict[str, Any]:
+    def send() -> dict[str, Any]:
+        if payload.get("response_mode") == "streaming":
+            return stream_chat_message(url, payload, api_key)
+        return shared.post_json(url, payload, token=api_key)
+
+    return http_transport.call_with_retries(send, max_retries, limiter=limiter, label="Dify request")
+
+
+def stream_chat_message(url: str, payload: dict[str, Any], api_key: str, timeout: float = 300) -> dict[str, Any]:
+    started = time.perf_counter()
+    chunk_times: list[float] = []
+    answer_parts: list[str] = []
+    data: dict[str, Any] = {}
+    for event in shared.post_sse(url, payload, token=api_key, timeout=timeout):
+        event_type = event.get("event")
+        if event_type in {"message", "agent_message"}:
+            chunk = str(event.get("answer") or "")
+            if chunk:
+                chunk_times.append(time.perf_counter() - started)
+                answer_parts.append(chunk)
+        elif event_type == "message_replace":
+            answer_parts = [str(event.get("answer") or "")]
+        elif event_type == "message_end":
+            data["metadata"] = event.get("metadata")
+        elif event_type == "error":
+            raise shared.HTTPStatusError(int(event.get("status") or 500), str(event.get("message") or event))
+        for key in ("message_id", "conversation_id"):
+            if event.get(key):
+                data[key] = event[key]
+    # Return the blocking-mode response shape so build_dify_row handles both modes.
+    total = time.perf_counter() - started
+    gaps = [later - earlier for earlier, later in zip(chunk_times, chunk_times[1:])]
+    data["answer"] = "".join(answer_parts)
+    data["stream_timing"] = {
+        "ttft_seconds": chunk_times[0] if chunk_times else None,
+        "stream_seconds": total,
+        "stream_chunks": len(chunk_times),
+        "inter_token_gap_mean_seconds": sum(gaps) / len(gaps) if gaps else None,
+        "inter_token_gap_max_seconds": max(gaps) if gaps else None,
+    }
+    return data
 
 
 def build_dify_row(sample_id: int, qa: shared.QAItem, data: dict[str, Any], elapsed: float) -> dict[str, Any]:
@@ -185,6 +329,8 @@ def build_dify_row(sample_id: int, qa: shared.QAItem, data: dict[str, Any], elap
     ]
     answer = str(data.get("answer") or "")
     error = "" if answer.strip() else "Dify response does not contain a non-empty answer"
+    stream_timing = data.get("stream_timing")
+    stream_timing = stream_timing if isinstance(stream_timing, dict) else {}
     return {
         "sample_id": sample_id,
         "platform": "dify",
@@ -199,6 +345,7 @@ def build_dify_row(sample_id: int, qa: shared.QAItem, data: dict[str, Any], elap
         "usage": metadata.get("usage") if isinstance(metadata.get("usage"), dict) else {},
         "message_id": str(data.get("message_id") or data.get("id") or ""),
         "conversation_id": str(data.get("conversation_id") or ""),
+        **stream_timing,
     }
 
 
@@ -4,40 +4,69 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import copy
 import csv
 import json
 import os
+import queue
+import threading
 import time
 import urllib.error
-import urllib.parse
-import urllib.request
 import warnings
-import zipfile
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import closing
+from dataclasses import dataclass, field
 from getpass import getpass
-from io import BytesIO
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
+
+import http_transport
+import input_cache
+from context_packing import PackedContexts, PackingConfig, pack_contexts, parse_context_budgets
+from embedding_store import EmbeddingStore
+from http_transport import HTTPStatusError
+from judge_pool import EndpointPool, JudgeEndpoint, parse_endpoints, pooled_httpx_transport
+from judge_usage import CURRENT_JOB, JudgeUsage, instrument_chat_client, response_tokens
+from score_cache import ScoreCache
+from sequential_sampling import DEFAULT_ROUND_SIZE as DEFAULT_SAMPLING_ROUND_SIZE
+from sequential_sampling import SamplingConfig, SequentialSampler, stratified_order
 
 
 DEFAULT_LIMIT = 0
 DEFAULT_BACKEND_BATCH_SIZE = 10
+DEFAULT_BACKEND_CONCURRENCY = 1
+MAX_BACKEND_BATCH_SIZE = 100
+DEFAULT_BACKEND_MAX_RETRIES = 2
 DEFAULT_RAGAS_BATCH_SIZE = 10
 DEFAULT_RAGAS_MAX_WORKERS = 8
+DEFAULT_RAGAS_EMBEDDING_BATCH_SIZE = 10
+# Collected rows buffered between a live backend collection and Ragas scoring.
+DEFAULT_PIPELINE_QUEUE_SIZE = 64
+EMBEDDING_COALESCE_SECONDS = 0.005
+RAGAS_METRICS = ["faithfulness", "answer_relevancy", "context_precision", "context_recall", "answer_correctness"]
+# Metrics that compare embeddings in addition to asking the judge LLM.
+EMBEDDING_METRICS = {"answer_relevancy", "answer_correctness"}
+CONTEXT_METRICS = ["faithfulness", "context_precision", "context_recall"]
 DEFAULT_RAG_EVAL_TOP_K = 10
 DEFAULT_RAG_EVAL_SCORE_THRESHOLD = 0.35
 DEFAULT_BASE_URL = "http://127.0.0.1:2670/console/api"
 DEFAULT_ALIYUN_RAGAS_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 DEFAULT_ALIYUN_RAGAS_LLM_MODEL = "qwen-plus"
 DEFAULT_ALIYUN_RAGAS_EMBEDDING_MODEL = "text-embedding-v4"
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
 SCRIPT_DIR = Path(__file__).resolve().parent
 INPUT_DIR = SCRIPT_DIR / "input"
 MIDDLE_DIR = SCRIPT_DIR / "middle"
 RESULT_DIR = SCRIPT_DIR / "result"
 ENV_FILE = SCRIPT_DIR / ".env"
+SCORE_CACHE_PATH = MIDDLE_DIR / "ragas_score_cache.sqlite3"
+EMBEDDING_STORE_DIR = MIDDLE_DIR / "embedding_store"
 ENV_VALUES = {}
+BACKEND_LIMITER: http_transport.RateLimiter | None = None
+BACKEND_MAX_RETRIES = DEFAULT_BACKEND_MAX_RETRIES
 INPUT_EXTENSIONS = {".xls", ".xlsx", ".csv"}
+XLSX_MAGIC = b"PK\x03\x04"
 
 QUESTION_HEADERS = {
     "question",
@@ -75,33 +104,101 @@ class RagasModelConfig:
     embedding_model: str
     enable_thinking: bool | None
     max_workers: int
+    requests_per_second: float = 0.0
+    embedding_batch_size: int = DEFAULT_RAGAS_EMBEDDING_BATCH_SIZE
+    # Every endpoint serving the judge models, the primary api_key/base_url first.
+    endpoints: list[JudgeEndpoint] = field(default_factory=list)
 
 
 class OpenAICompatibleRagasEmbeddings:
-    def __init__(self, sync_client: Any, async_client: Any, model: str) -> None:
+    def __init__(
+        self,
+        sync_client: Any,
+        async_client: Any,
+        model: str,
+        store: EmbeddingStore | None = None,
+        max_batch_size: int = DEFAULT_RAGAS_EMBEDDING_BATCH_SIZE,
+        coalesce_seconds: float = EMBEDDING_COALESCE_SECONDS,
+        usage: JudgeUsage | None = None,
+    ) -> None:
         self.sync_client = sync_client
         self.async_client = async_client
         self.model = model
+        self.store = store
+        self.usage = usage
+        self.max_batch_size = max_batch_size
+        self.coalesce_seconds = coalesce_seconds
+        self.requests = 0
+        self._dimension = 0
+        # Ragas may drive several event loops; each one coalesces its own callers.
+        self._pending: dict[asyncio.AbstractEventLoop, list[tuple[list[str], asyncio.Future, tuple[str, Any] | None]]] = {}
+        # The event loop holds tasks only weakly; a collected flush task would leave its waiters hanging.
+        self._flush_tasks: set[asyncio.Task] = set()
 
     def embed_query(self, text: str) -> list[float]:
         return self.embed_documents([text])[0]
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        normalized = self._normalize_texts(texts)
-        if not normalized:
-            return []
-        response = self.sync_client.embeddings.create(input=normalized, model=self.model)
-        return [item.embedding for item in response.data]
+        texts = [str(text) for text in texts]
+        vectors, missing = self._lookup(self._normalize_texts(texts))
+        for chunk in self._chunks(missing):
+            self.requests += 1
+            started = time.perf_counter()
+            response = self.sync_client.embeddings.create(input=chunk, model=self.model)
+            if self.usage:
+                self.usage.record_embedding(CURRENT_JOB.get(), response_tokens(response), time.perf_counter() - started)
+            self._remember(chunk, [item.embedding for item in response.data], vectors)
+        return self._in_input_order(texts, vectors)
 
     async def aembed_query(self, text: str) -> list[float]:
         return (await self.aembed_documents([text]))[0]
 
     async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        texts = [str(text) for text in texts]
         normalized = self._normalize_texts(texts)
-        if not normalized:
-            return []
-        response = await self.async_client.embeddings.create(input=normalized, model=self.model)
-        return [item.embedding for item in response.data]
+        # Blank-only calls still wait for the current batch so their zero vectors get the right dimension.
+        vectors = await self._coalesce(normalized) if normalized or not self._dimension else {}
+        return self._in_input_order(texts, vectors)
+
+    async def _coalesce(self, texts: list[str]) -> dict[str, list[float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = []
+            loop.call_later(self.coalesce_seconds, self._start_flush, loop)
+        # The flush task runs in the first caller's context, so each caller's job is captured here.
+        pending.append((texts, future, CURRENT_JOB.get()))
+        return await future
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        task = loop.create_task(self._flush(loop))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        waiters = self._pending.pop(loop, [])
+        try:
+            vectors, missing = self._lookup([text for texts, _, _ in waiters for text in texts])
+            chunks = self._chunks(missing)
+            self.requests += len(chunks)
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *(self.async_client.embeddings.create(input=chunk, model=self.model) for chunk in chunks)
+            )
+            elapsed = time.perf_counter() - started
+            for chunk, response in zip(chunks, responses):
+                self._remember(chunk, [item.embedding for item in response.data], vectors)
+        except Exception as exc:
+            for _, future, _ in waiters:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        if self.usage and chunks:
+            self._record_shared_usage(waiters, set(missing), sum(response_tokens(response) for response in responses), elapsed, len(chunks))
+        for texts, future, _ in waiters:
+            if not future.done():
+                future.set_result({text: vectors[text] for text in texts})
 
     async def embed_text(self, text: str, is_async: bool = True) -> list[float]:
         if is_async:
@@ -113,16 +210,62 @@ class OpenAICompatibleRagasEmbeddings:
             return await self.aembed_documents(texts)
         return self.embed_documents(texts)
 
+    def _record_shared_usage(
+        self,
+        waiters: list[tuple[list[str], asyncio.Future, tuple[str, Any] | None]],
+        requested: set[str],
+        tokens: int,
+        seconds: float,
+        calls: int,
+    ) -> None:
+        # A coalesced request serves several jobs; each is charged for the share of requested texts it asked for,
+        # while the requests themselves are counted once, against the first job charged.
+        weights = [(job, len(requested.intersection(texts))) for texts, _, job in waiters]
+        total = sum(weight for _, weight in weights)
+        for job, weight in weights:
+            if weight:
+                self.usage.record_embedding(job, tokens * weight / total, seconds * weight / total, calls)
+                calls = 0
+
+    def _lookup(self, texts: list[str]) -> tuple[dict[str, list[float]], list[str]]:
+        unique = list(dict.fromkeys(texts))
+        if not self.store:
+            return {}, unique
+        found = self.store.get_many(unique)
+        vectors = {text: vector for text, vector in zip(unique, found) if vector is not None}
+        return vectors, [text for text in unique if text not in vectors]
+
+    def _remember(self, texts: list[str], embeddings: list[list[float]], vectors: dict[str, list[float]]) -> None:
+        if len(embeddings) != len(texts):
+            raise RuntimeError(f"embedding API returned {len(embeddings)} vectors for {len(texts)} texts")
+        vectors.update(zip(texts, embeddings))
+        if embeddings:
+            self._dimension = len(embeddings[0])
+        if self.store:
+            self.store.put_many(texts, embeddings)
+
+    def _chunks(self, texts: list[str]) -> list[list[str]]:
+        size = max(1, self.max_batch_size)
+        return [texts[start : start + size] for start in range(0, len(texts), size)]
+
+    def _in_input_order(self, texts: list[str], vectors: dict[str, list[float]]) -> list[list[float]]:
+        if vectors and not self._dimension:
+            self._dimension = len(next(iter(vectors.values())))
+        # Blank texts are never sent to the provider; a zero vector keeps every caller's positions intact.
+        return [vectors[text] if text.strip() else [0.0] * self._dimension for text in texts]
+
     @staticmethod
     def _normalize_texts(texts: list[str]) -> list[str]:
         return [str(text) for text in texts if str(text).strip()]
 
 
 def main(output_platform: str = "") -> int:
-    global ENV_VALUES
+    global ENV_VALUES, BACKEND_LIMITER, BACKEND_MAX_RETRIES
     ENV_VALUES = load_env_file(ENV_FILE)
 
     args = parse_args()
+    BACKEND_LIMITER = http_transport.RateLimiter(args.backend_rps, max_concurrency=args.backend_concurrency)
+    BACKEND_MAX_RETRIES = args.backend_max_retries
     input_path = choose_input_path(args.input)
     if not input_path.exists():
         raise SystemExit(f"input file does not exist: {input_path}")
@@ -132,7 +275,7 @@ def main(output_platform: str = "") -> int:
     if dataset_path.exists():
         if args.reuse_dataset:
             answer = "yes"
-        elif args.recollect:
+        elif args.recollect or args.resume:
             answer = ""
         else:
             answer = input(
@@ -149,7 +292,7 @@ def main(output_platform: str = "") -> int:
     ENV_VALUES["ZGI_EMAIL"] = email
 
     if dataset_rows is None:
-        qa_items = read_qa_items(input_path, args.limit)
+        qa_items = read_qa_items(input_path, args.limit, None if args.no_input_cache else qa_cache_path(input_path))
         if not qa_items:
             raise SystemExit("no QA rows found in input file")
 
@@ -167,50 +310,103 @@ def main(output_platform: str = "") -> int:
         write_env_file(ENV_FILE, ENV_VALUES)
         top_k, score_threshold = resolve_retrieval_eval_params(args)
 
-        questions = [item.question for item in qa_items]
-        try:
-            eval_items = call_rag_evaluation(
+        partial_path = partial_checkpoint_path(dataset_path)
+        collected_rows: dict[int, dict[str, Any]] = {}
+        if args.resume:
+            collected_rows = load_partial_rows(partial_path, qa_items)
+            print(f"resuming backend collection: {len(collected_rows)}/{len(qa_items)} questions already collected in {partial_path}")
+        else:
+            partial_path.unlink(missing_ok=True)
+
+        def collect(access_token: str, emit: Callable[[dict[str, Any]], None] | None) -> None:
+            pending_ids = [sample_id for sample_id in range(1, len(qa_items) + 1) if sample_id not in collected_rows]
+            if not pending_ids:
+                return
+
+            def checkpoint(start: int, items: list[dict[str, Any]]) -> None:
+                rows = []
+                for offset, item in enumerate(items):
+                    sample_id = pending_ids[start + offset]
+                    rows.append(build_ragas_row(sample_id, qa_items[sample_id - 1], item))
+                for row in rows:
+                    collected_rows[row["sample_id"]] = row
+                append_jsonl(partial_path, rows)
+                if emit:
+                    for row in rows:
+                        emit(row)
+
+            call_rag_evaluation(
                 base_url,
-                token,
+                access_token,
                 knowledge_base_name,
-                questions,
+                [qa_items[sample_id - 1].question for sample_id in pending_ids],
                 top_k,
                 score_threshold,
                 args.retrieval_mode,
                 args.model,
                 args.backend_batch_size,
+                args.backend_concurrency,
+                on_batch=checkpoint,
+                adaptive=args.adaptive_backend_batch_size,
             )
-        except HTTPStatusError as exc:
-            if exc.status == 401:
-                print("cached token is invalid or expired; please log in again.")
-                token = interactive_login(base_url, email, args.password)
-                write_cached_token(base_url, email, token)
-                eval_items = call_rag_evaluation(
-                    base_url,
-                    token,
-                    knowledge_base_name,
-                    questions,
-                    top_k,
-                    score_threshold,
-                    args.retrieval_mode,
-                    args.model,
-                    args.backend_batch_size,
-                )
-            else:
-                raise
-        except urllib.error.URLError as exc:
-            raise SystemExit(f"cannot connect to {base_url}: {exc}") from exc
 
-        dataset_rows = build_ragas_rows(qa_items, eval_items)
-        write_json(dataset_path, dataset_rows)
-        print(f"saved Ragas dataset: {dataset_path}")
+        def collect_dataset(emit: Callable[[dict[str, Any]], None] | None = None) -> list[dict[str, Any]]:
+            nonlocal token
+            # Rows resumed from the checkpoint are scored first, before any new backend call returns.
+            if emit:
+                for sample_id in sorted(collected_rows):
+                    emit(collected_rows[sample_id])
+            try:
+                collect(token, emit)
+            except HTTPStatusError as exc:
+                if exc.status == 401:
+                    print("cached token is invalid or expired; please log in again.")
+                    token = interactive_login(base_url, email, args.password)
+                    write_cached_token(base_url, email, token)
+                    collect(token, emit)
+                else:
+                    raise
+            except urllib.error.URLError as exc:
+                raise SystemExit(f"cannot connect to {base_url}: {exc}") from exc
+
+            rows = [collected_rows[sample_id] for sample_id in range(1, len(qa_items) + 1)]
+            write_json(dataset_path, rows)
+            partial_path.unlink(missing_ok=True)
+            print(f"saved Ragas dataset: {dataset_path}")
+            return rows
 
     ragas_model_config = build_ragas_model_config(args)
     remember_ragas_model_config(ragas_model_config)
     ENV_VALUES["RAGAS_BATCH_SIZE"] = str(args.ragas_batch_size)
     write_env_file(ENV_FILE, ENV_VALUES)
-    results = run_ragas(dataset_rows, ragas_model_config, args.ragas_batch_size, args.ragas_limit)
+    pipeline: CollectionPipeline | None = None
+    if dataset_rows is None and args.pipeline:
+        print("pipeline mode: scoring rows with Ragas while backend collection is still running", flush=True)
+        pipeline = CollectionPipeline(collect_dataset).start()
+    elif dataset_rows is None:
+        dataset_rows = collect_dataset()
+    # Closing unblocks a collection thread waiting on a full queue, so it still saves the dataset if scoring fails.
+    try:
+        results = run_ragas(
+            pipeline.rows() if pipeline else dataset_rows,
+            ragas_model_config,
+            args.ragas_batch_size,
+            args.ragas_limit,
+            score_cache_path=None if args.no_score_cache else SCORE_CACHE_PATH,
+            embedding_store_dir=None if args.no_embedding_cache else EMBEDDING_STORE_DIR,
+            partial_results_path=scoring_checkpoint_path(result_json_path),
+            resume_scoring=args.resume_scoring,
+            metric_names=args.metrics,
+            judge_usage_path=judge_usage_path(result_json_path),
+            sampling=sampling_config_from_args(args),
+            sampling_report_path=sampling_report_path(result_json_path),
+            context_packing=args.context_token_budget,
+        )
+    finally:
+        if pipeline:
+            pipeline.close()
     write_ragas_outputs(results, result_json_path, result_csv_path)
+    scoring_checkpoint_path(result_json_path).unlink(missing_ok=True)
     print(f"saved Ragas result JSON: {result_json_path}")
     print(f"saved Ragas result CSV: {result_csv_path}")
     return 0
@@ -227,7 +423,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--top-k", type=int, default=None, help="Retrieval top_k passed to the backend. If omitted, prompt and save to .env.")
     parser.add_argument("--score-threshold", type=float, default=None, help="Retrieval score threshold passed to the backend. If omitted, prompt and save to .env.")
     parser.add_argument("--backend-batch-size", type=int, default=DEFAULT_BACKEND_BATCH_SIZE, help="Questions per backend request. Default: %(default)s")
-    parser.add_argument("--ragas-batch-size", type=int, default=int_env_value("RAGAS_BATCH_SIZE", DEFAULT_RAGAS_BATCH_SIZE), help="Rows per Ragas evaluation batch after all backend data is collected. Default: %(default)s")
+    parser.add_argument("--adaptive-backend-batch-size", action="store_true", help="Start at --backend-batch-size and adapt it per batch: grow while per-question latency stays flat, halve on timeouts or 5xx.")
+    parser.add_argument("--backend-rps", type=float, default=0.0, help="Backend batch requests per second. 0 means unlimited.")
+    parser.add_argument("--backend-max-retries", type=int, default=DEFAULT_BACKEND_MAX_RETRIES, help="Retries for backend batches rejected with HTTP 429. Default: %(default)s")
+    parser.add_argument("--backend-concurrency", type=int, default=DEFAULT_BACKEND_CONCURRENCY, help="Backend batch requests kept in flight at once. Default: %(default)s")
+    parser.add_argument("--ragas-batch-size", type=int, default=int_env_value("RAGAS_BATCH_SIZE", DEFAULT_RAGAS_BATCH_SIZE), help="Rows between Ragas progress log lines. Default: %(default)s")
     parser.add_argument("--ragas-limit", type=int, default=0, help="Limit rows sent to Ragas after filtering successful backend rows. 0 means no limit.")
     parser.add_argument("--retrieval-mode", default="hybrid", choices=["hybrid", "vector", "graph"], help="Retrieval mode.")
     parser.add_argument("--model", default="", help="Optional generation model name for the backend.")
@@ -237,11 +437,33 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--ragas-llm-model", default=ragas_env_value("RAGAS_LLM_MODEL", "ALIYUN_LLM_MODEL", "DASHSCOPE_LLM_MODEL"), help="Chat model used by Ragas.")
     parser.add_argument("--ragas-embedding-model", default=ragas_env_value("RAGAS_EMBEDDING_MODEL", "ALIYUN_EMBEDDING_MODEL", "DASHSCOPE_EMBEDDING_MODEL"), help="Embedding model used by Ragas.")
     parser.add_argument("--ragas-enable-thinking", default=ragas_env_value("RAGAS_ENABLE_THINKING", "ALIYUN_ENABLE_THINKING", "DASHSCOPE_ENABLE_THINKING"), help="Enable DashScope thinking mode for Ragas judge LLM. true/false.")
+    parser.add_argument("--ragas-extra-endpoints", default=env_value("RAGAS_EXTRA_ENDPOINTS"), help="More endpoints for the same judge models, as comma-separated base_url|api_key[|weight] entries. An empty base_url reuses --ragas-base-url.")
     parser.add_argument("--ragas-max-workers", type=int, default=int_env_value("RAGAS_MAX_WORKERS", DEFAULT_RAGAS_MAX_WORKERS), help="Ragas concurrent workers. Default: %(default)s")
+    parser.add_argument("--ragas-rps", type=float, default=float_env_value("RAGAS_REQUESTS_PER_SECOND", 0.0), help="Judge LLM and embedding requests per second per endpoint. 0 means unlimited.")
+    parser.add_argument("--ragas-embedding-batch-size", type=int, default=int_env_value("RAGAS_EMBEDDING_BATCH_SIZE", DEFAULT_RAGAS_EMBEDDING_BATCH_SIZE), help="Maximum texts per embeddings request; DashScope text-embedding-v4 accepts 10. Default: %(default)s")
+    parser.add_argument("--no-score-cache", action="store_true", help="Score every row with the judge even if an identical row was scored before.")
+    parser.add_argument("--no-input-cache", action="store_true", help="Parse the QA input file even if its parsed pairs are cached in middle/.")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Call the embeddings API for every text instead of reusing stored vectors.")
+    parser.add_argument("--metrics", type=parse_metric_names, default=RAGAS_METRICS, help=f"Comma-separated Ragas metrics to score. Default: {','.join(RAGAS_METRICS)}")
+    parser.add_argument("--context-token-budget", type=parse_context_token_budget, default=None, help="Deduplicate retrieved contexts and pack them into a token budget before judging: N for every context metric, metric=N entries, or both, comma-separated. 0 keeps every unique context.")
+    parser.add_argument("--resume-scoring", action="store_true", help="Keep Ragas rows already written to the partial results file and score only the missing sample_ids.")
+    parser.add_argument("--pipeline", action="store_true", help="Score each collected row with Ragas while backend collection is still running.")
+    add_sampling_args(parser)
     dataset_group = parser.add_mutually_exclusive_group()
     dataset_group.add_argument("--reuse-dataset", action="store_true", help="Reuse the existing platform dataset without collecting backend data.")
     dataset_group.add_argument("--recollect", action="store_true", help="Ignore an existing platform dataset and recollect backend data.")
-    return parser.parse_args()
+    dataset_group.add_argument("--resume", action="store_true", help="Resume backend collection from the partial checkpoint, skipping questions already collected.")
+    args = parser.parse_args()
+    if args.backend_concurrency < 1:
+        raise SystemExit("--backend-concurrency must be >= 1")
+    if args.backend_rps < 0:
+        raise SystemExit("--backend-rps must be >= 0")
+    if args.backend_max_retries < 0:
+        raise SystemExit("--backend-max-retries must be >= 0")
+    if args.backend_batch_size > MAX_BACKEND_BATCH_SIZE:
+        raise SystemExit(f"--backend-batch-size cannot exceed the backend limit of {MAX_BACKEND_BATCH_SIZE}")
+    validate_sampling_args(args)
+    return args
 
 
 def load_env_file(path: Path) -> dict[str, str]:
@@ -415,7 +637,8 @@ def choose_input_path(input_arg: str) -> Path:
 
     print(f"Available input files in {INPUT_DIR}:")
     for idx, path in enumerate(input_files, start=1):
-        print(f"  {idx}. {path.name}")
+        status = input_cache.cache_status(qa_cache_path(path), path)
+        print(f"  {idx}. {path.name}" + (f" ({status})" if status else ""))
 
     while True:
         choice = input("Select input file number: ").strip()
@@ -505,6 +728,15 @@ def build_ragas_model_config(args: argparse.Namespace) -> RagasModelConfig:
         raise SystemExit("Ragas embedding model is required. Set RAGAS_EMBEDDING_MODEL in scripts/rag_evaluation/.env.")
     if args.ragas_max_workers < 1:
         raise SystemExit("RAGAS_MAX_WORKERS must be >= 1.")
+    if args.ragas_rps < 0:
+        raise SystemExit("RAGAS_REQUESTS_PER_SECOND must be >= 0.")
+    if args.ragas_embedding_batch_size < 1:
+        raise SystemExit("RAGAS_EMBEDDING_BATCH_SIZE must be >= 1.")
+    endpoint_base_url = base_url or DEFAULT_OPENAI_BASE_URL
+    try:
+        extra_endpoints = parse_endpoints(args.ragas_extra_endpoints or "", endpoint_base_url)
+    except ValueError as exc:
+        raise SystemExit(f"RAGAS_EXTRA_ENDPOINTS: {exc}") from exc
 
     return RagasModelConfig(
         provider=provider,
@@ -514,6 +746,9 @@ def build_ragas_model_config(args: argparse.Namespace) -> RagasModelConfig:
         embedding_model=embedding_model,
         enable_thinking=enable_thinking,
         max_workers=args.ragas_max_workers,
+        requests_per_second=args.ragas_rps,
+        embedding_batch_size=args.ragas_embedding_batch_size,
+        endpoints=[JudgeEndpoint(endpoint_base_url, api_key), *extra_endpoints],
     )
 
 
@@ -526,29 +761,49 @@ def remember_ragas_model_config(config: RagasModelConfig) -> None:
     if config.enable_thinking is not None:
         ENV_VALUES["RAGAS_ENABLE_THINKING"] = "true" if config.enable_thinking else "false"
     ENV_VALUES["RAGAS_MAX_WORKERS"] = str(config.max_workers)
+    if config.requests_per_second:
+        ENV_VALUES["RAGAS_REQUESTS_PER_SECOND"] = str(config.requests_per_second)
+    ENV_VALUES["RAGAS_EMBEDDING_BATCH_SIZE"] = str(config.embedding_batch_size)
     ENV_VALUES["RAGAS_API_KEY"] = config.api_key
+    ENV_VALUES["RAGAS_EXTRA_ENDPOINTS"] = ",".join(
+        f"{endpoint.base_url}|{endpoint.api_key}" + (f"|{endpoint.weight:g}" if endpoint.weight != 1 else "")
+        for endpoint in config.endpoints[1:]
+    )
     write_env_file(ENV_FILE, ENV_VALUES)
 
 
-def read_qa_items(path: Path, limit: int) -> list[QAItem]:
-    rows = read_input_rows(path)
-    if not rows:
-        return []
+def qa_cache_path(input_path: Path) -> Path:
+    return MIDDLE_DIR / (input_path.with_suffix("").name + ".qa_items.jsonl")
 
-    start_idx = detect_start_row(rows)
+
+def read_qa_items(path: Path, limit: int, cache_path: Path | None = None) -> list[QAItem]:
+    fingerprint: dict[str, Any] = {}
+    if cache_path:
+        cached, fingerprint = input_cache.load(cache_path, path, limit)
+        if cached is not None:
+            print(f"loaded {len(cached)} QA pairs from parsed input cache {cache_path}", flush=True)
+            return [QAItem(question=question, reference=reference) for question, reference in cached]
     items: list[QAItem] = []
-    for row in rows[start_idx:]:
-        question = clean_cell(row[0] if len(row) > 0 else None)
-        reference = clean_cell(row[1] if len(row) > 1 else None)
-        if not question or not reference:
-            continue
-        items.append(QAItem(question=question, reference=reference))
-        if limit > 0 and len(items) >= limit:
-            break
+    complete = True
+    # Closing the row stream on an early break releases the open workbook before the rest of the file is parsed.
+    with closing(read_input_rows(path)) as rows:
+        for index, row in enumerate(rows):
+            if index == 0 and is_header_row(row):
+                continue
+            question = clean_cell(row[0] if len(row) > 0 else None)
+            reference = clean_cell(row[1] if len(row) > 1 else None)
+            if not question or not reference:
+                continue
+            items.append(QAItem(question=question, reference=reference))
+            if limit > 0 and len(items) >= limit:
+                complete = False
+                break
+    if cache_path:
+        input_cache.store(cache_path, fingerprint, [(item.question, item.reference) for item in items], complete)
     return items
 
 
-def read_input_rows(path: Path) -> list[list[Any]]:
+def read_input_rows(path: Path) -> Iterator[list[Any]]:
     suffix = path.suffix.lower()
     if suffix in {".xls", ".xlsx"}:
         return read_excel_rows(path)
@@ -557,46 +812,55 @@ def read_input_rows(path: Path) -> list[list[Any]]:
     raise SystemExit(f"unsupported input file type: {path.suffix}")
 
 
-def read_csv_rows(path: Path) -> list[list[Any]]:
+def read_csv_rows(path: Path) -> Iterator[list[Any]]:
     with path.open("r", encoding="utf-8-sig", newline="") as f:
-        return [row for row in csv.reader(f)]
+        yield from csv.reader(f)
 
 
-def read_excel_rows(path: Path) -> list[list[Any]]:
+def read_excel_rows(path: Path) -> Iterator[list[Any]]:
+    # Excel files are often saved with the wrong extension, so the format comes from the first bytes.
     with path.open("rb") as f:
-        data = f.read()
-    if zipfile.is_zipfile(BytesIO(data)):
-        return read_openpyxl_rows(data)
+        magic = f.read(len(XLSX_MAGIC))
+    if magic == XLSX_MAGIC:
+        return read_openpyxl_rows(path)
     return read_legacy_xls_rows(path)
 
 
-def read_openpyxl_rows(data: bytes) -> list[list[Any]]:
+def read_openpyxl_rows(path: Path) -> Iterator[list[Any]]:
     try:
         from openpyxl import load_workbook
     except ImportError as exc:
         raise SystemExit("openpyxl is required to read xlsx-format Excel files. Install it with: pip install openpyxl") from exc
 
-    workbook = load_workbook(BytesIO(data), read_only=True, data_only=True)
-    sheet = workbook[workbook.sheetnames[0]]
-    return [list(row) for row in sheet.iter_rows(values_only=True)]
+    # openpyxl rejects a path ending in .xls, but a file handle is fine; read-only mode parses one row per iteration.
+    with path.open("rb") as f:
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            sheet = workbook[workbook.sheetnames[0]]
+            for row in sheet.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
 
 
-def read_legacy_xls_rows(path: Path) -> list[list[Any]]:
+def read_legacy_xls_rows(path: Path) -> Iterator[list[Any]]:
     try:
         import xlrd
     except ImportError as exc:
         raise SystemExit("xlrd is required to read legacy .xls files. Install it with: pip install xlrd") from exc
 
-    workbook = xlrd.open_workbook(str(path))
-    sheet = workbook.sheet_by_index(0)
-    return [[sheet.cell_value(r, c) for c in range(sheet.ncols)] for r in range(sheet.nrows)]
+    workbook = xlrd.open_workbook(str(path), on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for index in range(sheet.nrows):
+            yield sheet.row_values(index)
+    finally:
+        workbook.release_resources()
 
 
-def detect_start_row(rows: list[list[Any]]) -> int:
-    first = [clean_header(cell) for cell in rows[0]]
-    if len(first) >= 2 and first[0] in QUESTION_HEADERS and first[1] in ANSWER_HEADERS:
-        return 1
-    return 0
+def is_header_row(row: list[Any]) -> bool:
+    first = [clean_header(cell) for cell in row]
+    return len(first) >= 2 and first[0] in QUESTION_HEADERS and first[1] in ANSWER_HEADERS
 
 
 def clean_header(value: Any) -> str:
@@ -658,7 +922,10 @@ def write_env_file(path: Path, values: dict[str, str]) -> None:
         "RAGAS_ENABLE_THINKING",
         "RAGAS_BATCH_SIZE",
         "RAGAS_MAX_WORKERS",
+        "RAGAS_REQUESTS_PER_SECOND",
+        "RAGAS_EMBEDDING_BATCH_SIZE",
         "RAGAS_API_KEY",
+        "RAGAS_EXTRA_ENDPOINTS",
     ]
     lines = []
     for key in ordered_keys:
@@ -701,6 +968,46 @@ def login(base_url: str, email: str, password: str) -> str:
     return token
 
 
+class AdaptiveBatchSizer:
+    """AIMD batch sizing: grow additively while per-question latency stays flat, halve on timeouts or 5xx."""
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = MAX_BACKEND_BATCH_SIZE,
+        increase: int = 2,
+        latency_tolerance: float = 1.25,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.latency_tolerance = latency_tolerance
+        self.size = min(max(initial, minimum), maximum)
+        self.baseline_per_question: float | None = None
+
+    def record_success(self, batch_size: int, elapsed: float) -> None:
+        per_question = elapsed / batch_size
+        if self.baseline_per_question is None or per_question < self.baseline_per_question:
+            self.baseline_per_question = per_question
+        if per_question <= self.baseline_per_question * self.latency_tolerance:
+            if batch_size >= self.size:
+                self.size = min(self.maximum, self.size + self.increase)
+        else:
+            self.size = max(self.minimum, self.size - self.increase)
+
+    def record_failure(self) -> None:
+        self.size = max(self.minimum, self.size // 2)
+
+
+def is_backend_overload(exc: BaseException) -> bool:
+    if isinstance(exc, HTTPStatusError):
+        return exc.status >= 500
+    if isinstance(exc, urllib.error.URLError):
+        return isinstance(exc.reason, TimeoutError)
+    return isinstance(exc, TimeoutError)
+
+
 def call_rag_evaluation(
     base_url: str,
     token: str,
@@ -711,19 +1018,34 @@ def call_rag_evaluation(
     retrieval_mode: str,
     model: str,
     batch_size: int,
+    concurrency: int = DEFAULT_BACKEND_CONCURRENCY,
+    on_batch: Callable[[int, list[dict[str, Any]]], None] | None = None,
+    adaptive: bool = False,
 ) -> list[dict[str, Any]]:
     batch_size = normalize_batch_size(batch_size, DEFAULT_BACKEND_BATCH_SIZE)
+    concurrency = normalize_batch_size(concurrency, DEFAULT_BACKEND_CONCURRENCY)
+    sizer = AdaptiveBatchSizer(batch_size) if adaptive else None
     total = len(questions)
-    all_items: list[dict[str, Any]] = []
+    # Unsent question ranges as (start index, questions); failed adaptive batches are put back here.
+    segments: list[tuple[int, list[str]]] = [(0, questions)] if questions else []
+    batch_items: dict[int, list[dict[str, Any]]] = {}
     print(
-        f"collecting backend RAG data: {total} questions, batch_size={batch_size}, "
-        f"top_k={top_k}, score_threshold={score_threshold}",
+        f"collecting backend RAG data: {total} questions, batch_size={batch_size}, concurrency={concurrency}, "
+        f"adaptive={adaptive}, top_k={top_k}, score_threshold={score_threshold}",
         flush=True,
     )
-    for start in range(0, total, batch_size):
-        batch = questions[start : start + batch_size]
-        end = start + len(batch)
-        print(f"backend batch {start + 1}-{end}/{total} started", flush=True)
+
+    def next_batch() -> tuple[int, list[str]]:
+        segments.sort(key=lambda segment: segment[0], reverse=True)
+        start, remaining = segments.pop()
+        size = sizer.size if sizer else batch_size
+        if len(remaining) > size:
+            segments.append((start + size, remaining[size:]))
+        return start, remaining[:size]
+
+    def run_batch(start: int, batch: list[str]) -> tuple[list[dict[str, Any]], float]:
+        print(f"backend batch {start + 1}-{start + len(batch)}/{total} started (batch_size={len(batch)})", flush=True)
+        batch_started = time.perf_counter()
         items = call_rag_evaluation_batch(
             base_url,
             token,
@@ -734,11 +1056,65 @@ def call_rag_evaluation(
             retrieval_mode,
             model,
         )
-        if len(items) != len(batch):
-            raise SystemExit(f"backend batch {start + 1}-{end} returned {len(items)} rows for {len(batch)} questions")
-        all_items.extend(items)
-        print(f"backend batch {start + 1}-{end}/{total} finished", flush=True)
-    print(f"backend RAG data collection finished: {len(all_items)}/{total}", flush=True)
+        return items, time.perf_counter() - batch_started
+
+    collection_started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    in_flight: dict[Future[tuple[list[dict[str, Any]], float]], tuple[int, list[str]]] = {}
+    failure: BaseException | None = None
+    try:
+        while (segments and failure is None) or in_flight:
+            while failure is None and segments and len(in_flight) < concurrency:
+                start, batch = next_batch()
+                in_flight[executor.submit(run_batch, start, batch)] = (start, batch)
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, batch = in_flight.pop(future)
+                end = start + len(batch)
+                try:
+                    items, batch_elapsed = future.result()
+                    if len(items) != len(batch):
+                        raise SystemExit(f"backend batch {start + 1}-{end} returned {len(items)} rows for {len(batch)} questions")
+                except BaseException as exc:
+                    if sizer is not None and len(batch) > 1 and is_backend_overload(exc):
+                        sizer.record_failure()
+                        segments.append((start, batch))
+                        print(
+                            f"backend batch {start + 1}-{end}/{total} overloaded the backend ({exc}); "
+                            f"retrying with batch_size={sizer.size}",
+                            flush=True,
+                        )
+                        continue
+                    # Let the other in-flight batches finish so their results still reach the checkpoint.
+                    failure = failure or exc
+                    continue
+                if sizer is not None:
+                    sizer.record_success(len(batch), batch_elapsed)
+                for item in items:
+                    if isinstance(item, dict):
+                        # The backend answers a batch sequentially, so each item gets an equal share of its wall time.
+                        item["client_latency_seconds"] = batch_elapsed / len(batch)
+                batch_items[start] = items
+                if on_batch is not None:
+                    on_batch(start, items)
+                print(
+                    f"backend batch {start + 1}-{end}/{total} finished in {batch_elapsed:.1f}s "
+                    f"({batch_elapsed / len(batch):.2f}s/question)"
+                    + (f", next batch_size={sizer.size}" if sizer is not None else ""),
+                    flush=True,
+                )
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    if failure is not None:
+        raise failure
+    collection_elapsed = time.perf_counter() - collection_started
+    all_items = [item for start in sorted(batch_items) for item in batch_items[start]]
+    throughput = len(all_items) / collection_elapsed if collection_elapsed > 0 else 0.0
+    print(
+        f"backend RAG data collection finished: {len(all_items)}/{total} in {collection_elapsed:.1f}s "
+        f"({throughput:.2f} questions/s)",
+        flush=True,
+    )
     return all_items
 
 
@@ -751,6 +1127,7 @@ def call_rag_evaluation_batch(
     score_threshold: float,
     retrieval_mode: str,
     model: str,
+    max_retries: int | None = None,
 ) -> list[dict[str, Any]]:
     payload = {
         "knowledge_base_name": knowledge_base_name,
@@ -761,7 +1138,14 @@ def call_rag_evaluation_batch(
     }
     if model:
         payload["model"] = model
-    data = post_json(f"{base_url}/rag-evaluation/batch", payload, token=token)
+    data = http_transport.call_with_retries(
+        lambda: post_json(f"{base_url}/rag-evaluation/batch", payload, token=token),
+        BACKEND_MAX_RETRIES if max_retries is None else max_retries,
+        limiter=BACKEND_LIMITER,
+        label="backend batch",
+        # Timeouts and 5xx are left to the caller, which may shrink the batch instead of resending it unchanged.
+        retry_on=lambda exc: isinstance(exc, HTTPStatusError) and exc.status == 429,
+    )
     body = data.get("data", data)
     items = body.get("data") if isinstance(body, dict) else None
     if not isinstance(items, list):
@@ -769,29 +1153,31 @@ def call_rag_evaluation_batch(
     return items
 
 
-def post_json(url: str, payload: dict[str, Any], token: str) -> dict[str, Any]:
-    headers = {"Content-Type": "application/json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    request = urllib.request.Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers=headers,
-        method="POST",
-    )
-    opener = urllib.request.build_opener(urllib.request.ProxyHandler({})) if is_local_url(url) else urllib.request.build_opener()
-    try:
-        with opener.open(request, timeout=300) as response:
-            raw = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise HTTPStatusError(exc.code, detail) from exc
-    return json.loads(raw)
+def post_json(url: str, payload: dict[str, Any], token: str, timeout: float = http_transport.DEFAULT_TIMEOUT) -> dict[str, Any]:
+    return http_transport.post_json(url, payload, token=token, timeout=timeout)
 
 
-def is_local_url(url: str) -> bool:
-    hostname = urllib.parse.urlparse(url).hostname or ""
-    return hostname in {"localhost", "127.0.0.1", "::1"}
+def post_sse(
+    url: str,
+    payload: dict[str, Any],
+    token: str,
+    timeout: float = http_transport.DEFAULT_TIMEOUT,
+) -> Iterator[dict[str, Any]]:
+    headers = http_transport.json_headers({"Accept": "text/event-stream"}, token=token)
+    with http_transport.TRANSPORT.stream("POST", url, http_transport.json_body(payload), headers, timeout) as response:
+        for raw_line in response:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:") :].strip()
+            if not data or data == "[DONE]":
+                continue
+            try:
+                event = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(event, dict):
+                yield event
 
 
 def extract_access_token(data: dict[str, Any]) -> str:
@@ -809,43 +1195,418 @@ def extract_access_token(data: dict[str, Any]) -> str:
 def build_ragas_rows(qa_items: list[QAItem], eval_items: list[dict[str, Any]]) -> list[dict[str, Any]]:
     if len(eval_items) != len(qa_items):
         raise SystemExit(f"backend returned {len(eval_items)} rows for {len(qa_items)} questions")
+    return [
+        build_ragas_row(sample_id, qa, result)
+        for sample_id, (qa, result) in enumerate(zip(qa_items, eval_items), start=1)
+    ]
+
+
+def build_ragas_row(sample_id: int, qa: QAItem, result: dict[str, Any]) -> dict[str, Any]:
+    contexts = result.get("retrieved_contexts") or []
+    if not isinstance(contexts, list):
+        contexts = []
+    resources = result.get("retriever_resources")
+    usage = result.get("usage")
+    return {
+        "sample_id": sample_id,
+        "platform": "zgi",
+        "user_input": qa.question,
+        "response": str(result.get("response") or ""),
+        "retrieved_contexts": [str(ctx) for ctx in contexts],
+        "reference": qa.reference,
+        "status": str(result.get("status") or ""),
+        "error": str(result.get("error") or ""),
+        "latency_seconds": result.get("client_latency_seconds"),
+        "retrieval_ms": result.get("retrieval_ms"),
+        "generation_ms": result.get("generation_ms"),
+        "retrieval_resources": resources if isinstance(resources, list) else [],
+        "usage": usage if isinstance(usage, dict) else {},
+    }
+
+
+def partial_checkpoint_path(dataset_path: Path) -> Path:
+    return dataset_path.with_name(dataset_path.name.replace(".dataset.json", ".dataset.partial.jsonl"))
+
+
+def append_jsonl(path: Path, rows: list[dict[str, Any]]) -> None:
+    with path.open("a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
 
+
+def read_jsonl(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
     rows: list[dict[str, Any]] = []
-    for sample_id, (qa, result) in enumerate(zip(qa_items, eval_items), start=1):
-        contexts = result.get("retrieved_contexts") or []
-        if not isinstance(contexts, list):
-            contexts = []
-        rows.append(
-            {
-                "sample_id": sample_id,
-                "platform": "zgi",
-                "user_input": qa.question,
-                "response": str(result.get("response") or ""),
-                "retrieved_contexts": [str(ctx) for ctx in contexts],
-                "reference": qa.reference,
-                "status": str(result.get("status") or ""),
-                "error": str(result.get("error") or ""),
-            }
-        )
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave the last line half-written; everything before it is still valid.
+                continue
+            if isinstance(row, dict):
+                rows.append(row)
+    return rows
+
+
+def load_partial_rows(path: Path, qa_items: list[QAItem]) -> dict[int, dict[str, Any]]:
+    return select_resumable_rows(read_jsonl(path), qa_items, path)
+
+
+def select_resumable_rows(partial_rows: list[dict[str, Any]], qa_items: list[QAItem], path: Path) -> dict[int, dict[str, Any]]:
+    rows: dict[int, dict[str, Any]] = {}
+    for row in partial_rows:
+        try:
+            sample_id = int(row.get("sample_id"))
+        except (TypeError, ValueError):
+            continue
+        if sample_id < 1 or sample_id > len(qa_items):
+            continue
+        if row.get("user_input") != qa_items[sample_id - 1].question:
+            raise SystemExit(
+                f"partial checkpoint {path} does not match the input file at sample_id {sample_id}; rerun with --recollect"
+            )
+        if row.get("error"):
+            rows.pop(sample_id, None)
+            continue
+        rows[sample_id] = row
     return rows
 
 
-def run_ragas(dataset_rows: list[dict[str, Any]], config: RagasModelConfig, batch_size: int, ragas_limit: int = 0) -> Any:
+class CollectionPipeline:
+    """Runs backend collection on a thread and hands each collected row to Ragas through a bounded queue."""
+
+    def __init__(
+        self,
+        collect: Callable[[Callable[[dict[str, Any]], None]], list[dict[str, Any]]],
+        max_queued: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+    ) -> None:
+        self._collect = collect
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=max(1, max_queued))
+        self._closed = threading.Event()
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="backend-collection", daemon=True)
+        self.dataset_rows: list[dict[str, Any]] | None = None
+
+    def start(self) -> "CollectionPipeline":
+        self._thread.start()
+        return self
+
+    def rows(self) -> Iterator[dict[str, Any]]:
+        while True:
+            row = self._queue.get()
+            if row is _PIPELINE_DONE:
+                break
+            yield row
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> list[dict[str, Any]] | None:
+        self._closed.set()
+        self._thread.join()
+        return self.dataset_rows
+
+    def _run(self) -> None:
+        try:
+            self.dataset_rows = self._collect(self._put)
+        except BaseException as exc:
+            self._error = exc
+        finally:
+            self._put(_PIPELINE_DONE)
+
+    def _put(self, row: Any) -> None:
+        # A full queue blocks collection until scoring catches up; once scoring stops, rows only go to the checkpoint.
+        while not self._closed.is_set():
+            try:
+                self._queue.put(row, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+_PIPELINE_DONE = object()
+
+
+def run_ragas(
+    dataset_rows: Iterable[dict[str, Any]],
+    config: RagasModelConfig,
+    batch_size: int,
+    ragas_limit: int = 0,
+    score_cache_path: Path | None = None,
+    embedding_store_dir: Path | None = None,
+    partial_results_path: Path | None = None,
+    resume_scoring: bool = False,
+    metric_names: list[str] | None = None,
+    judge_usage_path: Path | None = None,
+    sampling: SamplingConfig | None = None,
+    sampling_report_path: Path | None = None,
+    context_packing: PackingConfig | None = None,
+) -> Any:
     try:
-        from ragas import EvaluationDataset, evaluate
-        from ragas.llms import llm_factory
-        from openai import AsyncOpenAI, OpenAI
+        from importlib.metadata import version
+
+        from ragas import SingleTurnSample
+        from ragas.run_config import RunConfig
+        import openai  # noqa: F401
     except ImportError as exc:
         raise SystemExit(
             "ragas and its dataset dependencies are required. Install them in your Python environment with: "
             "pip install ragas datasets openai"
         ) from exc
 
-    skipped_rows = [
-        (idx, row)
-        for idx, row in enumerate(dataset_rows, start=1)
-        if not row["response"] or row.get("error")
+    metric_names = metric_names or RAGAS_METRICS
+    streamed = not isinstance(dataset_rows, list)
+    if not streamed:
+        skipped_rows, empty_context_rows = classify_dataset_rows(dataset_rows)
+        print_dataset_row_report(skipped_rows, empty_context_rows)
+        if len(skipped_rows) == len(dataset_rows):
+            raise SystemExit("no rows with responses are available for Ragas evaluation")
+    if sampling:
+        if streamed:
+            raise SystemExit("sequential sampling needs the complete dataset; it cannot be combined with --pipeline")
+        dataset_rows = [dataset_rows[index] for index in stratified_order(dataset_rows, sampling.seed)]
+
+    checkpointed_rows: dict[Any, dict[str, Any]] = {}
+    if partial_results_path:
+        if resume_scoring:
+            checkpointed_rows = load_scored_rows(partial_results_path)
+            print(f"resuming Ragas scoring: {len(checkpointed_rows)} rows found in {partial_results_path}")
+        else:
+            partial_results_path.unlink(missing_ok=True)
+
+    eligible_rows: list[dict[str, Any]] = []
+    sample_ids: list[Any] = []
+    scored_rows: dict[Any, dict[str, Any]] = {}
+    pending: list[int] = []
+    received_rows: list[dict[str, Any]] = []
+    usage = JudgeUsage()
+    # Judge calls are attributed to the sample whose metric row is being scored.
+    job_sample_ids: dict[int, Any] = {}
+    sampler = SequentialSampler(sampling, metric_names, usage.llm_calls) if sampling else None
+    checkpoint_lock = threading.Lock()
+    context_metrics = [name for name in metric_names if name in CONTEXT_METRICS]
+    packing_label = context_packing.label(context_metrics) if context_packing else None
+    # Metric rows keep the full contexts; each context metric is judged on its own packed list.
+    packed_contexts: dict[int, PackedContexts] = {}
+    packing_columns: dict[Any, dict[str, Any]] = {}
+
+    def metric_jobs() -> Iterator[dict[str, Any]]:
+        # Rows are filtered as they arrive, so the same path serves a finished dataset and a live collection.
+        for row in dataset_rows:
+            received_rows.append(row)
+            if not is_ragas_eligible(row) or (ragas_limit > 0 and len(eligible_rows) >= ragas_limit):
+                continue
+            if sampler and not sampler.admit():
+                return
+            sample_id = row.get("sample_id", len(eligible_rows) + 1)
+            metric_row = {
+                "user_input": row["user_input"],
+                "response": row["response"],
+                "retrieved_contexts": row["retrieved_contexts"],
+                "reference": row["reference"],
+            }
+            eligible_rows.append(row)
+            sample_ids.append(sample_id)
+            if context_packing:
+                packed = pack_contexts(row["retrieved_contexts"], context_metrics, context_packing)
+                packed_contexts[id(metric_row)] = packed
+                packing_columns[sample_id] = {"context_packing": packing_label, **packed.columns()}
+            previous = reusable_scored_row(checkpointed_rows.get(sample_id), metric_row, metric_names)
+            if previous is not None and previous.get("context_packing") != packing_label:
+                previous = None
+            if previous is not None:
+                scored_rows[sample_id] = previous
+                if sampler:
+                    sampler.record(sample_id, previous)
+                continue
+            pending.append(len(eligible_rows) - 1)
+            job_sample_ids[id(metric_row)] = sample_id
+            yield metric_row
+
+    def checkpoint(position: int, result_row: dict[str, Any]) -> None:
+        index = pending[position]
+        label_result_row(result_row, eligible_rows[index], sample_ids[index])
+        result_row.update(usage.row_columns(sample_ids[index]))
+        result_row.update(packing_columns.get(sample_ids[index], {}))
+        # Score-cache hits are reported from the feed thread, judged rows from the event loop.
+        with checkpoint_lock:
+            if partial_results_path:
+                append_jsonl(partial_results_path, [result_row])
+        if sampler:
+            sampler.record(sample_ids[index], result_row)
+
+    metrics = build_ragas_metrics(metric_names)
+    judge_pool = judge_endpoint_pool(config)
+    run_config = RunConfig(timeout=600, max_retries=3, max_wait=30, max_workers=config.max_workers)
+    embeddings: OpenAICompatibleRagasEmbeddings | None = None
+    judge_ready = False
+
+    async def score_metric(metric: Any, metric_row: dict[str, Any]) -> float:
+        nonlocal embeddings, judge_ready
+        # Clients are built on the first job, so runs answered entirely from cache or checkpoint build none.
+        if not judge_ready:
+            llm, embeddings = build_judge(config, metrics, judge_pool, embedding_store_dir, usage)
+            prepare_ragas_metrics(metrics, llm, embeddings, run_config)
+            judge_ready = True
+        sample = dict(metric_row)
+        packed = packed_contexts.get(id(metric_row))
+        if packed and metric.name in packed.by_metric:
+            sample["retrieved_contexts"] = packed.by_metric[metric.name]
+        try:
+            with usage.job(metric.name, job_sample_ids.get(id(metric_row))):
+                return await metric.single_turn_ascore(SingleTurnSample(**sample), timeout=run_config.timeout)
+        except BaseException:
+            # A sampler waiting for this round would otherwise block the feed thread forever.
+            if sampler:
+                sampler.abort()
+            raise
+
+    print(
+        "running Ragas with "
+        f"provider={config.provider}, llm_model={config.llm_model}, "
+        f"embedding_model={config.embedding_model}, enable_thinking={config.enable_thinking}, "
+        f"max_workers={config.max_workers}, requests_per_second={config.requests_per_second or 'unlimited'}, "
+        f"metrics={','.join(metric.name for metric in metrics)}, context_packing={packing_label or 'off'}"
+    )
+    # Packing changes only the contexts the context metrics see, so it is part of their cache keys alone.
+    packing_identities = {name: context_packing.metric_label(name) for name in context_metrics} if context_packing else {}
+    score_cache = ScoreCache(score_cache_path, judge_cache_identity(config, version("ragas")), packing_identities) if score_cache_path else None
+    scoring_started = time.perf_counter()
+    try:
+        new_rows = evaluate_with_score_cache(
+            metric_jobs(),
+            metrics,
+            score_metric,
+            config.max_workers,
+            score_cache,
+            progress_every=normalize_batch_size(batch_size, DEFAULT_RAGAS_BATCH_SIZE),
+            on_scored=checkpoint,
+        )
+    finally:
+        if score_cache:
+            score_cache.close()
+    scoring_elapsed = time.perf_counter() - scoring_started
+    if streamed:
+        print_dataset_row_report(*classify_dataset_rows(received_rows))
+    if not eligible_rows:
+        raise SystemExit("no rows with responses are available for Ragas evaluation")
+    if resume_scoring and partial_results_path:
+        print(f"reused {len(scored_rows)}/{len(eligible_rows)} Ragas rows from {partial_results_path}")
+    if len(new_rows) != len(pending):
+        raise SystemExit(f"Ragas returned {len(new_rows)} rows for {len(pending)} evaluated rows; cannot preserve sample identity")
+    scored_rows.update((sample_ids[index], row) for index, row in zip(pending, new_rows))
+    # A live collection can finish rows out of order; results are always written in sample_id order.
+    order = sorted(range(len(sample_ids)), key=lambda index: sample_ids[index])
+    result_rows = [scored_rows[sample_ids[index]] for index in order]
+    for result_row, index in zip(result_rows, order):
+        label_result_row(result_row, eligible_rows[index], sample_ids[index])
+        # Rows answered from the score cache cost nothing; checkpointed rows keep the usage of the run that scored them.
+        for column, value in usage.row_columns(sample_ids[index]).items():
+            result_row.setdefault(column, value)
+    packing_summary = summarize_context_packing(list(packing_columns.values()), context_metrics) if context_packing else None
+    report_judge_usage(usage, config, scoring_elapsed, judge_usage_path, judge_pool, packing_summary)
+    if sampler:
+        report_sampling(sampler.finish(), len(dataset_rows), sampling_report_path)
+    if embeddings:
+        print(f"embedding requests: {embeddings.requests} (max {config.embedding_batch_size} texts each)", flush=True)
+        if embeddings.store:
+            store = embeddings.store
+            print(f"embedding store: hits={store.hits}, misses={store.misses} ({store.directory})", flush=True)
+    if judge_pool.throttled:
+        limits = ", ".join(str(endpoint.limiter.concurrency) for endpoint in judge_pool.endpoints)
+        print(f"judge returned HTTP 429 {judge_pool.throttled} times; final concurrency limit={limits}", flush=True)
+    return result_rows
+
+
+def report_judge_usage(
+    usage: JudgeUsage,
+    config: RagasModelConfig,
+    wall_seconds: float,
+    path: Path | None,
+    pool: EndpointPool | None = None,
+    context_packing: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    summary = {"llm_model": config.llm_model, "embedding_model": config.embedding_model, **usage.summary(wall_seconds)}
+    if context_packing:
+        summary["context_packing"] = context_packing
+    if pool:
+        summary["endpoints"] = pool.stats()
+        if len(pool.endpoints) > 1:
+            for endpoint in summary["endpoints"]:
+                print(
+                    f"judge endpoint {endpoint['base_url']} (key ...{endpoint['key_suffix']}): calls={endpoint['calls']}, "
+                    f"errors={endpoint['errors']}, cooldowns={endpoint['cooldowns']}, http_429={endpoint['throttled']}",
+                    flush=True,
+                )
+    totals = summary["totals"]
+    print(
+        f"judge usage: {totals['llm_calls']} LLM calls, {totals['prompt_tokens']} prompt + "
+        f"{totals['completion_tokens']} completion tokens, {totals['embedding_calls']} embedding calls, "
+        f"slowest metrics: {', '.join(summary['slowest_metrics'][:3]) or 'none'}",
+        flush=True,
+    )
+    if path:
+        write_json(path, summary)
+        print(f"saved judge usage summary: {path}", flush=True)
+    return summary
+
+
+def summarize_context_packing(rows: list[dict[str, Any]], metric_names: list[str]) -> dict[str, Any]:
+    # Token counts are estimates from context_packing.estimate_tokens, summed over every (row, context metric) job.
+    summary: dict[str, Any] = {
+        "label": rows[0]["context_packing"] if rows else "",
+        "rows": len(rows),
+        "duplicates_removed": sum(row["context_duplicates_removed"] for row in rows),
+        "metrics": {},
+    }
+    for name in metric_names:
+        original = sum(row["context_tokens"] for row in rows)
+        sent = sum(row[f"{name}_context_tokens"] for row in rows)
+        summary["metrics"][name] = {"context_tokens": original, "sent_tokens": sent, "saved_tokens": original - sent}
+        print(
+            f"context packing for {name}: {sent}/{original} estimated context tokens sent "
+            f"({(original - sent) / original if original else 0.0:.0%} saved)",
+            flush=True,
+        )
+    print(f"context packing removed {summary['duplicates_removed']} duplicate contexts from {len(rows)} rows", flush=True)
+    return summary
+
+
+def report_sampling(report: dict[str, Any], dataset_size: int, path: Path | None) -> None:
+    report["dataset_rows"] = dataset_size
+    print(
+        f"sequential sampling stopped ({report['stop_reason']}) after {report['rows_scored']}/{dataset_size} rows "
+        f"and {report['judge_llm_calls']} judge LLM calls",
+        flush=True,
+    )
+    for name, precision in report["achieved"].items():
+        if precision["ci_width"] is not None:
+            print(
+                f"  {name}: mean={precision['mean']:.4f}, 95% CI=[{precision['ci95_low']:.4f}, {precision['ci95_high']:.4f}], "
+                f"width={precision['ci_width']:.4f}, n={precision['n']}",
+                flush=True,
+            )
+    if path:
+        write_json(path, report)
+        print(f"saved sampling report: {path}", flush=True)
+
+
+def is_ragas_eligible(row: dict[str, Any]) -> bool:
+    return bool(row["response"]) and not row.get("error")
+
+
+def classify_dataset_rows(dataset_rows: list[dict[str, Any]]) -> tuple[list[tuple[int, dict[str, Any]]], list[int]]:
+    skipped_rows = [(idx, row) for idx, row in enumerate(dataset_rows, start=1) if not is_ragas_eligible(row)]
+    empty_context_rows = [
+        idx for idx, row in enumerate(dataset_rows, start=1) if is_ragas_eligible(row) and not row["retrieved_contexts"]
     ]
+    return skipped_rows, empty_context_rows
+
+
+def print_dataset_row_report(skipped_rows: list[tuple[int, dict[str, Any]]], empty_context_rows: list[int]) -> None:
     if skipped_rows:
         print(f"skipping {len(skipped_rows)} rows without response or with backend errors before Ragas evaluation:", flush=True)
         for idx, row in skipped_rows[:10]:
@@ -853,12 +1614,6 @@ def run_ragas(dataset_rows: list[dict[str, Any]], config: RagasModelConfig, batc
             print(f"  row {idx}: {reason}", flush=True)
         if len(skipped_rows) > 10:
             print(f"  ... {len(skipped_rows) - 10} more skipped rows", flush=True)
-
-    empty_context_rows = [
-        idx
-        for idx, row in enumerate(dataset_rows, start=1)
-        if row["response"] and not row.get("error") and not row["retrieved_contexts"]
-    ]
     if empty_context_rows:
         print(
             "including "
@@ -867,126 +1622,284 @@ def run_ragas(dataset_rows: list[dict[str, Any]], config: RagasModelConfig, batc
             flush=True,
         )
 
-    eligible_rows = [
-        row
-        for row in dataset_rows
-        if row["response"] and not row.get("error")
-    ]
-    metric_rows = [
-        {
-            "user_input": row["user_input"],
-            "response": row["response"],
-            "retrieved_contexts": row["retrieved_contexts"],
-            "reference": row["reference"],
-        }
-        for row in eligible_rows
-    ]
-    if not metric_rows:
-        raise SystemExit("no rows with responses are available for Ragas evaluation")
-    if ragas_limit > 0:
-        metric_rows = metric_rows[:ragas_limit]
-        eligible_rows = eligible_rows[:ragas_limit]
-
-    llm_client = AsyncOpenAI(
-        api_key=config.api_key,
-        base_url=config.base_url or None,
-        timeout=600,
-        max_retries=2,
-    )
-    embedding_client = AsyncOpenAI(
-        api_key=config.api_key,
-        base_url=config.base_url or None,
-        timeout=600,
-        max_retries=2,
+
+def label_result_row(result_row: dict[str, Any], source_row: dict[str, Any], sample_id: Any) -> None:
+    result_row["sample_id"] = sample_id
+    if source_row.get("platform"):
+        result_row["platform"] = source_row["platform"]
+
+
+def scoring_checkpoint_path(result_json_path: Path) -> Path:
+    return result_json_path.with_name(result_json_path.name.replace(".results.json", ".results.partial.jsonl"))
+
+
+def judge_usage_path(result_json_path: Path) -> Path:
+    return result_json_path.with_name(result_json_path.name.replace(".results.json", ".judge_usage.json"))
+
+
+def sampling_report_path(result_json_path: Path) -> Path:
+    return result_json_path.with_name(result_json_path.name.replace(".results.json", ".sampling.json"))
+
+
+def sampling_config_from_args(args: argparse.Namespace) -> SamplingConfig | None:
+    if args.target_ci_width <= 0 and args.judge_call_budget <= 0:
+        return None
+    return SamplingConfig(
+        target_ci_width=args.target_ci_width,
+        judge_call_budget=args.judge_call_budget,
+        round_size=args.sampling_round_size,
+        seed=args.sampling_seed,
     )
-    sync_embedding_client = OpenAI(
-        api_key=config.api_key,
-        base_url=config.base_url or None,
-        timeout=600,
-        max_retries=2,
+
+
+def parse_context_token_budget(value: str) -> PackingConfig:
+    try:
+        return parse_context_budgets(value, CONTEXT_METRICS)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def add_sampling_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--target-ci-width", type=float, default=0.0, help="Score rows in a seeded stratified order and stop once every metric's 95%% bootstrap CI is at most this wide. 0 disables.")
+    parser.add_argument("--judge-call-budget", type=int, default=0, help="Stop sequential sampling after the round in which this many judge LLM calls were made. 0 means no budget.")
+    parser.add_argument("--sampling-round-size", type=int, default=DEFAULT_SAMPLING_ROUND_SIZE, help="Rows scored between stopping checks. Default: %(default)s")
+    parser.add_argument("--sampling-seed", type=int, default=0, help="Seed for the sampling order; use the same seed for both platforms. Default: %(default)s")
+
+
+def validate_sampling_args(args: argparse.Namespace) -> None:
+    if args.target_ci_width < 0 or args.judge_call_budget < 0:
+        raise SystemExit("--target-ci-width and --judge-call-budget must be >= 0")
+    if args.sampling_round_size < 1:
+        raise SystemExit("--sampling-round-size must be >= 1")
+    if args.pipeline and (args.target_ci_width > 0 or args.judge_call_budget > 0):
+        raise SystemExit("sequential sampling cannot be combined with --pipeline")
+
+
+def load_scored_rows(path: Path) -> dict[Any, dict[str, Any]]:
+    return {row.get("sample_id"): row for row in read_jsonl(path)}
+
+
+def reusable_scored_row(
+    scored_row: dict[str, Any] | None,
+    metric_row: dict[str, Any],
+    metric_names: list[str] | None = None,
+) -> dict[str, Any] | None:
+    metric_names = metric_names or RAGAS_METRICS
+    # Rows scored against an older dataset or a different metric set are dropped so they are scored again.
+    if scored_row is None or any(scored_row.get(key) != value for key, value in metric_row.items()):
+        return None
+    if any(name not in scored_row for name in metric_names):
+        return None
+    return {key: value for key, value in scored_row.items() if key not in RAGAS_METRICS or key in metric_names}
+
+
+def evaluate_with_score_cache(
+    metric_rows: Iterable[dict[str, Any]],
+    metrics: list[Any],
+    score_metric: Callable[[Any, dict[str, Any]], Any],
+    max_workers: int,
+    score_cache: ScoreCache | None = None,
+    progress_every: int = DEFAULT_RAGAS_BATCH_SIZE,
+    on_scored: Callable[[int, dict[str, Any]], None] | None = None,
+) -> list[dict[str, Any]]:
+    metric_names = [metric.name for metric in metrics]
+    fed_rows: list[dict[str, Any]] = []
+    result_rows: list[dict[str, Any] | None] = []
+    judged: list[int] = []
+
+    def cache_misses() -> Iterator[dict[str, Any]]:
+        for metric_row in metric_rows:
+            scores = score_cache.lookup(metric_row, metric_names) if score_cache else None
+            fed_rows.append(metric_row)
+            result_rows.append(None if scores is None else {**metric_row, **scores})
+            if scores is None:
+                judged.append(len(fed_rows) - 1)
+                yield metric_row
+            elif on_scored:
+                on_scored(len(fed_rows) - 1, result_rows[-1])
+
+    print(f"Ragas evaluation started: {len(metrics)} metrics per row, max_workers={max_workers}", flush=True)
+    ragas_started = time.perf_counter()
+
+    reported = 0
+
+    def on_row(position: int, scores: dict[str, Any]) -> None:
+        nonlocal reported
+        index = judged[position]
+        result_rows[index] = {**fed_rows[index], **scores}
+        if score_cache:
+            score_cache.store(fed_rows[index], scores)
+        if on_scored:
+            on_scored(index, result_rows[index])
+        reported += 1
+        if reported % progress_every == 0:
+            elapsed = time.perf_counter() - ragas_started
+            print(f"Ragas progress: {reported} rows scored, {len(fed_rows)} received in {elapsed:.1f}s", flush=True)
+
+    asyncio.run(run_metric_jobs(cache_misses(), metrics, score_metric, max_workers, on_row))
+    ragas_elapsed = time.perf_counter() - ragas_started
+    if score_cache:
+        print(
+            f"Ragas score cache: hits={score_cache.hits}, misses={score_cache.misses} ({score_cache.path})",
+            flush=True,
+        )
+    print(
+        f"Ragas evaluation finished: {len(judged)} rows scored in {ragas_elapsed:.1f}s, "
+        f"{len(fed_rows) - len(judged)} rows from score cache",
+        flush=True,
     )
+    return [row for row in result_rows if row is not None]
+
+
+async def run_metric_jobs(
+    metric_rows: Iterable[dict[str, Any]],
+    metrics: list[Any],
+    score_metric: Callable[[Any, dict[str, Any]], Any],
+    max_workers: int,
+    on_row: Callable[[int, dict[str, Any]], None],
+) -> None:
+    # Every (row, metric) job shares one worker pool, so a slow row never holds back the rows after it.
+    workers = max(1, max_workers)
+    semaphore = asyncio.Semaphore(workers)
+    # Rows are pulled only while few are unfinished, so a live feed is read as fast as workers free up and no faster.
+    row_slots = asyncio.Semaphore(2 * workers)
+    loop = asyncio.get_running_loop()
+    feed = iter(metric_rows)
+    received: list[dict[str, Any]] = []
+    scores: list[dict[str, Any]] = []
+    failed = False
+
+    async def run_job(index: int, metric: Any) -> None:
+        nonlocal failed
+        try:
+            async with semaphore:
+                scores[index][metric.name] = await score_metric(metric, received[index])
+        except BaseException:
+            failed = True
+            row_slots.release()
+            raise
+        # Each row is reported and its slot freed as soon as its own jobs finish; a slow row holds only its own slot.
+        if len(scores[index]) == len(metrics):
+            on_row(index, {metric.name: scores[index][metric.name] for metric in metrics})
+            received[index] = scores[index] = {}
+            row_slots.release()
+
+    jobs: list[asyncio.Future[None]] = []
+    try:
+        while True:
+            await row_slots.acquire()
+            if failed:
+                break
+            # The feed may block on a live collection, so it is read off the event loop.
+            metric_row = await loop.run_in_executor(None, next, feed, None)
+            if metric_row is None:
+                break
+            received.append(metric_row)
+            scores.append({})
+            jobs.extend(asyncio.ensure_future(run_job(len(received) - 1, metric)) for metric in metrics)
+        await asyncio.gather(*jobs)
+    finally:
+        for job in jobs:
+            job.cancel()
+
+
+def prepare_ragas_metrics(metrics: list[Any], llm: Any, embeddings: Any, run_config: Any) -> None:
+    for metric in metrics:
+        if hasattr(metric, "llm") and metric.llm is None:
+            metric.llm = llm
+        if hasattr(metric, "embeddings") and metric.embeddings is None:
+            metric.embeddings = embeddings
+        metric.init(run_config)
+
+
+def judge_cache_identity(config: RagasModelConfig, ragas_version: str) -> dict[str, Any]:
+    # Only settings that can change a score belong here; keys, concurrency and rate limits do not.
+    return {
+        "provider": config.provider,
+        "base_url": config.base_url,
+        "llm_model": config.llm_model,
+        "embedding_model": config.embedding_model,
+        "enable_thinking": config.enable_thinking,
+        "ragas_version": ragas_version,
+    }
+
+
+def judge_endpoint_pool(config: RagasModelConfig) -> EndpointPool:
+    endpoints = config.endpoints or [JudgeEndpoint(config.base_url or DEFAULT_OPENAI_BASE_URL, config.api_key)]
+    return EndpointPool(endpoints, config.requests_per_second, max_concurrency=config.max_workers)
+
+
+def judge_http_client(pool: EndpointPool, is_async: bool) -> Any:
+    import openai
+
+    # openai applies its default connection limits only to transports it builds itself.
+    transport = pooled_httpx_transport(pool, pool.endpoints[0].base_url, is_async, openai.DEFAULT_CONNECTION_LIMITS)
+    client_class = openai.DefaultAsyncHttpxClient if is_async else openai.DefaultHttpxClient
+    return client_class(transport=transport)
+
+
+def build_judge(
+    config: RagasModelConfig,
+    metrics: list[Any],
+    pool: EndpointPool,
+    embedding_store_dir: Path | None = None,
+    usage: JudgeUsage | None = None,
+) -> tuple[Any, OpenAICompatibleRagasEmbeddings | None]:
+    from openai import AsyncOpenAI, OpenAI
+    from ragas.llms import llm_factory
+
+    # The clients target the first endpoint; the pooled transport reroutes each request to the endpoint it picks.
+    primary = pool.endpoints[0]
+    client_kwargs: dict[str, Any] = {"api_key": primary.api_key, "base_url": primary.base_url, "timeout": 600, "max_retries": 2}
+    llm_client = AsyncOpenAI(**client_kwargs, http_client=judge_http_client(pool, is_async=True))
+    if usage:
+        llm_client = instrument_chat_client(llm_client, usage)
     llm_kwargs: dict[str, Any] = {"temperature": 0, "max_tokens": 4096}
     if config.provider == "aliyun" and config.enable_thinking is not None:
         llm_kwargs["extra_body"] = {"enable_thinking": config.enable_thinking}
     llm = llm_factory(config.llm_model, provider="openai", client=llm_client, **llm_kwargs)
-    embeddings = OpenAICompatibleRagasEmbeddings(sync_embedding_client, embedding_client, config.embedding_model)
-    metrics = build_ragas_metrics()
-    print(
-        "running Ragas with "
-        f"provider={config.provider}, llm_model={config.llm_model}, "
-        f"embedding_model={config.embedding_model}, enable_thinking={config.enable_thinking}, "
-        f"max_workers={config.max_workers}"
+    if not any(metric.name in EMBEDDING_METRICS for metric in metrics):
+        return llm, None
+    embeddings = OpenAICompatibleRagasEmbeddings(
+        OpenAI(**client_kwargs, http_client=judge_http_client(pool, is_async=False)),
+        AsyncOpenAI(**client_kwargs, http_client=judge_http_client(pool, is_async=True)),
+        config.embedding_model,
+        store=EmbeddingStore(embedding_store_dir, config.embedding_model) if embedding_store_dir else None,
+        max_batch_size=config.embedding_batch_size,
+        usage=usage,
     )
-    batch_size = normalize_batch_size(batch_size, DEFAULT_RAGAS_BATCH_SIZE)
-    total = len(metric_rows)
-    print(f"Ragas evaluation started after dataset collection: {total} rows, batch_size={batch_size}", flush=True)
-    result_rows: list[dict[str, Any]] = []
-    ragas_started = time.perf_counter()
-    for start in range(0, total, batch_size):
-        batch = metric_rows[start : start + batch_size]
-        end = start + len(batch)
-        batch_started = time.perf_counter()
-        print(f"Ragas batch {start + 1}-{end}/{total} started", flush=True)
-        batch_result = evaluate_ragas_batch(batch, metrics, llm, embeddings, config.max_workers)
-        result_rows.extend(ragas_result_to_rows(batch_result))
-        batch_elapsed = time.perf_counter() - batch_started
-        print(f"Ragas batch {start + 1}-{end}/{total} finished in {batch_elapsed:.1f}s", flush=True)
-    ragas_elapsed = time.perf_counter() - ragas_started
-    if len(result_rows) != len(eligible_rows):
-        raise SystemExit(
-            f"Ragas returned {len(result_rows)} rows for {len(eligible_rows)} evaluated rows; cannot preserve sample identity"
-        )
-    for fallback_id, (result_row, source_row) in enumerate(zip(result_rows, eligible_rows), start=1):
-        result_row["sample_id"] = source_row.get("sample_id", fallback_id)
-        if source_row.get("platform"):
-            result_row["platform"] = source_row["platform"]
-    print(f"Ragas evaluation finished: {len(result_rows)}/{total} in {ragas_elapsed:.1f}s", flush=True)
-    return result_rows
+    return llm, embeddings
+
+
+def parse_metric_names(value: str) -> list[str]:
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(names - set(RAGAS_METRICS))
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown metrics: {', '.join(unknown)}; choose from {', '.join(RAGAS_METRICS)}")
+    if not names:
+        raise argparse.ArgumentTypeError("at least one metric is required")
+    return [name for name in RAGAS_METRICS if name in names]
 
 
-def build_ragas_metrics() -> list[Any]:
+def build_ragas_metrics(metric_names: list[str] | None = None) -> list[Any]:
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", DeprecationWarning)
         from ragas.metrics import answer_correctness, answer_relevancy, context_precision, context_recall, faithfulness
 
-    metrics = copy.deepcopy([faithfulness, answer_relevancy, context_precision, context_recall, answer_correctness])
+    available = {
+        "faithfulness": faithfulness,
+        "answer_relevancy": answer_relevancy,
+        "context_precision": context_precision,
+        "context_recall": context_recall,
+        "answer_correctness": answer_correctness,
+    }
+    metrics = copy.deepcopy([available[name] for name in metric_names or RAGAS_METRICS])
     for metric in metrics:
         if getattr(metric, "name", "") == "answer_relevancy" and hasattr(metric, "strictness"):
             metric.strictness = 1
     return metrics
 
 
-def evaluate_ragas_batch(metric_rows: list[dict[str, Any]], metrics: list[Any], llm: Any, embeddings: Any, max_workers: int) -> Any:
-    from ragas import EvaluationDataset, evaluate
-    from ragas.run_config import RunConfig
-
-    run_config = RunConfig(timeout=600, max_retries=3, max_wait=30, max_workers=max_workers)
-
-    try:
-        dataset = EvaluationDataset.from_list(metric_rows)
-        return evaluate(dataset=dataset, metrics=metrics, llm=llm, embeddings=embeddings, run_config=run_config, raise_exceptions=True)
-    except TypeError:
-        from datasets import Dataset
-
-        return evaluate(Dataset.from_list(metric_rows), metrics=metrics, llm=llm, embeddings=embeddings, run_config=run_config, raise_exceptions=True)
-
-
-def ragas_result_to_rows(results: Any) -> list[dict[str, Any]]:
-    if hasattr(results, "to_pandas"):
-        return results.to_pandas().to_dict(orient="records")
-    if isinstance(results, list):
-        return results
-    if isinstance(results, dict):
-        return [results]
-    if hasattr(results, "to_dict"):
-        data = results.to_dict()
-        if isinstance(data, list):
-            return data
-        if isinstance(data, dict):
-            return [data]
-    return [{"result": str(results)}]
-
-
 def normalize_batch_size(value: int, default: int) -> int:
     if value <= 0:
         return default
@@ -1012,6 +1925,13 @@ def write_json(path: Path, data: Any) -> None:
     path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
+def write_json_atomically(path: Path, data: Any) -> None:
+    # Checkpoints are rewritten while a run can be interrupted; the rename never leaves a truncated file to resume from.
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    write_json(temporary, data)
+    os.replace(temporary, path)
+
+
 def write_csv(path: Path, rows: list[dict[str, Any]]) -> None:
     if not rows:
         path.write_text("", encoding="utf-8")
@@ -1023,12 +1943,5 @@ def write_csv(path: Path, rows: list[dict[str, Any]]) -> None:
         writer.writerows(rows)
 
 
-class HTTPStatusError(RuntimeError):
-    def __init__(self, status: int, body: str) -> None:
-        super().__init__(f"HTTP {status}: {body}")
-        self.status = status
-        self.body = body
-
-
 if __name__ == "__main__":
     raise SystemExit(main())
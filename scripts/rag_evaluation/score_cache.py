@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""SQLite cache of Ragas judge scores keyed by a hash of the scored inputs and judge config."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+CACHE_SCHEMA_VERSION = 1
+CACHED_INPUT_KEYS = ["user_input", "response", "retrieved_contexts", "reference"]
+
+
+class ScoreCache:
+    """One score per (row inputs, metric, judge); safe to share between concurrent evaluator processes."""
+
+    def __init__(self, path: Path, judge_identity: dict[str, Any], metric_identities: dict[str, Any] | None = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.judge_key = canonical_json(judge_identity)
+        # Settings that change only some metrics' inputs, so the other metrics keep their cached scores.
+        self.metric_identities = metric_identities or {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, metric TEXT NOT NULL, score REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def key(self, metric_row: dict[str, Any], metric: str) -> str:
+        inputs = {name: metric_row.get(name) for name in CACHED_INPUT_KEYS}
+        parts = {"schema": CACHE_SCHEMA_VERSION, "judge": self.judge_key, "metric": metric, "inputs": inputs}
+        if metric in self.metric_identities:
+            parts["metric_identity"] = self.metric_identities[metric]
+        material = canonical_json(parts)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, metric_row: dict[str, Any], metrics: list[str]) -> dict[str, float] | None:
+        keys = {self.key(metric_row, metric): metric for metric in metrics}
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            found = self._connection.execute(f"SELECT key, score FROM scores WHERE key IN ({placeholders})", list(keys)).fetchall()
+        scores = {keys[key]: score for key, score in found}
+        if len(scores) != len(metrics):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {metric: scores[metric] for metric in metrics}
+
+    def store(self, metric_row: dict[str, Any], scores: dict[str, Any]) -> None:
+        now = time.time()
+        values = [
+            (self.key(metric_row, metric), metric, float(score), now)
+            for metric, score in scores.items()
+            if is_cacheable_score(score)
+        ]
+        if not values:
+            return
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO scores (key, metric, score, created_at) VALUES (?, ?, ?, ?)", values)
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def is_cacheable_score(value: Any) -> bool:
+    # NaN means the judge failed for that metric; leave it uncached so the next run retries it.
+    try:
+        return not math.isnan(float(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
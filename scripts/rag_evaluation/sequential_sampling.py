@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Sequential Ragas sampling: score rows in a seeded stratified order until every metric's CI is narrow enough."""
+
+from __future__ import annotations
+
+import bisect
+import math
+import random
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+
+DEFAULT_ROUND_SIZE = 50
+DEFAULT_BOOTSTRAP_SAMPLES = 1000
+DEFAULT_STRATA = 4
+
+
+@dataclass
+class SamplingConfig:
+    target_ci_width: float = 0.0
+    judge_call_budget: int = 0
+    round_size: int = DEFAULT_ROUND_SIZE
+    seed: int = 0
+    bootstrap_samples: int = DEFAULT_BOOTSTRAP_SAMPLES
+
+
+class SequentialSampler:
+    """Admits rows one round at a time; between rounds it waits for the round's scores and applies the stopping rule."""
+
+    def __init__(self, config: SamplingConfig, metric_names: list[str], judge_calls: Callable[[], int]) -> None:
+        self.config = config
+        self.metric_names = metric_names
+        self.judge_calls = judge_calls
+        self.rounds: list[dict[str, Any]] = []
+        self.stop_reason = ""
+        self._scores: dict[Any, dict[str, float]] = {}
+        self._order: list[Any] = []
+        self._admitted = 0
+        self._aborted = False
+        self._condition = threading.Condition()
+
+    def admit(self) -> bool:
+        with self._condition:
+            if self.stop_reason:
+                return False
+            if self._admitted and self._admitted % self.config.round_size == 0:
+                # Called from the row feed, which runs off the event loop, so waiting here does not stall scoring.
+                self._condition.wait_for(lambda: self._aborted or len(self._scores) >= self._admitted)
+                if self._aborted:
+                    self.stop_reason = "aborted"
+                    return False
+                self._close_round()
+                if self.stop_reason:
+                    return False
+            self._admitted += 1
+            return True
+
+    def record(self, sample_id: Any, result_row: dict[str, Any]) -> None:
+        with self._condition:
+            if sample_id not in self._scores:
+                self._order.append(sample_id)
+            self._scores[sample_id] = {name: result_row.get(name) for name in self.metric_names}
+            self._condition.notify_all()
+
+    def abort(self) -> None:
+        with self._condition:
+            self._aborted = True
+            self._condition.notify_all()
+
+    def finish(self) -> dict[str, Any]:
+        with self._condition:
+            if not self.stop_reason:
+                if not self.rounds or self.rounds[-1]["rows"] != len(self._scores):
+                    self._close_round()
+                self.stop_reason = self.stop_reason or "rows_exhausted"
+            return self.report()
+
+    def report(self) -> dict[str, Any]:
+        return {
+            **asdict(self.config),
+            "stop_reason": self.stop_reason,
+            "rows_scored": len(self._scores),
+            "judge_llm_calls": self.judge_calls(),
+            "achieved": self.rounds[-1]["metrics"] if self.rounds else {},
+            "rounds": self.rounds,
+            "scored_sample_ids": list(self._order),
+        }
+
+    def _close_round(self) -> None:
+        metrics = {name: metric_precision([row.get(name) for row in self._scores.values()], self.config.bootstrap_samples) for name in self.metric_names}
+        calls = self.judge_calls()
+        self.rounds.append({"round": len(self.rounds) + 1, "rows": len(self._scores), "judge_llm_calls": calls, "metrics": metrics})
+        widths = [metric["ci_width"] for metric in metrics.values()]
+        widest = None if None in widths or not widths else max(widths)
+        print(
+            f"sampling round {len(self.rounds)}: {len(self._scores)} rows, {calls} judge LLM calls, "
+            f"widest 95% CI={'N/A' if widest is None else f'{widest:.4f}'}",
+            flush=True,
+        )
+        target = self.config.target_ci_width
+        if target > 0 and widest is not None and widest <= target:
+            self.stop_reason = "target_ci_width"
+        elif self.config.judge_call_budget > 0 and calls >= self.config.judge_call_budget:
+            self.stop_reason = "judge_call_budget"
+
+
+def metric_precision(values: list[Any], bootstrap_samples: int) -> dict[str, Any]:
+    # Imported here because compare_rag_eval imports run_ragas_eval, which imports this module.
+    from compare_rag_eval import bootstrap_mean_ci
+
+    finite = [float(value) for value in values if is_finite_score(value)]
+    if len(finite) < 2:
+        return {"n": len(finite), "mean": None, "ci95_low": None, "ci95_high": None, "ci_width": None}
+    low, high = bootstrap_mean_ci(finite, bootstrap_samples)
+    return {"n": len(finite), "mean": sum(finite) / len(finite), "ci95_low": low, "ci95_high": high, "ci_width": high - low}
+
+
+def is_finite_score(value: Any) -> bool:
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def stratified_order(rows: list[dict[str, Any]], seed: int, strata: int = DEFAULT_STRATA) -> list[int]:
+    """Indexes of ``rows`` in a seeded order whose every prefix holds each reference-length stratum proportionally.
+
+    Only the QA reference is used, so Dify and ZGI datasets built from one input file get the same order.
+    """
+    if not rows:
+        return []
+    lengths = [len(str(row.get("reference") or "")) for row in rows]
+    ordered = sorted(lengths)
+    cuts = [ordered[len(ordered) * step // strata] for step in range(1, strata)]
+    groups: dict[int, list[int]] = {}
+    for index, length in enumerate(lengths):
+        groups.setdefault(bisect.bisect_right(cuts, length), []).append(index)
+    rng = random.Random(seed)
+    keyed: list[tuple[float, int, int]] = []
+    for stratum, members in sorted(groups.items()):
+        rng.shuffle(members)
+        # Spreading each stratum evenly over [0, 1) with jitter interleaves the strata at every prefix length.
+        keyed.extend(((rank + rng.random()) / len(members), stratum, index) for rank, index in enumerate(members))
+    return [index for _, _, index in sorted(keyed)]
@@ -8,11 +8,11 @@ import json
 import os
 import time
 import urllib.error
-import urllib.parse
-import urllib.request
 from pathlib import Path
 from typing import Any
 
+import http_transport
+
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 ENV_FILE = SCRIPT_DIR / ".env"
@@ -34,8 +34,8 @@ def main() -> int:
         )
 
     response_mode = args.response_mode.strip().lower()
-    if response_mode != "blocking":
-        raise SystemExit("This smoke-test script currently supports DIFY_RESPONSE_MODE=blocking only.")
+    if response_mode not in {"blocking", "streaming"}:
+        raise SystemExit("This smoke-test script supports DIFY_RESPONSE_MODE=blocking or streaming.")
 
     base_url = args.base_url.strip().rstrip("/")
     endpoint = f"{base_url}/chat-messages"
@@ -49,7 +49,10 @@ def main() -> int:
 
     print(f"Sending question to Dify: {args.question}", flush=True)
     started = time.perf_counter()
-    data = post_json(endpoint, payload, api_key, args.timeout)
+    if response_mode == "streaming":
+        data = post_streaming(endpoint, payload, api_key, args.timeout)
+    else:
+        data = post_json(endpoint, payload, api_key, args.timeout)
     elapsed = time.perf_counter() - started
 
     answer = data.get("answer")
@@ -59,6 +62,13 @@ def main() -> int:
     print("\nAnswer:")
     print(answer)
     print(f"\nEnd-to-end latency: {elapsed:.3f}s")
+    stream_timing = data.get("stream_timing")
+    if isinstance(stream_timing, dict):
+        print(f"Time to first token: {format_seconds(stream_timing.get('ttft_seconds'))}")
+        print(
+            f"Stream chunks: {stream_timing.get('stream_chunks', 0)}, "
+            f"mean inter-token gap: {format_seconds(stream_timing.get('inter_token_gap_mean_seconds'))}"
+        )
 
     metadata = data.get("metadata")
     metadata = metadata if isinstance(metadata, dict) else {}
@@ -119,27 +129,12 @@ def env_value(env_values: dict[str, str], key: str, default: str = "") -> str:
 
 
 def post_json(url: str, payload: dict[str, Any], api_key: str, timeout: float) -> dict[str, Any]:
-    request = urllib.request.Request(
-        url,
-        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
-    opener = urllib.request.build_opener(urllib.request.ProxyHandler({})) if is_local_url(url) else urllib.request.build_opener()
     try:
-        with opener.open(request, timeout=timeout) as response:
-            raw = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise SystemExit(f"Dify returned HTTP {exc.code}: {detail}") from exc
+        data = http_transport.post_json(url, payload, token=api_key, timeout=timeout)
+    except http_transport.HTTPStatusError as exc:
+        raise SystemExit(f"Dify returned HTTP {exc.status}: {exc.body}") from exc
     except urllib.error.URLError as exc:
         raise SystemExit(f"Cannot connect to Dify at {url}: {exc}") from exc
-
-    try:
-        data = json.loads(raw)
     except json.JSONDecodeError as exc:
         raise SystemExit("Dify returned a response that is not valid JSON.") from exc
     if not isinstance(data, dict):
@@ -147,9 +142,19 @@ def post_json(url: str, payload: dict[str, Any], api_key: str, timeout: float) -
     return data
 
 
-def is_local_url(url: str) -> bool:
-    hostname = urllib.parse.urlparse(url).hostname or ""
-    return hostname in {"localhost", "127.0.0.1", "::1"}
+def post_streaming(url: str, payload: dict[str, Any], api_key: str, timeout: float) -> dict[str, Any]:
+    import run_dify_eval
+
+    try:
+        return run_dify_eval.stream_chat_message(url, payload, api_key, timeout)
+    except http_transport.HTTPStatusError as exc:
+        raise SystemExit(f"Dify returned HTTP {exc.status}: {exc.body}") from exc
+    except urllib.error.URLError as exc:
+        raise SystemExit(f"Cannot connect to Dify at {url}: {exc}") from exc
+
+
+def format_seconds(value: Any) -> str:
+    return "N/A" if value is None else f"{float(value):.3f}s"
 
 
 if __name__ == "__main__":
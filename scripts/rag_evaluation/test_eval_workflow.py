@@ -3,12 +3,52 @@
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 import compare_rag_eval
+import context_packing
+import embedding_store
+import fake_rag_server
+import http_transport
+import input_cache
+import judge_pool
+import judge_usage
+import load_test_rag_eval
+import offline_metrics
 import run_dify_eval
 import run_ragas_eval
+import score_cache
+import sequential_sampling
+import test_llm_latency
 
 
 class EvaluationWorkflowTest(unittest.TestCase):
@@ -25,6 +65,63 @@ class EvaluationWorkflowTest(unittest.TestCase):
         self.assertEqual(zgi_paths[2].parent, run_ragas_eval.RESULT_DIR)
         self.assertEqual(len(set(dify_paths + zgi_paths)), 6)
 
+    @unittest.skipUnless(openpyxl, "openpyxl is required to write the test workbook")
+    def test_input_reader_sniffs_xlsx_content_and_stops_at_the_limit(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            workbook = openpyxl.Workbook()
+            workbook.active.append(["问题", "答案"])
+            for index in range(1, 501):
+                workbook.active.append([f"question-{index}", "" if index == 2 else f"ref-{index}"])
+            # Saved under the legacy extension on purpose; the reader must go by the file's content.
+            path = Path(tmp) / "qa.xls"
+            workbook.save(path)
+            consumed: list[list[object]] = []
+            stream = run_ragas_eval.read_input_rows
+
+            def counted(input_path: Path):
+                for row in stream(input_path):
+                    consumed.append(row)
+                    yield row
+
+            with mock.patch.object(run_ragas_eval, "read_input_rows", counted):
+                items = run_ragas_eval.read_qa_items(path, 3)
+
+        self.assertEqual([item.question for item in items], ["question-1", "question-3", "question-4"])
+        self.assertEqual(len(consumed), 5)
+
+    def test_parsed_input_cache_is_reused_until_the_file_content_changes(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "qa.csv"
+            path.write_text("question,answer\nq1,r1\nq2,r2\nq3,r3\n", encoding="utf-8")
+            cache_path = Path(tmp) / "qa.qa_items.jsonl"
+
+            def read(limit: int) -> list[str]:
+                return [item.question for item in run_ragas_eval.read_qa_items(path, limit, cache_path)]
+
+            parse_rows = mock.patch.object(run_ragas_eval, "read_input_rows", wraps=run_ragas_eval.read_input_rows)
+            with parse_rows as parse, mock.patch.object(input_cache, "file_sha256", wraps=input_cache.file_sha256) as digest:
+                self.assertEqual(read(2), ["q1", "q2"])
+                self.assertEqual(input_cache.cache_status(cache_path, path), "cached: first 2 pairs")
+                self.assertEqual(read(1), ["q1"])
+                self.assertEqual(parse.call_count, 1)
+                self.assertEqual(read(0), ["q1", "q2", "q3"])
+                self.assertEqual(parse.call_count, 2)
+                self.assertEqual(digest.call_count, 1)
+                # Same bytes with a new mtime is still a hit, and the refreshed header makes the listing show it.
+                os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+                self.assertEqual(read(0), ["q1", "q2", "q3"])
+                self.assertEqual(input_cache.cache_status(cache_path, path), "cached")
+                self.assertEqual(digest.call_count, 2)
+                path.write_text("question,answer\nq1,r1\nq2,changed\nq3,r3\n", encoding="utf-8")
+                self.assertEqual(read(0), ["q1", "q2", "q3"])
+                self.assertEqual(parse.call_count, 3)
+                # A size change is a miss without hashing first; the hash is taken once, after the parse.
+                self.assertEqual(digest.call_count, 3)
+                path.write_text("question,answer\nq1,r1\nq2,chang3\nq3,r3\n", encoding="utf-8")
+                os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 2 * 10**9))
+                self.assertEqual(read(0), ["q1", "q2", "q3"])
+                self.assertEqual(parse.call_count, 4)
+
     def test_dify_response_is_normalized_for_ragas(self) -> None:
         qa = run_ragas_eval.QAItem(question="退号流程", reference="费用原路退回")
         response = {
@@ -77,6 +174,827 @@ class EvaluationWorkflowTest(unittest.TestCase):
         self.assertAlmostEqual(summary["mean_delta"], 0.3)
         self.assertEqual(summary["dify_wins"], 1)
 
+    def test_composite_uses_only_metrics_scored_on_both_platforms(self) -> None:
+        dify = {1: {**result_row(1, 0.8), "context_recall": 0.6}}
+        zgi = {1: {**result_row(1, 0.4), "context_recall": 0.2}}
+        for metric in ["answer_relevancy", "context_precision", "answer_correctness"]:
+            del dify[1][metric], zgi[1][metric]
+        del zgi[1]["faithfulness"]
+
+        metrics = compare_rag_eval.compared_metrics(dify, zgi)
+        rows = compare_rag_eval.build_comparison_rows(dify, zgi, 0.01, metrics)
+
+        self.assertEqual(metrics, ["context_recall"])
+        self.assertAlmostEqual(rows[0]["composite_score_delta"], 0.4)
+        self.assertNotIn("dify_faithfulness", rows[0])
+        self.assertEqual(run_ragas_eval.parse_metric_names("context_recall, faithfulness"), ["faithfulness", "context_recall"])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            run_ragas_eval.parse_metric_names("recall")
+
+    def test_concurrent_backend_batches_keep_question_order(self) -> None:
+        questions = [f"question-{index}" for index in range(1, 8)]
+
+        def fake_batch(base_url, token, knowledge_base_name, batch, *args):
+            time.sleep(0.05 if batch[0] == "question-1" else 0.0)
+            return [{"user_input": question, "response": f"answer-{question}"} for question in batch]
+
+        with mock.patch.object(run_ragas_eval, "call_rag_evaluation_batch", side_effect=fake_batch):
+            items = run_ragas_eval.call_rag_evaluation(
+                "http://127.0.0.1", "token", "kb", questions, 10, 0.35, "hybrid", "", batch_size=2, concurrency=3
+            )
+
+        self.assertEqual([item["user_input"] for item in items], questions)
+
+    def test_failed_backend_batch_still_checkpoints_finished_batches(self) -> None:
+        questions = [f"question-{index}" for index in range(1, 5)]
+        checkpointed: list[int] = []
+
+        def fake_batch(base_url, token, knowledge_base_name, batch, *args):
+            if batch[0] == "question-1":
+                raise run_ragas_eval.HTTPStatusError(500, "boom")
+            return [{"user_input": question} for question in batch]
+
+        with mock.patch.object(run_ragas_eval, "call_rag_evaluation_batch", side_effect=fake_batch):
+            with self.assertRaises(run_ragas_eval.HTTPStatusError):
+                run_ragas_eval.call_rag_evaluation(
+                    "http://127.0.0.1", "token", "kb", questions, 10, 0.35, "hybrid", "",
+                    batch_size=2, concurrency=2, on_batch=lambda start, items: checkpointed.append(start),
+                )
+
+        self.assertEqual(checkpointed, [2])
+
+    def test_partial_checkpoint_skips_errors_and_truncated_lines(self) -> None:
+        qa_items = [run_ragas_eval.QAItem(question=f"question-{index}", reference="ref") for index in range(1, 4)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "example.zgi.ragas.dataset.partial.jsonl"
+            run_ragas_eval.append_jsonl(
+                path,
+                [
+                    {"sample_id": 1, "user_input": "question-1", "response": "ok", "error": ""},
+                    {"sample_id": 2, "user_input": "question-2", "response": "", "error": "timeout"},
+                ],
+            )
+            with path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({"sample_id": 3, "user_input": "question-3"})[:20])
+
+            rows = run_ragas_eval.load_partial_rows(path, qa_items)
+
+        self.assertEqual(sorted(rows), [1])
+
+    def test_dify_resume_skips_successful_rows_and_merges_in_order(self) -> None:
+        qa_items = [run_ragas_eval.QAItem(question=f"question-{index}", reference="ref") for index in range(1, 5)]
+        previous = [
+            run_dify_eval.build_dify_row(1, qa_items[0], {"answer": "cached"}, 1.0),
+            run_dify_eval.error_row(2, qa_items[1], 1.0, "HTTP 502: bad gateway"),
+        ]
+        sent: list[tuple[str, str]] = []
+
+        def fake_post(url, payload, api_key, max_retries, limiter=None):
+            sent.append((payload["query"], payload["user"]))
+            return {"answer": f"answer-{payload['query']}"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            partial_path = Path(tmp) / "example.dify.ragas.dataset.partial.json"
+            run_ragas_eval.write_json(partial_path, previous)
+            with mock.patch.object(run_dify_eval, "post_with_retries", side_effect=fake_post):
+                rows = run_dify_eval.collect_dify_rows(
+                    qa_items, "http://127.0.0.1/v1/chat-messages", "app-key", "rag-eval", "blocking", 0,
+                    partial_path, concurrency=2, resume=True,
+                )
+            saved = run_ragas_eval.load_existing_dataset(partial_path)
+            leftovers = [path.name for path in Path(tmp).iterdir() if path != partial_path]
+
+        self.assertEqual([row["sample_id"] for row in rows], [1, 2, 3, 4])
+        self.assertEqual(rows[0]["response"], "cached")
+        self.assertEqual(sorted(query for query, _ in sent), ["question-2", "question-3", "question-4"])
+        self.assertTrue(all(user.rsplit("-", 1)[1] in {"w1", "w2"} for _, user in sent))
+        self.assertEqual([row["sample_id"] for row in saved], [1, 2, 3, 4])
+        self.assertEqual(leftovers, [])
+
+    def test_dify_stream_is_assembled_with_first_token_timing(self) -> None:
+        events = [
+            {"event": "ping"},
+            {"event": "message", "answer": "费用", "message_id": "message-1", "conversation_id": "conversation-1"},
+            {"event": "message", "answer": "原路退回"},
+            {"event": "message_end", "metadata": {"retriever_resources": [{"content": "门诊退号"}], "usage": {"total_tokens": 9}}},
+        ]
+        qa = run_ragas_eval.QAItem(question="退号流程", reference="费用原路退回")
+
+        with mock.patch.object(run_ragas_eval, "post_sse", return_value=iter(events)):
+            data = run_dify_eval.stream_chat_message("http://127.0.0.1/v1/chat-messages", {}, "app-key")
+        row = run_dify_eval.build_dify_row(1, qa, data, 1.0)
+
+        self.assertEqual(row["response"], "费用原路退回")
+        self.assertEqual(row["retrieved_contexts"], ["门诊退号"])
+        self.assertEqual(row["message_id"], "message-1")
+        self.assertEqual(row["stream_chunks"], 2)
+        self.assertIsNotNone(row["ttft_seconds"])
+        self.assertLessEqual(row["ttft_seconds"], row["stream_seconds"])
+
+    def test_dify_stream_cut_mid_answer_is_retried_then_recorded_as_error(self) -> None:
+        calls: list[int] = []
+
+        def broken_stream(*args, **kwargs):
+            calls.append(1)
+            yield {"event": "message", "answer": "费用"}
+            raise urllib.error.URLError(TimeoutError("timed out"))
+
+        qa = run_ragas_eval.QAItem(question="退号流程", reference="费用原路退回")
+        with mock.patch.object(run_ragas_eval, "post_sse", side_effect=broken_stream), mock.patch.object(http_transport, "backoff_delay", return_value=0):
+            row = run_dify_eval.collect_dify_row(1, qa, "http://127.0.0.1/v1/chat-messages", "app-key", "user", "streaming", 1)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(row["status"], "error")
+        self.assertIn("timed out", row["error"])
+
+    def test_adaptive_batch_size_grows_when_flat_and_halves_on_failure(self) -> None:
+        sizer = run_ragas_eval.AdaptiveBatchSizer(10, increase=2)
+
+        sizer.record_success(10, 10.0)
+        sizer.record_success(12, 12.5)
+        self.assertEqual(sizer.size, 14)
+        sizer.record_success(14, 28.0)
+        self.assertEqual(sizer.size, 12)
+        sizer.record_failure()
+        self.assertEqual(sizer.size, 6)
+
+    def test_adaptive_collection_retries_overloaded_batch_smaller(self) -> None:
+        questions = [f"question-{index}" for index in range(1, 9)]
+        sizes: list[int] = []
+
+        def fake_batch(base_url, token, knowledge_base_name, batch, *args):
+            sizes.append(len(batch))
+            if len(sizes) == 1:
+                raise run_ragas_eval.HTTPStatusError(502, "bad gateway")
+            return [{"user_input": question} for question in batch]
+
+        with mock.patch.object(run_ragas_eval, "call_rag_evaluation_batch", side_effect=fake_batch):
+            items = run_ragas_eval.call_rag_evaluation(
+                "http://127.0.0.1", "token", "kb", questions, 10, 0.35, "hybrid", "", batch_size=8, adaptive=True
+            )
+
+        self.assertEqual(sizes[:2], [8, 4])
+        self.assertEqual([item["user_input"] for item in items], questions)
+
+    def test_zgi_rows_keep_server_timing_and_split_stage_latency(self) -> None:
+        qa = run_ragas_eval.QAItem(question="退号流程", reference="费用原路退回")
+        item = {
+            "response": "费用原路退回",
+            "retrieved_contexts": ["门诊退号"],
+            "retriever_resources": [{"content": "门诊退号", "score": 0.9}],
+            "status": "success",
+            "retrieval_ms": 400,
+            "generation_ms": 1500,
+            "usage": {"total_tokens": 120},
+            "client_latency_seconds": 2.0,
+        }
+
+        row = run_ragas_eval.build_ragas_row(3, qa, item)
+        stages = compare_rag_eval.summarize_latency_stages([row])
+
+        self.assertEqual(row["latency_seconds"], 2.0)
+        self.assertEqual(row["usage"]["total_tokens"], 120)
+        self.assertEqual(len(row["retrieval_resources"]), 1)
+        self.assertAlmostEqual(stages["retrieval"]["mean_seconds"], 0.4)
+        self.assertAlmostEqual(stages["generation"]["mean_seconds"], 1.5)
+        self.assertAlmostEqual(stages["other"]["mean_seconds"], 0.1)
+
+
+class ScoreCacheTest(unittest.TestCase):
+    def test_second_run_scores_only_changed_rows(self) -> None:
+        rows = [
+            {"user_input": f"q{index}", "response": "a", "retrieved_contexts": ["c"], "reference": "r"}
+            for index in range(3)
+        ]
+        judged: list[str] = []
+
+        async def score_metric(metric: SimpleNamespace, row: dict[str, object]) -> float:
+            if metric.name == "faithfulness":
+                judged.append(str(row["user_input"]))
+                return 0.5
+            return float("nan")
+
+        metrics = [SimpleNamespace(name="faithfulness"), SimpleNamespace(name="answer_relevancy")]
+        metric_names = ["faithfulness", "answer_relevancy"]
+        identity = {"llm_model": "judge-a"}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "scores.sqlite3"
+            cache = score_cache.ScoreCache(path, identity)
+            run_ragas_eval.evaluate_with_score_cache(rows, metrics, score_metric, 2, cache)
+            cache.store(rows[0], {"answer_relevancy": 0.9})
+            cache.close()
+
+            rows[2] = {**rows[2], "response": "changed"}
+            judged.clear()
+            cache = score_cache.ScoreCache(path, identity)
+            results = run_ragas_eval.evaluate_with_score_cache(rows, metrics, score_metric, 2, cache)
+            hits, misses = cache.hits, cache.misses
+            cache.close()
+
+            other_judge = score_cache.ScoreCache(path, {"llm_model": "judge-b"})
+            self.assertIsNone(other_judge.lookup(rows[0], metric_names))
+            other_judge.close()
+
+            packed = score_cache.ScoreCache(path, identity, {"faithfulness": "dedup=0.9;budget=100"})
+            self.assertEqual(packed.lookup(rows[0], ["answer_relevancy"]), {"answer_relevancy": 0.9})
+            self.assertIsNone(packed.lookup(rows[0], ["faithfulness"]))
+            packed.close()
+
+        self.assertEqual((hits, misses), (1, 2))
+        self.assertEqual(judged, ["q1", "q2"])
+        self.assertEqual(results[0], {**rows[0], "faithfulness": 0.5, "answer_relevancy": 0.9})
+        self.assertEqual([row["user_input"] for row in results], ["q0", "q1", "q2"])
+
+    def test_metric_jobs_share_one_pool_without_batch_barriers(self) -> None:
+        # More rows than the 2 * workers intake slots, so a slow first row must not hold the slots of finished rows.
+        rows = [{"user_input": f"q{index}"} for index in range(12)]
+        metrics = [SimpleNamespace(name="faithfulness"), SimpleNamespace(name="answer_relevancy")]
+        events: list[str] = []
+
+        async def score_metric(metric: SimpleNamespace, row: dict[str, object]) -> float:
+            await asyncio.sleep(0.5 if row["user_input"] == "q0" and metric.name == "faithfulness" else 0.01)
+            events.append(f"{row['user_input']} {metric.name}")
+            return 1.0
+
+        reported: list[int] = []
+        asyncio.run(run_ragas_eval.run_metric_jobs(rows, metrics, score_metric, 3, lambda position, scores: reported.append(position)))
+
+        self.assertEqual(sorted(reported), list(range(12)))
+        self.assertEqual(reported[-1], 0)
+        # The slow q0 job holds one worker while the other two work through every remaining row.
+        self.assertEqual(events[-1], "q0 faithfulness")
+        self.assertEqual(len(events), 24)
+
+    def test_scoring_resume_keeps_only_rows_scored_for_the_current_dataset(self) -> None:
+        metric_rows = [
+            {"user_input": f"q{index}", "response": f"a{index}", "retrieved_contexts": [], "reference": "r"}
+            for index in range(3)
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            result_path = Path(tmp) / "qa.dify.ragas.results.json"
+            partial_path = run_ragas_eval.scoring_checkpoint_path(result_path)
+            run_ragas_eval.append_jsonl(
+                partial_path,
+                [
+                    {**metric_rows[0], "faithfulness": 0.7, "context_recall": 0.2, "sample_id": 1},
+                    {**metric_rows[1], "response": "old answer", "faithfulness": 0.1, "sample_id": 2},
+                ],
+            )
+            with partial_path.open("a", encoding="utf-8") as f:
+                f.write('{"sample_id": 3, "user_in')
+
+            checkpointed = run_ragas_eval.load_scored_rows(partial_path)
+
+        reuse = run_ragas_eval.reusable_scored_row
+        self.assertEqual(partial_path.name, "qa.dify.ragas.results.partial.jsonl")
+        self.assertEqual(sorted(checkpointed), [1, 2])
+        scored = reuse(checkpointed[1], metric_rows[0], ["faithfulness"])
+        self.assertEqual(scored["faithfulness"], 0.7)
+        self.assertNotIn("context_recall", scored)
+        self.assertIsNone(reuse(checkpointed[1], metric_rows[0], ["answer_relevancy"]))
+        self.assertIsNone(reuse(checkpointed[2], metric_rows[1], ["faithfulness"]))
+        self.assertIsNone(reuse(checkpointed.get(3), metric_rows[2], ["faithfulness"]))
+
+    def test_pipeline_scores_rows_while_collection_is_running(self) -> None:
+        metrics = [SimpleNamespace(name="faithfulness")]
+        collected: list[str] = []
+        scored_while_collecting: list[str] = []
+
+        def collect(emit):
+            rows = []
+            for index in range(5):
+                time.sleep(0.05)
+                row = {"user_input": f"q{index}"}
+                rows.append(row)
+                collected.append(row["user_input"])
+                emit(row)
+            return rows
+
+        async def score_metric(metric: SimpleNamespace, row: dict[str, object]) -> float:
+            if len(collected) < 5:
+                scored_while_collecting.append(str(row["user_input"]))
+            return 1.0
+
+        checkpoints: list[int] = []
+        pipeline = run_ragas_eval.CollectionPipeline(collect, max_queued=2).start()
+        results = run_ragas_eval.evaluate_with_score_cache(
+            pipeline.rows(), metrics, score_metric, 2, on_scored=lambda index, row: checkpoints.append(index)
+        )
+        dataset_rows = pipeline.close()
+
+        self.assertEqual([row["user_input"] for row in results], ["q0", "q1", "q2", "q3", "q4"])
+        self.assertEqual(checkpoints, [0, 1, 2, 3, 4])
+        self.assertEqual(len(dataset_rows), 5)
+        self.assertIn("q0", scored_while_collecting)
+
+    def test_pipeline_surfaces_collection_errors_to_scoring(self) -> None:
+        def collect(emit):
+            emit({"user_input": "q0"})
+            raise SystemExit("cannot connect to backend")
+
+        async def score_metric(metric: SimpleNamespace, row: dict[str, object]) -> float:
+            return 1.0
+
+        pipeline = run_ragas_eval.CollectionPipeline(collect).start()
+        with self.assertRaises(SystemExit):
+            run_ragas_eval.evaluate_with_score_cache(pipeline.rows(), [SimpleNamespace(name="faithfulness")], score_metric, 2)
+        self.assertIsNone(pipeline.close())
+
+
+class EmbeddingCoalescerTest(unittest.TestCase):
+    def test_concurrent_queries_share_requests_split_by_max_batch_size(self) -> None:
+        requested: list[list[str]] = []
+
+        async def create(input: list[str], model: str) -> SimpleNamespace:
+            requested.append(input)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[float(text[1:]), 1.0]) for text in input])
+
+        client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        embeddings = run_ragas_eval.OpenAICompatibleRagasEmbeddings(None, client, "emb", max_batch_size=4)
+
+        async def run() -> list[object]:
+            queries = [embeddings.aembed_query(f"t{index}") for index in range(6)]
+            return await asyncio.gather(*queries, embeddings.aembed_documents(["t7", "  ", "t1"]), embeddings.aembed_query(""))
+
+        results = asyncio.run(run())
+
+        self.assertEqual(requested, [["t0", "t1", "t2", "t3"], ["t4", "t5", "t7"]])
+        self.assertEqual(embeddings.requests, 2)
+        self.assertEqual(results[5], [5.0, 1.0])
+        self.assertEqual(results[6], [[7.0, 1.0], [0.0, 0.0], [1.0, 1.0]])
+        self.assertEqual(results[7], [0.0, 0.0])
+
+
+class JudgeUsageTest(unittest.TestCase):
+    def test_calls_are_attributed_to_the_metric_and_row_being_scored(self) -> None:
+        async def chat_create(**kwargs: object) -> SimpleNamespace:
+            return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10))
+
+        async def embed_create(input: list[str], model: str) -> SimpleNamespace:
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=[1.0]) for _ in input], usage=SimpleNamespace(prompt_tokens=3 * len(input))
+            )
+
+        usage = judge_usage.JudgeUsage()
+        chat = judge_usage.instrument_chat_client(SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=chat_create))), usage)
+        embeddings = run_ragas_eval.OpenAICompatibleRagasEmbeddings(
+            None, SimpleNamespace(embeddings=SimpleNamespace(create=embed_create)), "emb", usage=usage
+        )
+
+        async def job(metric: str, sample_id: int, texts: list[str], llm_calls: int) -> None:
+            with usage.job(metric, sample_id):
+                for _ in range(llm_calls):
+                    await chat.chat.completions.create(model="judge")
+                await embeddings.aembed_documents(texts)
+
+        async def run() -> None:
+            await asyncio.gather(job("answer_relevancy", 1, ["a", "b"], 1), job("answer_relevancy", 2, ["c"], 1), job("faithfulness", 1, [], 2))
+
+        asyncio.run(run())
+        summary = usage.summary(wall_seconds=2.0)
+
+        self.assertEqual(embeddings.requests, 1)
+        row = usage.row_columns(1)
+        self.assertEqual(
+            [row[column] for column in judge_usage.USAGE_COLUMNS[:4]],
+            [3, 300, 30, 6],
+        )
+        self.assertEqual(usage.row_columns(2)["judge_embedding_tokens"], 3)
+        self.assertEqual(summary["rows_scored"], 2)
+        self.assertEqual(summary["totals"]["embedding_tokens"], 9)
+        # Both rows shared one coalesced request, which counts as one call.
+        self.assertEqual(summary["totals"]["embedding_calls"], 1)
+        self.assertAlmostEqual(summary["tokens_per_second"], (400 + 40 + 9) / 2.0)
+        self.assertEqual(summary["metrics"]["answer_relevancy"]["llm_calls_per_row"], 1)
+        self.assertEqual(sorted(summary["slowest_metrics"]), ["answer_relevancy", "faithfulness"])
+        self.assertEqual(usage.row_columns(3)["judge_llm_calls"], 0)
+
+
+class JudgePoolTest(unittest.TestCase):
+    def test_calls_follow_weights_and_skip_endpoints_in_cooldown(self) -> None:
+        endpoints = judge_pool.parse_endpoints("|key-a|3, https://b.example.com/v1/|key-b", "https://a.example.com/v1")
+        pool = judge_pool.EndpointPool(endpoints, cooldown_seconds=60, rng=random.Random(7))
+
+        picks = [pool.choose().api_key for _ in range(400)]
+        for _ in range(judge_pool.FAILURES_BEFORE_COOLDOWN):
+            pool.record(endpoints[0], ok=False)
+        cooled = {pool.choose().api_key for _ in range(50)}
+        stats = pool.stats()
+
+        self.assertEqual([endpoint.base_url for endpoint in endpoints], ["https://a.example.com/v1", "https://b.example.com/v1"])
+        self.assertGreater(picks.count("key-a"), 2 * picks.count("key-b"))
+        self.assertEqual(cooled, {"key-b"})
+        self.assertEqual((stats[0]["calls"], stats[0]["errors"], stats[0]["cooldowns"]), (3, 3, 1))
+        with self.assertRaises(ValueError):
+            judge_pool.parse_endpoints("https://a.example.com/v1|key|0")
+
+    @unittest.skipUnless(httpx, "httpx is required for the pooled judge transport")
+    def test_pooled_transport_uses_the_environment_proxy_for_each_endpoint(self) -> None:
+        endpoints = judge_pool.parse_endpoints("https://a.example.com/v1|key-a, http://127.0.0.1:9/v1|key-b")
+        pool = judge_pool.EndpointPool(endpoints)
+        limits = httpx.Limits(max_connections=7)
+
+        with mock.patch.dict(os.environ, {"HTTPS_PROXY": "http://proxy.example:3128", "NO_PROXY": ""}):
+            transport = judge_pool.pooled_httpx_transport(pool, endpoints[0].base_url, False, limits)
+        transport.close()
+
+        self.assertEqual(set(transport.inner), {"http://proxy.example:3128", ""})
+        self.assertEqual(type(transport.inner["http://proxy.example:3128"]._pool).__name__, "HTTPProxy")
+        self.assertEqual(transport.inner[""]._pool._max_connections, 7)
+
+
+class SequentialSamplingTest(unittest.TestCase):
+    def test_order_is_seeded_and_keeps_length_strata_in_every_prefix(self) -> None:
+        rows = [{"reference": "x" * (1 if index % 2 else 100)} for index in range(40)]
+
+        order = sequential_sampling.stratified_order(rows, seed=7)
+
+        self.assertEqual(sorted(order), list(range(40)))
+        self.assertEqual(order, sequential_sampling.stratified_order(rows, seed=7))
+        self.assertNotEqual(order, sequential_sampling.stratified_order(rows, seed=8))
+        for prefix in (10, 20):
+            short = sum(1 for index in order[:prefix] if index % 2)
+            self.assertLessEqual(abs(short - prefix // 2), 1)
+
+    def test_scoring_stops_after_the_round_that_reaches_the_target_width(self) -> None:
+        metrics = [SimpleNamespace(name="faithfulness")]
+        config = sequential_sampling.SamplingConfig(target_ci_width=0.5, round_size=4, bootstrap_samples=200)
+        sampler = sequential_sampling.SequentialSampler(config, ["faithfulness"], lambda: 0)
+        fed: list[int] = []
+
+        def feed():
+            for index in range(20):
+                if not sampler.admit():
+                    return
+                fed.append(index)
+                yield {"user_input": f"q{index}"}
+
+        async def score_metric(metric: SimpleNamespace, row: dict[str, object]) -> float:
+            return 0.5 + (0.1 if int(str(row["user_input"])[1:]) % 2 else -0.1)
+
+        results = run_ragas_eval.evaluate_with_score_cache(
+            feed(), metrics, score_metric, 3, on_scored=lambda index, row: sampler.record(index, row)
+        )
+        report = sampler.finish()
+
+        self.assertEqual(fed, [0, 1, 2, 3])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(report["stop_reason"], "target_ci_width")
+        self.assertEqual([entry["rows"] for entry in report["rounds"]], [4])
+        self.assertLessEqual(report["achieved"]["faithfulness"]["ci_width"], 0.5)
+
+
+class ContextPackingTest(unittest.TestCase):
+    def test_near_duplicates_are_dropped_and_each_metric_gets_its_own_budget(self) -> None:
+        first = "退货政策：收到商品后七天内可申请无理由退货，运费由买家承担。"
+        contexts = [first, first.replace("。", "！") + " ", "保修期为一年。" * 3, "x" * 400]
+        config = context_packing.parse_context_budgets("60,faithfulness=10", run_ragas_eval.CONTEXT_METRICS)
+
+        packed = context_packing.pack_contexts(contexts, ["faithfulness", "context_recall"], config)
+        columns = packed.columns()
+
+        self.assertEqual(packed.duplicates_removed, 1)
+        self.assertEqual(packed.by_metric["context_recall"], [first, "保修期为一年。" * 3])
+        self.assertEqual(packed.by_metric["faithfulness"], [first[:10]])
+        self.assertEqual(columns["faithfulness_context_tokens"], 10)
+        self.assertEqual(columns["context_tokens"], sum(context_packing.estimate_tokens(text) for text in contexts))
+        with self.assertRaises(ValueError):
+            context_packing.parse_context_budgets("answer_relevancy=100", run_ragas_eval.CONTEXT_METRICS)
+
+
+@unittest.skipUnless(numpy, "numpy is required for the embedding store")
+class EmbeddingStoreTest(unittest.TestCase):
+    def test_only_texts_missing_from_the_store_are_embedded(self) -> None:
+        requested: list[list[str]] = []
+
+        def create(input: list[str], model: str) -> SimpleNamespace:
+            requested.append(input)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[len(text), 0.5]) for text in input])
+
+        client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        with tempfile.TemporaryDirectory() as tmp:
+            first = run_ragas_eval.OpenAICompatibleRagasEmbeddings(
+                client, None, "emb", store=embedding_store.EmbeddingStore(Path(tmp), "emb", lru_size=1)
+            )
+            self.assertEqual(first.embed_documents(["a", "bb", "a", " "]), [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5], [0.0, 0.0]])
+
+            # A second process sharing the directory reads the first one's vectors from the memmap.
+            reader = embedding_store.EmbeddingStore(Path(tmp), "emb")
+            second = run_ragas_eval.OpenAICompatibleRagasEmbeddings(client, None, "emb", store=reader)
+            self.assertEqual(second.embed_documents(["bb", "ccc"]), [[2.0, 0.5], [3.0, 0.5]])
+            self.assertEqual(first.embed_query("ccc"), [3.0, 0.5])
+            other_model = embedding_store.EmbeddingStore(Path(tmp), "other").get_many(["a"])
+
+        self.assertEqual(requested, [["a", "bb"], ["ccc"]])
+        self.assertEqual((reader.hits, reader.misses), (1, 1))
+        self.assertEqual(other_model, [None])
+
+    def test_vectors_left_by_a_crashed_writer_are_dropped(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = embedding_store.EmbeddingStore(Path(tmp), "emb")
+            store.put_many(["a"], [[1.0, 2.0]])
+            with store.vectors_path.open("ab") as handle:
+                handle.write(numpy.zeros(2, dtype=numpy.float32).tobytes())
+            store.put_many(["b"], [[3.0, 4.0]])
+
+            reopened = embedding_store.EmbeddingStore(Path(tmp), "emb")
+            self.assertEqual(reopened.get_many(["a", "b"]), [[1.0, 2.0], [3.0, 4.0]])
+
+
+@unittest.skipUnless(numpy, "numpy is required for the offline metrics")
+class OfflineMetricsTest(unittest.TestCase):
+    def test_scores_chinese_rows_and_feeds_the_comparison(self) -> None:
+        def dataset(response: str, contexts: list[str]) -> list[dict[str, object]]:
+            return [
+                {"sample_id": 1, "user_input": "退货期限？", "response": response, "reference": "七天内可以退货", "retrieved_contexts": contexts},
+                {"sample_id": 2, "user_input": "q2", "response": "", "reference": "r", "retrieved_contexts": [], "error": "timeout"},
+            ]
+
+        dify_rows, summary = offline_metrics.score_dataset(dataset("七天内可以退货", ["无关内容", "商品七天内可以退货"]), k=2)
+        zgi_rows, _ = offline_metrics.score_dataset(dataset("可以退货 in 7 days", []), k=2)
+
+        self.assertEqual([row["sample_id"] for row in dify_rows], [1])
+        self.assertEqual(dify_rows[0]["token_f1"], 1.0)
+        self.assertEqual(dify_rows[0]["rouge_l"], 1.0)
+        self.assertEqual(dify_rows[0]["context_hit_at_k"], 1.0)
+        self.assertEqual(summary["rows"], 2)
+        self.assertEqual(zgi_rows[0]["response_tokens"], 7)
+        self.assertAlmostEqual(zgi_rows[0]["token_f1"], 4 / 7)
+        self.assertEqual(zgi_rows[0]["context_reference_coverage"], 0.0)
+
+        metrics = compare_rag_eval.compared_metrics({1: dify_rows[0]}, {1: zgi_rows[0]}, offline_metrics.OFFLINE_METRICS)
+        comparison = compare_rag_eval.build_comparison_rows({1: dify_rows[0]}, {1: zgi_rows[0]}, 0.01, metrics)
+        self.assertEqual(metrics, offline_metrics.OFFLINE_METRICS)
+        self.assertEqual(comparison[0]["context_hit_at_k_winner"], "dify")
+
+
+class HTTPTransportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client_ports: list[int] = []
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                test.client_ports.append(self.client_address[1])
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                payload = json.loads(body)
+                if self.path == "/short":
+                    self.send_response(200)
+                    self.send_header("Content-Length", "100")
+                    self.end_headers()
+                    self.wfile.write(b"{}")
+                    self.close_connection = True
+                    return
+                if self.path == "/stream":
+                    data = b"".join(f"data: {json.dumps({'index': index})}\n\n".encode() for index in range(3))
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                else:
+                    data = gzip.compress(json.dumps({"echo": payload}).encode())
+                    self.send_response(200 if self.path == "/ok" else 503)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.transport = http_transport.HTTPTransport(compress_requests=True)
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_reuse_one_keep_alive_connection(self) -> None:
+        for index in range(3):
+            data = self.transport.post_json(f"{self.base_url}/ok", {"index": index}, timeout=5)
+            self.assertEqual(data, {"echo": {"index": index}})
+        with self.transport.stream("POST", f"{self.base_url}/stream", b"{}", timeout=5) as response:
+            lines = [line for line in response if line.strip()]
+        self.assertEqual(len(lines), 3)
+        self.transport.post_json(f"{self.base_url}/ok", {}, timeout=5)
+
+        self.assertEqual(len(set(self.client_ports)), 1)
+
+    def test_error_status_raises_with_decoded_body(self) -> None:
+        with self.assertRaises(http_transport.HTTPStatusError) as ctx:
+            self.transport.post_json(f"{self.base_url}/fail", {"index": 1}, timeout=5)
+
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertIn("echo", ctx.exception.body)
+
+    def test_truncated_body_raises_url_error(self) -> None:
+        with self.assertRaises(urllib.error.URLError):
+            self.transport.post_json(f"{self.base_url}/short", {}, timeout=5)
+        with self.assertRaises(urllib.error.URLError):
+            with self.transport.stream("POST", f"{self.base_url}/short", b"{}", timeout=5) as response:
+                response.read()
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_retry_after_accepts_seconds_and_http_dates(self) -> None:
+        self.assertEqual(http_transport.retry_after_seconds({"retry-after": "3"}), 3.0)
+        self.assertEqual(http_transport.retry_after_seconds({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0.0)
+        self.assertIsNone(http_transport.retry_after_seconds({}))
+
+    def test_429_halves_concurrency_and_blocks_until_retry_after(self) -> None:
+        limiter = http_transport.RateLimiter(max_concurrency=8)
+        limiter.acquire()
+        limiter.release(429, retry_after=2.0)
+
+        self.assertEqual(limiter.concurrency, 4)
+        self.assertGreater(limiter._reserve(), 1.5)
+
+    def test_retries_wait_for_retry_after_before_resending(self) -> None:
+        responses = [http_transport.HTTPStatusError(429, "slow down", {"retry-after": "4"}), {"ok": True}]
+
+        def send() -> dict[str, bool]:
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch.object(http_transport.time, "sleep") as sleep:
+            result = http_transport.call_with_retries(send, max_retries=2)
+
+        self.assertEqual(result, {"ok": True})
+        self.assertGreaterEqual(sleep.call_args[0][0], 4.0)
+
+
+class LoadTestTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.requests = 0
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                test.requests += 1
+                time.sleep(0.01)
+                status = 503 if payload["user_inputs"][0] == "fail" else 200
+                item = {"user_input": payload["user_inputs"][0], "response": "ok", "retrieval_ms": 4, "generation_ms": 6}
+                data = json.dumps({"data": {"data": [item]}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        def send(question: str) -> dict[str, float]:
+            items = run_ragas_eval.call_rag_evaluation_batch(base_url, "token", "kb", [question], 5, 0.3, "hybrid", "", max_retries=0)
+            return load_test_rag_eval.server_stages(items[0])
+
+        self.send = send
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_open_loop_reports_stage_percentiles_without_warmup(self) -> None:
+        samples = load_test_rag_eval.run_open_loop(self.send, ["q1", "fail"], qps=40, duration=0.5)
+        report = load_test_rag_eval.build_load_report(samples, warmup=0.1)
+
+        self.assertEqual(self.requests, 20)
+        self.assertEqual(report["warmup_requests"], 4)
+        self.assertEqual(report["requests"], 16)
+        self.assertEqual(report["error_rate"], 0.5)
+        self.assertEqual(report["error_counts"], {"HTTP 503": 8})
+        self.assertAlmostEqual(report["stages"]["retrieval"]["p99_seconds"], 0.004, delta=0.0001)
+        self.assertGreaterEqual(report["stages"]["total"]["p50_seconds"], 0.01)
+
+    def test_closed_loop_keeps_one_request_in_flight_per_user(self) -> None:
+        samples = load_test_rag_eval.run_closed_loop(self.send, ["q1"], users=2, duration=0.2)
+        report = load_test_rag_eval.build_load_report(samples, warmup=0.0)
+
+        self.assertEqual(report["errors"], 0)
+        self.assertEqual(report["requests"], self.requests)
+        self.assertLessEqual(report["throughput_rps"], 2 / 0.01)
+
+    def test_socket_errors_are_recorded_as_failed_samples(self) -> None:
+        def send(question: str) -> dict[str, float]:
+            raise TimeoutError("timed out") if question == "slow" else ConnectionResetError()
+
+        open_samples = load_test_rag_eval.run_open_loop(send, ["slow", "reset"], qps=40, duration=0.1)
+        closed_samples = load_test_rag_eval.run_closed_loop(send, ["slow"], users=2, duration=0.05)
+
+        self.assertEqual(len(open_samples), 4)
+        self.assertEqual(
+            load_test_rag_eval.build_load_report(open_samples, warmup=0.0)["error_counts"],
+            {"connection error: TimeoutError": 2, "connection error: ConnectionResetError": 2},
+        )
+        self.assertTrue(closed_samples)
+        self.assertFalse(any(sample.ok for sample in closed_samples))
+
+        def unexpected_shape(question: str) -> dict[str, float]:
+            return load_test_rag_eval.server_stages(None)
+
+        sample = load_test_rag_eval.timed_call(unexpected_shape, "q1", 0.0, time.perf_counter())
+        self.assertFalse(sample.ok)
+        self.assertTrue(sample.error.startswith("AttributeError"))
+
+    def test_histogram_percentiles_stay_within_relative_precision(self) -> None:
+        histogram = load_test_rag_eval.LatencyHistogram()
+        for millis in range(1, 1001):
+            histogram.record(millis / 1000)
+
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.5, delta=0.5 * 0.01)
+        self.assertAlmostEqual(histogram.percentile(0.999), 0.999, delta=0.999 * 0.01)
+        self.assertEqual(histogram.percentile(1.0), 1.0)
+
+
+class FakeServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        config = fake_rag_server.FakeServerConfig(
+            backend_latency=fake_rag_server.LatencyDistribution("uniform:0.001,0.003"),
+            dify_latency=fake_rag_server.LatencyDistribution("fixed:0.04"),
+            throttle_every=2,
+            throttle_burst=1,
+            retry_after=0.05,
+        )
+        self.server = fake_rag_server.FakeRAGServer(config).start()
+
+    def tearDown(self) -> None:
+        self.server.close()
+
+    def test_harness_runs_end_to_end_through_injected_429s(self) -> None:
+        base_url = f"{self.server.url}/console/api"
+        token = run_ragas_eval.login(base_url, "eval@example.com", "secret")
+        questions = [f"question-{index}" for index in range(5)]
+        with mock.patch.object(run_ragas_eval, "BACKEND_MAX_RETRIES", 2):
+            items = run_ragas_eval.call_rag_evaluation(base_url, token, "kb", questions, 3, 0.35, "hybrid", "", batch_size=1)
+        streamed = run_dify_eval.post_with_retries(
+            f"{self.server.url}/v1/chat-messages", {"query": "question-0", "response_mode": "streaming"}, "app-key", max_retries=2
+        )
+        embeddings = [
+            http_transport.post_json(f"{self.server.url}/v1/embeddings", {"input": ["same text"], "model": "emb"})["data"][0]["embedding"]
+            for _ in range(2)
+        ]
+
+        self.assertEqual(token, fake_rag_server.FAKE_ACCESS_TOKEN)
+        self.assertEqual([item["user_input"] for item in items], questions)
+        self.assertEqual(items[0]["response"], streamed["answer"])
+        self.assertGreater(streamed["stream_timing"]["stream_chunks"], 1)
+        self.assertGreaterEqual(streamed["stream_timing"]["ttft_seconds"], 0.01)
+        self.assertEqual(embeddings[0], embeddings[1])
+        self.assertEqual(self.server.stats()["zgi"], {"200": 5, "429": 2})
+
+    def test_structured_judge_calls_get_schema_shaped_arguments(self) -> None:
+        schema = {
+            "properties": {"statements": {"type": "array", "items": {"$ref": "#/$defs/Verdict"}}},
+            "$defs": {"Verdict": {"properties": {"statement": {"type": "string"}, "verdict": {"type": "integer"}}}},
+        }
+        payload = {"messages": [{"role": "user", "content": "judge this"}], "tools": [{"type": "function", "function": {"name": "Out", "parameters": schema}}]}
+
+        message = fake_rag_server.chat_completion(payload)["choices"][0]["message"]
+        arguments = json.loads(message["tool_calls"][0]["function"]["arguments"])
+
+        self.assertEqual(sorted(arguments["statements"][0]), ["statement", "verdict"])
+        self.assertIn(arguments["statements"][0]["verdict"], {0, 1})
+        with self.assertRaises(ValueError):
+            fake_rag_server.LatencyDistribution("normal:1")
+
+
+class JudgeBenchmarkTest(unittest.TestCase):
+    def test_streaming_benchmark_excludes_warmup_and_reports_ttft(self) -> None:
+        calls: list[dict[str, object]] = []
+
+        def create(**request: object) -> list[SimpleNamespace]:
+            calls.append(request)
+            if len(calls) == 4:
+                raise RuntimeError("upstream reset")
+            delta = lambda text: SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+            usage = SimpleNamespace(prompt_tokens=7, completion_tokens=2, total_tokens=9)
+            return [delta(""), delta("ok"), delta("!"), SimpleNamespace(choices=[], usage=usage)]
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        summary = test_llm_latency.run_benchmark(client, {"model": "judge"}, True, warmup=2, repeat=5, concurrency=1, error_types=(RuntimeError,))
+
+        self.assertEqual(len(calls), 7)
+        self.assertTrue(calls[0]["stream"])
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["latency_seconds"]["count"], 4)
+        self.assertEqual(summary["ttft_seconds"]["count"], 4)
+        self.assertEqual(summary["completion_tokens"]["p50"], 2)
+        self.assertNotIn("content", summary["calls"][0])
+
 
 def result_row(sample_id: int, score: float) -> dict[str, object]:
     row: dict[str, object] = {
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
-"""Send one prompt to the Ragas judge LLM and print latency."""
+"""Send a prompt to the Ragas judge LLM and print latency, or benchmark it with repeated calls."""
 
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
@@ -14,6 +16,7 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 ENV_FILE = SCRIPT_DIR / ".env"
 DEFAULT_ALIYUN_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 DEFAULT_ALIYUN_LLM_MODEL = "qwen-plus"
+BENCHMARK_QUANTILES = {"p50": 0.50, "p90": 0.90, "p95": 0.95, "p99": 0.99}
 
 
 def main() -> int:
@@ -48,7 +51,7 @@ def main() -> int:
         raise SystemExit("LLM model is required. Set RAGAS_LLM_MODEL in .env or pass --model.")
 
     try:
-        from openai import OpenAI
+        from openai import APIError, OpenAI
     except ImportError as exc:
         raise SystemExit("openai is required. Install it with: pip install openai") from exc
 
@@ -56,28 +59,37 @@ def main() -> int:
     extra_body: dict[str, Any] | None = None
     if provider == "aliyun" and enable_thinking is not None:
         extra_body = {"enable_thinking": enable_thinking}
-
-    print(f"calling LLM: provider={provider}, model={model}, enable_thinking={enable_thinking}", flush=True)
-    started = time.perf_counter()
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    request = {
+        "model": model,
+        "messages": [
             {"role": "system", "content": "You are a concise assistant."},
             {"role": "user", "content": prompt},
         ],
-        temperature=args.temperature,
-        max_tokens=args.max_tokens,
-        extra_body=extra_body,
-    )
-    elapsed = time.perf_counter() - started
+        "temperature": args.temperature,
+        "max_tokens": args.max_tokens,
+        "extra_body": extra_body,
+    }
 
-    content = response.choices[0].message.content or ""
+    print(f"calling LLM: provider={provider}, model={model}, enable_thinking={enable_thinking}, stream={args.stream}", flush=True)
+    if args.benchmark:
+        summary = run_benchmark(client, request, args.stream, args.warmup, args.repeat, args.concurrency, error_types=(APIError,))
+        summary.update({"provider": provider, "base_url": base_url, "model": model, "enable_thinking": enable_thinking})
+        print_benchmark(summary)
+        if args.output:
+            output_path = Path(args.output).expanduser().resolve()
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"saved benchmark: {output_path}")
+        return 0
+
+    call = call_llm(client, request, args.stream)
     print("\nResponse:")
-    print(content)
-    print(f"\nLatency: {elapsed:.3f}s")
-    usage = getattr(response, "usage", None)
-    if usage:
-        print(f"Usage: prompt_tokens={usage.prompt_tokens}, completion_tokens={usage.completion_tokens}, total_tokens={usage.total_tokens}")
+    print(call["content"])
+    print(f"\nLatency: {call['latency_seconds']:.3f}s")
+    if call["ttft_seconds"] is not None:
+        print(f"Time to first token: {call['ttft_seconds']:.3f}s")
+    if call["total_tokens"] is not None:
+        print(f"Usage: prompt_tokens={call['prompt_tokens']}, completion_tokens={call['completion_tokens']}, total_tokens={call['total_tokens']}")
     return 0
 
 
@@ -92,7 +104,127 @@ def parse_args(env_values: dict[str, str]) -> argparse.Namespace:
     parser.add_argument("--temperature", type=float, default=0.0)
     parser.add_argument("--max-tokens", type=int, default=1024)
     parser.add_argument("--timeout", type=float, default=300.0)
-    return parser.parse_args()
+    parser.add_argument("--stream", action="store_true", help="Stream the response and measure time to first token and output tokens/s.")
+    parser.add_argument("--benchmark", action="store_true", help="Send the prompt repeatedly and report latency percentiles instead of printing one answer.")
+    parser.add_argument("--warmup", type=int, default=2, help="Benchmark calls sent first and excluded from the statistics. Default: %(default)s")
+    parser.add_argument("--repeat", type=int, default=20, help="Measured benchmark calls. Default: %(default)s")
+    parser.add_argument("--concurrency", type=int, default=1, help="Benchmark calls in flight at once. Default: %(default)s")
+    parser.add_argument("--output", default="", help="Write the benchmark summary JSON to this path.")
+    args = parser.parse_args()
+    if args.warmup < 0 or args.repeat < 1 or args.concurrency < 1:
+        raise SystemExit("--warmup must be >= 0, --repeat and --concurrency must be >= 1")
+    return args
+
+
+def call_llm(client: Any, request: dict[str, Any], stream: bool) -> dict[str, Any]:
+    started = time.perf_counter()
+    ttft: float | None = None
+    usage: Any = None
+    if stream:
+        parts: list[str] = []
+        chunks = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+        for chunk in chunks:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            for choice in getattr(chunk, "choices", None) or []:
+                text = getattr(choice.delta, "content", None) or ""
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    parts.append(text)
+        content = "".join(parts)
+    else:
+        response = client.chat.completions.create(**request)
+        content = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+    latency = time.perf_counter() - started
+
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    # Decode speed excludes the time spent waiting for the first token when it is known.
+    decode_seconds = latency - (ttft or 0.0)
+    return {
+        "latency_seconds": latency,
+        "ttft_seconds": ttft,
+        "output_tokens_per_second": completion_tokens / decode_seconds if completion_tokens and decode_seconds > 0 else None,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": completion_tokens,
+        "total_tokens": getattr(usage, "total_tokens", None),
+        "content": content,
+    }
+
+
+def run_benchmark(
+    client: Any,
+    request: dict[str, Any],
+    stream: bool,
+    warmup: int,
+    repeat: int,
+    concurrency: int,
+    error_types: tuple[type[BaseException], ...] = (Exception,),
+) -> dict[str, Any]:
+    def timed(index: int) -> dict[str, Any]:
+        try:
+            call = call_llm(client, request, stream)
+        except error_types as exc:
+            return {"index": index, "error": f"{type(exc).__name__}: {exc}"}
+        call.pop("content")
+        return {"index": index, **call}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(warmup)))
+        started = time.perf_counter()
+        calls = list(executor.map(timed, range(repeat)))
+        wall_seconds = time.perf_counter() - started
+
+    succeeded = [call for call in calls if "error" not in call]
+    return {
+        "stream": stream,
+        "warmup": warmup,
+        "repeat": repeat,
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "requests_per_second": len(succeeded) / wall_seconds if wall_seconds > 0 else None,
+        "errors": len(calls) - len(succeeded),
+        **{
+            key: summarize_values([call[key] for call in succeeded if call.get(key) is not None])
+            for key in ["latency_seconds", "ttft_seconds", "output_tokens_per_second", "completion_tokens"]
+        },
+        "calls": calls,
+    }
+
+
+def summarize_values(values: list[float]) -> dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": min(values),
+        "max": max(values),
+        **{name: percentile(values, quantile) for name, quantile in BENCHMARK_QUANTILES.items()},
+    }
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    # Linear interpolation between closest ranks, matching compare_rag_eval without importing the evaluator.
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * quantile
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def print_benchmark(summary: dict[str, Any]) -> None:
+    print(
+        f"\nBenchmark: {summary['repeat']} calls after {summary['warmup']} warm-up, concurrency={summary['concurrency']}, "
+        f"errors={summary['errors']}, wall={summary['wall_seconds']:.3f}s"
+    )
+    for key in ["latency_seconds", "ttft_seconds", "output_tokens_per_second"]:
+        stats = summary[key]
+        if not stats["count"]:
+            continue
+        quantiles = ", ".join(f"{name}={stats[name]:.3f}" for name in BENCHMARK_QUANTILES)
+        print(f"  {key}: mean={stats['mean']:.3f}, {quantiles}, max={stats['max']:.3f}")
 
 
 def load_env_file(path: Path) -> dict[str, str]: